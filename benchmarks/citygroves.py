@@ -0,0 +1,243 @@
+"""
+Measures reload latency on the citygroves Django project, from saving a file to the first HTTP response reflecting it.
+
+The project is copied to a temporary directory together with its sqlite database, so nothing is changed in the
+repository and no network services are needed. A probe view reporting a revision string from views.py,
+serializers.py, models.py and settings.py is added to the copy, every edit bumps one revision and the probe is
+polled until the new revision is served. Process id of the server tells partial and full reloads apart.
+Cold start of `manage.py runserver` with and without smart reloader is reported as the full restart cost.
+
+Usage: python -m benchmarks.citygroves [--samples 5] [--port 8123] [--timeout 60] [--output results.json]
+"""
+import argparse
+import json
+import os
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from subprocess import Popen
+from time import perf_counter, sleep
+from typing import Any, Callable, Dict, List, Optional
+from urllib.error import URLError
+from urllib.request import urlopen
+
+from smartreloader.metrics import percentile
+
+PROJECT_DIR = Path(__file__).absolute().parent.parent / "tests" / "projects" / "citygroves"
+
+PROBE_PATH = "/api/bench-probe/"
+
+EDITED_FILES = ["tenants/views.py", "tenants/serializers.py", "tenants/models.py", "backend/settings.py"]
+
+VIEWS_PROBE = '''
+
+import os as _bench_os
+
+from django.http import JsonResponse
+
+
+def bench_revision():
+    return "tenants/views.py 0"
+
+
+def bench_probe(request):
+    return JsonResponse({
+        "pid": _bench_os.getpid(),
+        "tenants/views.py": bench_revision(),
+        "tenants/serializers.py": serializers.BenchSerializer({}).data["revision"],
+        "tenants/models.py": models.Person.bench_revision(),
+        "backend/settings.py": settings.BENCH_REVISION,
+    })
+'''
+
+SERIALIZERS_PROBE = '''
+
+class BenchSerializer(serializers.Serializer):
+    revision = serializers.SerializerMethodField()
+
+    def get_revision(self, obj):
+        return "tenants/serializers.py 0"
+'''
+
+MODELS_ANCHOR = "    phone = models.CharField(max_length=31, null=True, blank=True)\n"
+
+MODELS_PROBE = '''
+    @classmethod
+    def bench_revision(cls):
+        return "tenants/models.py 0"
+'''
+
+SETTINGS_PROBE = '''
+BENCH_REVISION = "backend/settings.py 0"
+'''
+
+URLS_ANCHOR = "urlpatterns = [\n"
+
+URLS_PROBE = '''    path("bench-probe/", views.bench_probe),
+'''
+
+
+def add_probe(project: Path) -> None:
+    def append(file: str, source: str) -> None:
+        path = project / file
+        path.write_text(path.read_text() + source)
+
+    def insert_after(file: str, anchor: str, source: str) -> None:
+        path = project / file
+        content = path.read_text()
+        assert anchor in content, f"{anchor!r} not found in {file}"
+        path.write_text(content.replace(anchor, anchor + source, 1))
+
+    append("tenants/views.py", VIEWS_PROBE)
+    append("tenants/serializers.py", SERIALIZERS_PROBE)
+    insert_after("tenants/models.py", MODELS_ANCHOR, MODELS_PROBE)
+    append("backend/settings.py", SETTINGS_PROBE)
+    # tenants urls are included under api/
+    insert_after("tenants/urls.py", URLS_ANCHOR, URLS_PROBE)
+
+
+def get_probe(port: int) -> Optional[Dict[str, Any]]:
+    try:
+        with urlopen(f"http://127.0.0.1:{port}{PROBE_PATH}", timeout=5) as response:
+            return json.loads(response.read().decode())
+    except (URLError, ConnectionError, ValueError):
+        return None
+
+
+def wait_for(port: int, condition: Callable[[Dict[str, Any]], bool], timeout: float) -> Dict[str, Any]:
+    deadline = perf_counter() + timeout
+    while perf_counter() < deadline:
+        probe = get_probe(port)
+        if probe is not None and condition(probe):
+            return probe
+        sleep(0.005)
+
+    raise TimeoutError(f"Probe did not reflect the change within {timeout}s")
+
+
+def start_server(project: Path, port: int, with_reloader: bool) -> Popen:
+    command = ["manage.py", "runserver", "--noreload", f"127.0.0.1:{port}"]
+    if with_reloader:
+        command = ["-m", "smartreloader.entrypoint"] + command
+
+    env = dict(os.environ)
+    package_root = str(Path(__file__).absolute().parent.parent)
+    env["PYTHONPATH"] = os.pathsep.join(p for p in [package_root, env.get("PYTHONPATH")] if p)
+    # the entrypoint restarts the server with "python" found on PATH
+    env["PATH"] = os.pathsep.join([str(Path(sys.executable).parent), env.get("PATH", "")])
+
+    ret = Popen([sys.executable] + command, cwd=str(project), env=env, start_new_session=True,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return ret
+
+
+def stop_server(process: Popen) -> None:
+    # the entrypoint runs the server in a child process, so the whole group is stopped
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+    except ProcessLookupError:
+        pass
+
+
+def measure_cold_start(project: Path, port: int, with_reloader: bool, timeout: float) -> float:
+    started = perf_counter()
+    process = start_server(project, port, with_reloader)
+    try:
+        wait_for(port, lambda p: True, timeout)
+        ret = perf_counter() - started
+    finally:
+        stop_server(process)
+    return ret
+
+
+def run_edits(project: Path, port: int, samples: int, timeout: float) -> Dict[str, Dict[str, Any]]:
+    process = start_server(project, port, with_reloader=True)
+    try:
+        probe = wait_for(port, lambda p: True, timeout)
+        # let the file watcher settle after start
+        sleep(1.0)
+
+        latencies: Dict[str, List[float]] = {f: [] for f in EDITED_FILES}
+        full_reloads: Dict[str, int] = {f: 0 for f in EDITED_FILES}
+
+        for i in range(1, samples + 1):
+            for file in EDITED_FILES:
+                path = project / file
+                expected = f"{file} {i}"
+                content = path.read_text()
+                assert f'"{file} {i - 1}"' in content
+
+                pid = probe["pid"]
+                started = perf_counter()
+                path.write_text(content.replace(f'"{file} {i - 1}"', f'"{expected}"'))
+                probe = wait_for(port, lambda p: p[file] == expected, timeout)
+                latencies[file].append(perf_counter() - started)
+
+                if probe["pid"] != pid:
+                    full_reloads[file] += 1
+                    # file watcher of the restarted process has to be ready before the next edit
+                    sleep(1.0)
+    finally:
+        stop_server(process)
+
+    ret = {
+        f: {
+            "p50_s": statistics.median(latencies[f]),
+            "p95_s": percentile(latencies[f], 95),
+            "max_s": max(latencies[f]),
+            "full_reloads": full_reloads[f],
+        }
+        for f in EDITED_FILES
+    }
+    return ret
+
+
+def run(samples: int, port: int, timeout: float) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as tmp:
+        project = Path(tmp) / PROJECT_DIR.name
+        shutil.copytree(str(PROJECT_DIR), str(project), ignore=shutil.ignore_patterns("__pycache__"))
+        add_probe(project)
+
+        cold_start_plain = [measure_cold_start(project, port, False, timeout) for _ in range(3)]
+        cold_start_reloader = [measure_cold_start(project, port, True, timeout) for _ in range(3)]
+
+        edits = run_edits(project, port, samples, timeout)
+
+    ret = {
+        "samples": samples,
+        "python": sys.version.split()[0],
+        # restarting the server is what a full reload costs at least
+        "cold_start_plain_s": min(cold_start_plain),
+        "cold_start_reloader_s": min(cold_start_reloader),
+        "edits": edits,
+    }
+    return ret
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=5, help="Edits per file")
+    parser.add_argument("--port", type=int, default=8123)
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds to wait for a change to be served")
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    results = run(args.samples, args.port, args.timeout)
+    content = json.dumps(results, indent=4)
+
+    if args.output:
+        args.output.write_text(content)
+
+    sys.stdout.write(content + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Synthetic project generator shared by benchmarks.
+"""
+import os
+import sys
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, List
+
+from tests.utils import Module
+
+PACKAGE_NAME = "sandbox"
+
+
+@dataclass
+class ProjectParams:
+    modules: int = 20
+    # functions and classes per module (each)
+    members: int = 10
+    # number of modules importing each module
+    importers: int = 3
+    star_imports: bool = False
+    # entries of module level dict and list
+    data_size: int = 100
+
+
+def module_source(i: int, params: ProjectParams) -> str:
+    lines = []
+
+    dependencies = range(max(0, i - params.importers), i)
+    for j in dependencies:
+        lines.append(f"from . import mod_{j}")
+        lines.append(f"from .mod_{j} import VALUE_{j}")
+
+    if params.star_imports and i > 0:
+        lines.append(f"from .mod_{i - 1} import *")
+
+    lines.append("")
+    lines.append(f"VALUE_{i} = 0")
+    derived = " + ".join([f"VALUE_{j}" for j in dependencies] or ["0"])
+    lines.append(f"DERIVED_{i} = {derived} + 1")
+    lines.append("")
+
+    data = ", ".join(f'"key_{k}": {k}' for k in range(params.data_size))
+    lines.append(f"DATA_{i} = {{{data}}}")
+    lines.append(f"ITEMS_{i} = [{', '.join(str(k) for k in range(params.data_size))}]")
+    lines.append("")
+
+    # edited by benchmarks
+    lines.append("def edited():")
+    lines.append("    return 'revision 0'")
+    lines.append("")
+
+    for m in range(params.members):
+        lines.append(f"def func_{i}_{m}(x):")
+        lines.append(f"    return x + {m}")
+        lines.append("")
+        lines.append(f"class Class_{i}_{m}:")
+        lines.append(f"    attr = {m}")
+        lines.append("")
+        lines.append("    def method(self, x):")
+        lines.append(f"        return x * {m}")
+        lines.append("")
+
+    ret = "\n".join(lines) + "\n"
+    return ret
+
+
+def generate_project(params: ProjectParams) -> List[Module]:
+    """
+    Writes package modules to the current directory, which has to be the package directory.
+    Module i imports the previous `importers` modules, so mod_0 has the most importers and the last module has none.
+    """
+    ret = []
+    for i in range(params.modules):
+        ret.append(Module(f"mod_{i}.py", module_source(i, params)))
+
+    init_source = "\n".join(f"from . import mod_{i}" for i in range(params.modules)) + "\n"
+    ret.append(Module("__init__.py", init_source))
+
+    return ret
+
+
+@contextmanager
+def project_dir(root: Path) -> Iterator[Path]:
+    """
+    Creates package directory under root, makes it importable and changes into it.
+    """
+    package_dir = root / PACKAGE_NAME
+    package_dir.mkdir(parents=True, exist_ok=True)
+
+    cwd = os.getcwd()
+    sys.path.insert(0, str(root))
+    os.chdir(str(package_dir))
+    try:
+        yield package_dir
+    finally:
+        os.chdir(cwd)
+        sys.path.remove(str(root))
@@ -0,0 +1,174 @@
+"""
+Measures how reloading scales with project size on synthetic projects.
+
+Every configuration runs in a fresh process. Results are written as a json list, one entry per configuration.
+
+Usage: python -m benchmarks.scaling [--modules 10,25,50] [--members 10] [--importers 3] [--star-imports]
+                                    [--data-size 100] [--samples 10] [--output results.json]
+"""
+import argparse
+import gc
+import importlib
+import json
+import logging
+import multiprocessing
+import statistics
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from dataclasses import asdict
+from pathlib import Path
+from textwrap import dedent
+from time import perf_counter
+from typing import Any, Dict, List
+
+from benchmarks.project import PACKAGE_NAME, ProjectParams, generate_project, project_dir
+from smartreloader.metrics import percentile
+
+logger = logging.getLogger("benchmarks")
+
+
+def measure_cold_start(root: Path, with_reloader: bool) -> float:
+    """
+    Imports the whole project in a fresh interpreter, with or without partial reloader installed.
+    """
+    setup = ""
+    if with_reloader:
+        setup = dedent(f"""
+        import logging
+        from smartreloader import BaseConfig, PartialReloader
+        PartialReloader(Path({str(root / PACKAGE_NAME)!r}), logging.getLogger(), BaseConfig())
+        """)
+
+    script = dedent("""
+    import sys
+    from pathlib import Path
+    from time import perf_counter
+    started = perf_counter()
+    """) + setup + dedent(f"""
+    import {PACKAGE_NAME}
+    print(perf_counter() - started)
+    """)
+
+    package_root = str(Path(__file__).absolute().parent.parent)
+    output = subprocess.check_output([sys.executable, "-c", script], cwd=str(root),
+                                     env={"PYTHONPATH": f"{root}:{package_root}"})
+    ret = float(output.decode().strip().splitlines()[-1])
+    return ret
+
+
+def run_one(params: ProjectParams, samples: int) -> Dict[str, Any]:
+    from smartreloader import BaseConfig, PartialReloader
+
+    with tempfile.TemporaryDirectory() as tmp, project_dir(Path(tmp)) as package_dir:
+        modules = generate_project(params)
+
+        cold_start_plain = min(measure_cold_start(Path(tmp), False) for _ in range(3))
+        cold_start_reloader = min(measure_cold_start(Path(tmp), True) for _ in range(3))
+
+        reloader = PartialReloader(package_dir, logger, BaseConfig())
+        importlib.import_module(PACKAGE_NAME)
+
+        descriptors = [d for ds in reloader.modules.user_modules.values() for d in ds]
+        objects_n = sum(len(d.module_obj.flat) for d in descriptors if d.module_obj)
+
+        # memory of object trees, built again for all modules while tracing
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        trees = []
+        for d in descriptors:
+            d.post_execute()
+            trees.append(d.module_obj)
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        tree_bytes = sum(s.size_diff for s in after.compare_to(before, "filename"))
+        del trees
+
+        leaf = modules[params.modules - 1]
+        root_module = modules[0]
+
+        reload_times = []
+        cascade_times = []
+        cascade_actions = 0
+        rollback_times = []
+
+        for i in range(1, samples + 1):
+            leaf.replace(f"'revision {i - 1}'", f"'revision {i}'")
+            started = perf_counter()
+            reloader.reload(leaf.path)
+            reload_times.append(perf_counter() - started)
+
+            root_module.replace("VALUE_0 = 0\n", "VALUE_0 = 1\n")
+            started = perf_counter()
+            reloader.reload(root_module.path)
+            cascade_times.append(perf_counter() - started)
+            cascade_actions = len(reloader.applied_actions)
+
+            started = perf_counter()
+            reloader.rollback()
+            rollback_times.append(perf_counter() - started)
+
+            # bring source and module descriptors back in sync with the rolled back state
+            root_module.replace("VALUE_0 = 1\n", "VALUE_0 = 0\n")
+            reloader.reload(root_module.path)
+
+        ret = {
+            "params": asdict(params),
+            "samples": samples,
+            "python": sys.version.split()[0],
+            "objects": objects_n,
+            "cold_start_plain_s": cold_start_plain,
+            "cold_start_reloader_s": cold_start_reloader,
+            "cold_start_overhead_s": cold_start_reloader - cold_start_plain,
+            "reload_p50_s": statistics.median(reload_times),
+            "reload_p95_s": percentile(reload_times, 95),
+            "cascade_p50_s": statistics.median(cascade_times),
+            "cascade_p95_s": percentile(cascade_times, 95),
+            "cascade_actions": cascade_actions,
+            "rollback_p50_s": statistics.median(rollback_times),
+            "object_trees_bytes": tree_bytes,
+            "bytes_per_object": tree_bytes / objects_n if objects_n else None,
+        }
+        return ret
+
+
+def run(params_list: List[ProjectParams], samples: int) -> List[Dict[str, Any]]:
+    context = multiprocessing.get_context("spawn")
+
+    ret = []
+    for params in params_list:
+        # sys.modules is replaced by the reloader, so every configuration gets a fresh process
+        with context.Pool(1) as pool:
+            ret.append(pool.apply(run_one, (params, samples)))
+
+    return ret
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", type=str, default="10,25,50", help="Comma separated list of module counts")
+    parser.add_argument("--members", type=int, default=10)
+    parser.add_argument("--importers", type=int, default=3)
+    parser.add_argument("--star-imports", action="store_true")
+    parser.add_argument("--data-size", type=int, default=100)
+    parser.add_argument("--samples", type=int, default=10)
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    params_list = [ProjectParams(modules=int(m), members=args.members, importers=args.importers,
+                                 star_imports=args.star_imports, data_size=args.data_size)
+                   for m in args.modules.split(",")]
+
+    results = run(params_list, args.samples)
+    content = json.dumps(results, indent=4)
+
+    if args.output:
+        args.output.write_text(content)
+
+    sys.stdout.write(content + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Long session memory benchmark. Reloads modules of a synthetic project thousands of times and tracks memory.
+
+Every reload edits a leaf module, every tenth one also the most imported module so dependent modules get reloaded too.
+RSS, memory traced by tracemalloc and the number of live reloader Objects are sampled periodically.
+Runs with and without committing reloads (see PartialReloader.commit), each in a fresh process.
+
+Usage: python -m benchmarks.soak [--reloads 2000] [--sample-every 100] [--modules 10] [--output results.json]
+"""
+import argparse
+import gc
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import tracemalloc
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, Dict, List
+
+from benchmarks.project import PACKAGE_NAME, ProjectParams, generate_project, project_dir
+
+logger = logging.getLogger("benchmarks")
+
+
+def get_rss() -> int:
+    """
+    Current resident set size in bytes, peak RSS where /proc is not available.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # kilobytes on linux, bytes on macOS
+        ret = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return ret if sys.platform == "darwin" else ret * 1024
+
+
+def count_objects() -> int:
+    from smartreloader.objects import Object
+
+    ret = sum(1 for o in gc.get_objects() if isinstance(o, Object))
+    return ret
+
+
+def run_one(params: ProjectParams, reloads: int, sample_every: int, commit: bool) -> Dict[str, Any]:
+    from smartreloader import BaseConfig, PartialReloader
+
+    with tempfile.TemporaryDirectory() as tmp, project_dir(Path(tmp)) as package_dir:
+        modules = generate_project(params)
+
+        reloader = PartialReloader(package_dir, logger, BaseConfig())
+        importlib.import_module(PACKAGE_NAME)
+
+        leaf = modules[params.modules - 1]
+        root_module = modules[0]
+
+        def sample(i: int) -> Dict[str, Any]:
+            gc.collect()
+            ret = {
+                "reloads": i,
+                "rss_bytes": get_rss(),
+                "traced_bytes": tracemalloc.get_traced_memory()[0],
+                "objects": count_objects(),
+            }
+            return ret
+
+        tracemalloc.start()
+        samples = [sample(0)]
+
+        for i in range(1, reloads + 1):
+            leaf.replace(f"'revision {i - 1}'", f"'revision {i}'")
+            reloader.reload(leaf.path)
+            if commit:
+                reloader.commit()
+
+            if i % 10 == 0:
+                root_module.replace(f"VALUE_0 = {i // 10 - 1}\n", f"VALUE_0 = {i // 10}\n")
+                reloader.reload(root_module.path)
+                if commit:
+                    reloader.commit()
+
+            if i % sample_every == 0:
+                samples.append(sample(i))
+
+        tracemalloc.stop()
+
+        first, last = samples[1] if len(samples) > 1 else samples[0], samples[-1]
+        # growth after the first sample, which already includes caches warmed by the first reloads
+        reloads_measured = max(1, last["reloads"] - first["reloads"])
+
+        ret = {
+            "params": asdict(params),
+            "commit": commit,
+            "reloads": reloads,
+            "python": sys.version.split()[0],
+            "rss_growth_per_1000_reloads_bytes": (last["rss_bytes"] - first["rss_bytes"]) * 1000 / reloads_measured,
+            "traced_growth_per_1000_reloads_bytes": ((last["traced_bytes"] - first["traced_bytes"]) * 1000
+                                                     / reloads_measured),
+            "objects_start": samples[0]["objects"],
+            "objects_end": last["objects"],
+            "samples": samples,
+        }
+        return ret
+
+
+def run(params: ProjectParams, reloads: int, sample_every: int) -> List[Dict[str, Any]]:
+    context = multiprocessing.get_context("spawn")
+
+    ret = []
+    for commit in (False, True):
+        # sys.modules is replaced by the reloader, so every run gets a fresh process
+        with context.Pool(1) as pool:
+            ret.append(pool.apply(run_one, (params, reloads, sample_every, commit)))
+
+    return ret
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reloads", type=int, default=2000)
+    parser.add_argument("--sample-every", type=int, default=100)
+    parser.add_argument("--modules", type=int, default=10)
+    parser.add_argument("--members", type=int, default=10)
+    parser.add_argument("--data-size", type=int, default=20)
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    params = ProjectParams(modules=args.modules, members=args.members, data_size=args.data_size)
+
+    results = run(params, args.reloads, args.sample_every)
+    content = json.dumps(results, indent=4)
+
+    if args.output:
+        args.output.write_text(content)
+
+    sys.stdout.write(content + "\n")
+
+
+if __name__ == "__main__":
+    main()
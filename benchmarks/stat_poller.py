@@ -0,0 +1,116 @@
+"""
+Measures the polling backend on a synthetic tree.
+
+Usage: python -m benchmarks.stat_poller [--files 50000] [--output results.json]
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from time import monotonic, process_time, sleep
+from typing import Any, Dict
+
+from smartreloader.config import BaseConfig
+from smartreloader.stat_poller import StatPoller
+
+
+def create_tree(root: Path, files_n: int, files_per_dir: int = 100) -> None:
+    for i in range(files_n):
+        directory = root / f"pkg_{i // files_per_dir // 10}" / f"sub_{i // files_per_dir}"
+        if i % files_per_dir == 0:
+            directory.mkdir(parents=True, exist_ok=True)
+        # mix of sources and other project files
+        suffix = ".py" if i % 3 else ".json"
+        (directory / f"file_{i}{suffix}").write_text(f"value = {i}\n")
+
+
+def run(files_n: int, interval: float, batch_size: int, latency_samples: int) -> Dict[str, Any]:
+    config = BaseConfig()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        create_tree(root, files_n)
+
+        detected = {}
+        lock = threading.Lock()
+
+        def on_event(event) -> None:
+            with lock:
+                detected.setdefault(event.src_path, monotonic())
+
+        def matches(path: str) -> bool:
+            return Path(path).suffix == ".py"
+
+        poller = StatPoller(root, ignored_paths=config.ignored_paths, matches=matches, on_event=on_event,
+                            interval=interval, batch_size=batch_size)
+
+        wall_started, cpu_started = monotonic(), process_time()
+        poller.seed()
+        seed_wall, seed_cpu = monotonic() - wall_started, process_time() - cpu_started
+
+        # full rescans without the pacing sleeps (poller not started yet)
+        scan_cpu = []
+        for _ in range(5):
+            cpu_started = process_time()
+            poller.scan()
+            scan_cpu.append(process_time() - cpu_started)
+
+        poller.start()
+        py_files = [p for p in root.glob("**/*.py")]
+        latencies = []
+
+        for _ in range(latency_samples):
+            path = random.choice(py_files)
+            with lock:
+                detected.clear()
+            modified_at = monotonic()
+            path.write_text(path.read_text() + "# changed\n")
+
+            while str(path) not in detected and monotonic() - modified_at < interval * 4:
+                sleep(0.001)
+
+            if str(path) in detected:
+                latencies.append(detected[str(path)] - modified_at)
+
+        poller.stop()
+
+        ret = {
+            "files": files_n,
+            "watched_files": poller.files_count,
+            "directories": poller.dirs_count,
+            "interval": interval,
+            "batch_size": batch_size,
+            "seed_wall_s": seed_wall,
+            "seed_cpu_s": seed_cpu,
+            "scan_cpu_s": statistics.median(scan_cpu),
+            "detection_latency_p50_s": statistics.median(latencies) if latencies else None,
+            "detection_latency_max_s": max(latencies) if latencies else None,
+            "missed_changes": latency_samples - len(latencies),
+        }
+        return ret
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=50000)
+    parser.add_argument("--interval", type=float, default=0.5)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--samples", type=int, default=20)
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    results = run(args.files, args.interval, args.batch_size, args.samples)
+    content = json.dumps(results, indent=4)
+
+    if args.output:
+        args.output.write_text(content)
+
+    sys.stdout.write(content + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,83 @@
+import os
 from pathlib import Path
 from types import ModuleType
-from typing import TYPE_CHECKING, List
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple, Union
+
+from globmatch.translation import compile_pattern
 
 from smartreloader import objects
 
 if TYPE_CHECKING:
+    from smartreloader.metrics import ReloadMetrics
     from smartreloader.partialreloader import Action
 
+PARTIAL = "partial"
+FULL = "full"
+IGNORE = "ignore"
+
+POLICIES = [PARTIAL, FULL, IGNORE]
+
+# one of POLICIES or a callable getting the changed file and returning one of them
+Policy = Union[str, Callable[[Path], str]]
+
+
+class PolicyMatcher:
+    """
+    Matches files against reload policy globs (relative to the root), first matching glob wins.
+    Globs are compiled once, files not matching any glob are reloaded partially.
+    """
+
+    def __init__(self, root: Path, policies: Dict[str, Policy]) -> None:
+        self.root = root
+        self.rules: List[Tuple[Callable[[str], bool], Policy]] = []
+
+        for glob, policy in policies.items():
+            self.validate(glob, policy)
+            self.rules.append((compile_pattern(glob), policy))
+
+    @staticmethod
+    def validate(glob: str, policy: Policy) -> None:
+        if not callable(policy) and policy not in POLICIES:
+            raise ValueError(f"Invalid reload policy {policy!r} for {glob}, expected one of {', '.join(POLICIES)}"
+                             f" or a callable")
+
+    def get_rule(self, path: Path) -> Optional[Tuple[str, Policy]]:
+        """
+        Returns the path relative to the root and the first matching policy.
+        """
+        if not self.rules:
+            return None
+
+        try:
+            relative = os.path.normcase(str(Path(path).relative_to(self.root)))
+        except ValueError:
+            # root is resolved, the path might go through a symlink
+            try:
+                relative = os.path.normcase(str(Path(path).resolve().relative_to(self.root)))
+            except ValueError:
+                return None
+
+        for match, policy in self.rules:
+            if match(relative):
+                return relative, policy
+
+        return None
+
+    def matches(self, path: Path) -> bool:
+        return self.get_rule(path) is not None
+
+    def get(self, path: Path) -> str:
+        rule = self.get_rule(path)
+        if not rule:
+            return PARTIAL
+
+        relative, policy = rule
+        if callable(policy):
+            policy = policy(Path(path))
+            self.validate(relative, policy)
+
+        return policy
+
 
 class BaseConfig:
     def on_start(self, argv: List[str]) -> None:
@@ -27,12 +98,18 @@ class BaseConfig:
     def after_rollback(self, file: Path, actions: List["Action"]) -> None:
         pass
 
+    def on_reload_metrics(self, metrics: "ReloadMetrics") -> None:
+        pass
+
     @property
     def ignored_paths(self) -> List[str]:
         return [
             "**/.*",
             "**/*~",
             "**/__pycache__",
+            "**/node_modules",
+            "**/venv",
+            "**/site-packages",
             "**/__smartreloader_*.py",
             "**/smartreloader_config.py",
         ]
@@ -41,5 +118,123 @@ class BaseConfig:
     def watched_paths(self) -> List[str]:
         return ["**/*.py"]
 
+    @property
+    def reload_policies(self) -> Dict[str, Policy]:
+        """
+        How changes of files matching globs (relative to the project root) are handled, first matching glob wins:
+            "partial" - partial reload, files not matching any glob are reloaded partially too
+            "full" - full reload right away, for files that can't be reloaded partially (settings, app configs)
+            "ignore" - nothing happens, also when the module would be reloaded as a dependent one
+        or a callable getting the changed file and returning one of them.
+        For example {"**/settings.py": "full", "**/migrations/*.py": "ignore"}.
+        """
+        return {}
+
+    @property
+    def staged_reloads(self) -> bool:
+        """
+        Stage writes of a reload and publish them at once at the end, so request threads never see a half
+        updated module. Dependent modules are executed against the staged state. Changed classes and methods can't
+        be staged for them, those are published before executing a dependent module, which is logged as a warning.
+        """
+        return "SMART_RELOADER_STAGED" in os.environ
+
+    @property
+    def max_publish_pause(self) -> float:
+        """
+        Longest time (in seconds) other threads are paused while a staged reload is published.
+        Longer publishing is reported, other threads may run in the meantime.
+        """
+        return 0.05
+
+    @property
+    def watch_imported_only(self) -> bool:
+        """
+        Watch only directories of imported user modules instead of the whole project root.
+        """
+        return False
+
+    @property
+    def debounce_max(self) -> float:
+        """
+        Maximum time (in seconds) to wait for more file events before reloading.
+        """
+        return 0.2
+
+    @property
+    def debounce_quiet_time(self) -> float:
+        """
+        Time (in seconds) without new file events after which a batch of events is reloaded
+        when the changed files are not known to be closed after writing.
+        """
+        return 0.01
+
+    @property
+    def polling(self) -> bool:
+        """
+        Poll files for changes instead of relying on inotify (docker bind mounts, network filesystems).
+        """
+        return "SMART_RELOADER_POLLING" in os.environ
+
+    @property
+    def polling_interval(self) -> float:
+        """
+        Time (in seconds) of one full rescan when polling.
+        """
+        return 0.5
+
+    @property
+    def polling_batch_size(self) -> int:
+        """
+        Number of directories scanned at once when polling.
+        """
+        return 100
+
+    @property
+    def max_log_sessions(self) -> int:
+        """
+        Number of most recent log sessions to keep (at least 1, the current one), older ones and their snapshots
+        are removed.
+        """
+        return 20
+
+    @property
+    def log_inventory_every(self) -> int:
+        """
+        Log all objects of the reloaded module every N hot reloads (0 disables it).
+        Hot reload events only contain objects touched by the reload.
+        """
+        return 0
+
+    @property
+    def metrics_port(self) -> Optional[int]:
+        """
+        Serve Prometheus metrics on localhost on this port (disabled if None).
+        """
+        port = os.environ.get("SMART_RELOADER_METRICS_PORT")
+        return int(port) if port else None
+
+    @property
+    def profile_reloads(self) -> bool:
+        """
+        Profile every partial reload with cProfile. Stats are saved to the session log directory.
+        """
+        return "SMART_RELOADER_PROFILE" in os.environ
+
+    @property
+    def profile_top_n(self) -> int:
+        """
+        Number of hottest functions (by own time) recorded in the hot reloaded event when profiling.
+        """
+        return 20
+
+    @property
+    def control_socket(self) -> Optional[str]:
+        """
+        Path of a unix socket accepting reload requests with source text and status queries (disabled if None).
+        See smartreloader.control.
+        """
+        return os.environ.get("SMART_RELOADER_CONTROL_SOCKET") or None
+
     def plugins(self) -> List[ModuleType]:
         return [objects]
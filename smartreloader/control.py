@@ -0,0 +1,155 @@
+"""
+Unix socket control channel of the reloaded process.
+
+Requests and responses are json objects, one per line. Every request has a "command":
+    {"command": "reload", "files": [{"path": "app/views.py", "source": "..."}], "dry_run": false}
+        reloads files with the given source (read from disk if "source" is missing), skipping the file watcher
+    {"command": "status"}
+    {"command": "metrics"}
+        timings of recent reloads
+
+Responses have "ok" set and either the result or an "error".
+
+Usage: python -m smartreloader.control <socket> status|metrics|reload [files ...]
+       source of a single reloaded file is read from stdin with --stdin
+"""
+import argparse
+import json
+import os
+import socket
+import socketserver
+import stat
+import sys
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+__all__ = ["ControlServer", "request"]
+
+
+Command = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+
+class ControlServer:
+    """
+    Serves commands on a unix socket from a daemon thread.
+    """
+
+    def __init__(self, path: str, commands: Dict[str, Command]) -> None:
+        self.path = path
+        self.commands = commands
+
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self) -> None:
+                for line in self.rfile:
+                    if not line.strip():
+                        continue
+
+                    response = server.handle(line)
+                    self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+                    self.wfile.flush()
+
+        # stale socket of a previous run, a socket someone listens on or anything else is left alone and binding fails
+        if self._get_socket_id() is not None and self._is_stale():
+            os.unlink(self.path)
+
+        self.server = socketserver.ThreadingUnixStreamServer(self.path, Handler)
+        self.server.daemon_threads = True
+        # source sent over the socket gets executed, only the owner may connect
+        os.chmod(self.path, 0o600)
+        self._socket_id = self._get_socket_id()
+
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.setDaemon(True)
+
+    def _get_socket_id(self) -> Optional[Tuple[int, int]]:
+        """
+        Device and inode of the socket at path, None if there is no socket.
+        """
+        try:
+            st = os.lstat(self.path)
+        except FileNotFoundError:
+            return None
+
+        if not stat.S_ISSOCK(st.st_mode):
+            return None
+        return st.st_dev, st.st_ino
+
+    def _is_stale(self) -> bool:
+        """
+        Nobody listens on the socket at path.
+        """
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            try:
+                s.connect(self.path)
+            except ConnectionRefusedError:
+                return True
+            except OSError:
+                return False
+
+        return False
+
+    def handle(self, line: bytes) -> Dict[str, Any]:
+        try:
+            message = json.loads(line.decode("utf-8"))
+            command = self.commands[message["command"]]
+        except (ValueError, KeyError, TypeError):
+            return {"ok": False, "error": f"Invalid request, commands: {', '.join(self.commands)}"}
+
+        try:
+            ret = {"ok": True, **command(message)}
+        except Exception as e:
+            ret = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        return ret
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        # the path might have been taken over by another process in the meantime
+        if self._socket_id is not None and self._get_socket_id() == self._socket_id:
+            os.unlink(self.path)
+
+
+def request(path: str, message: Dict[str, Any], timeout: float = 30.0) -> Dict[str, Any]:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.settimeout(timeout)
+        s.connect(path)
+        s.sendall(json.dumps(message).encode("utf-8") + b"\n")
+
+        with s.makefile("rb") as f:
+            ret = json.loads(f.readline().decode("utf-8"))
+    return ret
+
+
+def _main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("socket")
+    parser.add_argument("command", choices=["reload", "status", "metrics"])
+    parser.add_argument("files", nargs="*", type=Path)
+    parser.add_argument("--stdin", action="store_true", help="Read source of the reloaded file from stdin")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    message: Dict[str, Any] = {"command": args.command}
+
+    if args.command == "reload":
+        files: List[Dict[str, str]] = [{"path": str(f.absolute())} for f in args.files]
+        if args.stdin:
+            if len(files) != 1:
+                parser.error("--stdin needs exactly one file")
+            files[0]["source"] = sys.stdin.read()
+        message["files"] = files
+        message["dry_run"] = args.dry_run
+
+    response = request(args.socket, message)
+    sys.stdout.write(json.dumps(response, indent=4) + "\n")
+    sys.exit(0 if response["ok"] else 1)
+
+
+if __name__ == "__main__":
+    _main()
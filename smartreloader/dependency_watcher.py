@@ -22,6 +22,7 @@ from importlib import invalidate_caches
 from importlib.machinery import SourceFileLoader
 
 post_module_exec_hook: Optional[Callable] = None
+new_module_hook: Optional[Callable] = None
 
 
 class SmartReloaderLoader(SourceFileLoader):
@@ -143,6 +144,8 @@ def post_import(module: ModuleType):
 
     if hasattr(module, "__file__") and module.__file__ not in import_order:
         import_order.append(module.__file__)
+        if new_module_hook:
+            new_module_hook(module.__file__)
 
 
 def _import(name, globals=None, locals=None, fromlist=None, level=_default_level):
@@ -3,6 +3,7 @@ import subprocess
 import sys
 
 import signal
+import tempfile
 
 from pathlib import Path
 from textwrap import dedent
@@ -12,11 +13,14 @@ from typing import List, Optional
 import uuid
 
 from smartreloader import e2e
+from smartreloader.prometheus import STATE_FILE_ENV
 
 
 class SmartReloader:
     def __init__(self):
         self.seed_file = Path(f"__smartreloader_{uuid.uuid4()}__.py")
+        # shared by processes restarted by full reloads
+        self.metrics_state_file = Path(tempfile.gettempdir()) / f"smartreloader_metrics_{uuid.uuid4()}.json"
 
         if e2e.enabled:
             self.seed_file = Path(f"__smartreloader__.py")
@@ -126,9 +130,19 @@ class SmartReloader:
         )
 
     def main_loop(self) -> int:
+        try:
+            return self._main_loop()
+        finally:
+            if self.metrics_state_file.exists():
+                self.metrics_state_file.unlink()
+
+    def _main_loop(self) -> int:
+        env = dict(os.environ)
+        env[STATE_FILE_ENV] = str(self.metrics_state_file)
+
         while True:
             self.init()
-            proc = subprocess.Popen(["python", str(self.seed_file.name)])
+            proc = subprocess.Popen(["python", str(self.seed_file.name)], env=env)
 
             def signal_handler(sig, frame):
                 proc.send_signal(sig)
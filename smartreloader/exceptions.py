@@ -2,5 +2,7 @@ __all__ = ["FullReloadNeeded"]
 
 
 class FullReloadNeeded(Exception):
-    pass
+    def __init__(self, cause: str = "unknown") -> None:
+        super().__init__(cause)
+        self.cause = cause
 
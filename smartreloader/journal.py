@@ -0,0 +1,518 @@
+"""
+Transaction journal of a reload.
+
+Every write a reload makes to live objects (attributes, dict slots, code objects, list contents, frame locals) goes
+through the journal, which records the previous value first. Rollback restores them in reverse order in one pass,
+so it's O(writes) and doesn't depend on rollbacks of individual actions.
+
+A staged journal (see BaseConfig.staged_reloads) doesn't write at all until published. Modules executed meanwhile
+import shadow copies of modules with staged writes applied, and publishing applies all writes while holding the GIL,
+so other threads never see a half updated module.
+"""
+import builtins
+import gc
+import inspect
+import sys
+import threading
+from contextlib import contextmanager
+from time import perf_counter, sleep
+from types import FrameType, FunctionType, ModuleType
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from smartreloader import utils
+
+__all__ = ["Journal", "ShadowImports"]
+
+
+class _Missing:
+    def __repr__(self) -> str:
+        return "<missing>"
+
+
+MISSING = _Missing()
+
+ATTR = 0
+ITEM = 1
+CONTENT = 2
+DICT = 3
+
+Entry = Tuple[int, Any, Any, Any, Optional[FrameType]]
+
+
+def _get_attr(obj: Any, name: str) -> Any:
+    """
+    Value stored on obj itself, inherited class attributes are missing.
+    """
+    obj_dict = getattr(obj, "__dict__", None)
+    if obj_dict is not None and name in obj_dict:
+        return obj_dict[name]
+
+    # slots and data descriptors like __code__ of functions
+    descriptor = inspect.getattr_static(type(obj), name, None)
+    if obj_dict is None or hasattr(descriptor, "__set__"):
+        return getattr(obj, name, MISSING)
+
+    return MISSING
+
+
+def _get_item(d: Dict[Any, Any], key: Any) -> Any:
+    return d.get(key, MISSING)
+
+
+def _get_content(obj: List[Any], key: None) -> List[Any]:
+    return obj[:]
+
+
+def _get_dict(obj: Dict[Any, Any], key: None) -> Dict[Any, Any]:
+    return dict(obj)
+
+
+def _write_attr(obj: Any, name: str, value: Any) -> None:
+    if value is MISSING:
+        if name in getattr(obj, "__dict__", {}):
+            delattr(obj, name)
+    else:
+        setattr(obj, name, value)
+
+
+def _write_item(d: Dict[Any, Any], key: Any, value: Any) -> None:
+    if value is MISSING:
+        d.pop(key, None)
+    else:
+        d[key] = value
+
+
+def _write_content(obj: List[Any], key: None, value: List[Any]) -> None:
+    obj[:] = value
+
+
+def _write_dict(obj: Dict[Any, Any], key: None, value: Dict[Any, Any]) -> None:
+    obj.clear()
+    obj.update(value)
+
+
+GET: Dict[int, Callable[[Any, Any], Any]] = {
+    ATTR: _get_attr,
+    ITEM: _get_item,
+    CONTENT: _get_content,
+    DICT: _get_dict,
+}
+
+WRITE: Dict[int, Callable[[Any, Any, Any], None]] = {
+    ATTR: _write_attr,
+    ITEM: _write_item,
+    CONTENT: _write_content,
+    DICT: _write_dict,
+}
+
+
+class _ShadowModule(ModuleType):
+    """
+    Copy of a module. Once released it's emptied and forwards to the live module, so references to it left in
+    executed modules keep working after publishing.
+    """
+    __slots__ = ("_live",)
+
+    def _get_live(self) -> Optional[ModuleType]:
+        try:
+            return object.__getattribute__(self, "_live")
+        except AttributeError:
+            return None
+
+    def __getattr__(self, name: str) -> Any:
+        live = self._get_live()
+        if live is None:
+            raise AttributeError(name)
+        return getattr(live, name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        live = self._get_live()
+        if live is None:
+            super().__setattr__(name, value)
+        else:
+            setattr(live, name, value)
+
+    def __delattr__(self, name: str) -> None:
+        live = self._get_live()
+        if live is None:
+            super().__delattr__(name)
+        else:
+            delattr(live, name)
+
+    def release(self, live: ModuleType) -> None:
+        self.__dict__.clear()
+        object.__setattr__(self, "_live", live)
+
+
+def _copy_module(module: ModuleType) -> _ShadowModule:
+    ret = _ShadowModule(module.__name__)
+    ret.__dict__.update(module.__dict__)
+    return ret
+
+
+def _copy_function(function: FunctionType) -> FunctionType:
+    ret = FunctionType(function.__code__, function.__globals__, function.__name__, function.__defaults__,
+                       function.__closure__)
+    ret.__kwdefaults__ = function.__kwdefaults__
+    ret.__qualname__ = function.__qualname__
+    ret.__doc__ = function.__doc__
+    ret.__module__ = function.__module__
+    ret.__annotations__ = dict(function.__annotations__)
+    ret.__dict__.update(function.__dict__)
+    return ret
+
+
+def _get_modules() -> Dict[str, ModuleType]:
+    # items() is not forwarded by the sys.modules replacement of the reloader
+    ret = {n: sys.modules.get(n) for n in list(sys.modules.keys())}
+    ret = {n: m for n, m in ret.items() if isinstance(m, ModuleType)}
+    return ret
+
+
+def _get_written_module(entry: Entry, module_dicts: Dict[int, ModuleType]) -> Optional[ModuleType]:
+    """
+    Module the write goes to the namespace of, None for writes to other objects.
+    """
+    kind, target, key, value, frame = entry
+    if kind == ATTR and isinstance(target, ModuleType):
+        return target
+    if kind == ITEM and frame is None:
+        return module_dicts.get(id(target))
+    return None
+
+
+def _get_written_function(entry: Entry, module_dicts: Dict[int, ModuleType]) -> Optional[ModuleType]:
+    """
+    Module a written module level function (its code for example) is defined in, None for writes to other objects.
+    Methods are not module level, copies of them would need copies of their classes.
+    """
+    kind, target, key, value, frame = entry
+    if kind != ATTR or type(target) is not FunctionType:
+        return None
+
+    module = module_dicts.get(id(target.__globals__))
+    if module is None or not any(v is target for v in target.__globals__.values()):
+        return None
+    return module
+
+
+class ShadowImports:
+    """
+    Copies of modules with staged writes applied, imported instead of the live modules by a module executed
+    during a staged reload. Parent packages are copied too, so `from . import module` gets the copy as well.
+    Changed module level functions are copied with the staged writes (new code) applied and put in the module
+    copies. Only writes to module namespaces and module level functions are applied, see Journal.is_shadowable.
+    """
+
+    def __init__(self, staged: List[Entry]) -> None:
+        modules = _get_modules()
+        module_dicts = {id(m.__dict__): m for m in modules.values()}
+
+        # id of live module -> copy
+        self.shadows: Dict[int, _ShadowModule] = {}
+        # id of live function -> copy
+        self.functions: Dict[int, FunctionType] = {}
+        # id of copy (module or function) -> live object
+        self.live: Dict[int, Any] = {}
+
+        for entry in staged:
+            kind, target, key, value, frame = entry
+
+            module = _get_written_function(entry, module_dicts)
+            if module is not None:
+                self._get_shadow(module)
+                _write_attr(self._get_function_copy(target), key, value)
+                continue
+
+            module = _get_written_module(entry, module_dicts)
+            if module is None:
+                continue
+
+            # attributes of a module are items of its namespace
+            _write_item(self._get_shadow(module).__dict__, key, value)
+
+        for module in [self.live[id(s)] for s in self.shadows.values()]:
+            parts = module.__name__.split(".")
+            for i in range(len(parts) - 1, 0, -1):
+                parent = modules.get(".".join(parts[:i]))
+                if parent is None or getattr(parent, parts[i], None) is not module:
+                    break
+                self._get_shadow(parent).__dict__[parts[i]] = self.shadows[id(module)]
+                module = parent
+
+        # changed functions are replaced wherever the copied namespaces hold them
+        for shadow in self.shadows.values():
+            shadow_dict = shadow.__dict__
+            for k, v in list(shadow_dict.items()):
+                if type(v) is FunctionType and id(v) in self.functions:
+                    shadow_dict[k] = self.functions[id(v)]
+
+        self._import = builtins.__import__
+        self._thread_id: Optional[int] = None
+
+    def __len__(self) -> int:
+        return len(self.shadows)
+
+    def _get_shadow(self, module: ModuleType) -> _ShadowModule:
+        if id(module) not in self.shadows:
+            shadow = _copy_module(module)
+            self.shadows[id(module)] = shadow
+            self.live[id(shadow)] = module
+
+        ret = self.shadows[id(module)]
+        return ret
+
+    def _get_function_copy(self, function: FunctionType) -> FunctionType:
+        if id(function) not in self.functions:
+            copy = _copy_function(function)
+            self.functions[id(function)] = copy
+            self.live[id(copy)] = function
+
+        ret = self.functions[id(function)]
+        return ret
+
+    def import_(self, name: str, globals: Optional[Dict[str, Any]] = None, locals: Optional[Dict[str, Any]] = None,
+                fromlist: Tuple[str, ...] = (), level: int = 0) -> Any:
+        ret = self._import(name, globals, locals, fromlist, level)
+        # other threads keep importing live modules
+        if threading.get_ident() == self._thread_id:
+            ret = self.shadows.get(id(ret), ret)
+        return ret
+
+    @contextmanager
+    def installed(self) -> Iterator[None]:
+        """
+        Imports of the current thread get the copies meanwhile. The import hook is set process wide instead of
+        in builtins of the executed module, functions keep the builtins they were created with.
+        """
+        self._thread_id = threading.get_ident()
+        self._import = builtins.__import__
+        builtins.__import__ = self.import_
+        try:
+            yield
+        finally:
+            builtins.__import__ = self._import
+            self._thread_id = None
+
+    def unshadow(self, module: ModuleType) -> None:
+        """
+        Replaces copies with the live objects, which hold the same after publishing, in what the executed module
+        created: its namespace, classes, functions (defaults, closures) and containers.
+        Copies of modules referenced from anywhere else forward to the live modules once released.
+        """
+        self._unshadow(module.__dict__, module.__dict__, set())
+
+    def _unshadow(self, obj: Any, module_dict: Dict[str, Any], seen: Set[int]) -> Any:
+        """
+        :return: obj or its replacement, tuples and sets holding copies are rebuilt
+        """
+        live = self.live.get(id(obj), MISSING)
+        if live is not MISSING:
+            return live
+
+        if id(obj) in seen:
+            return obj
+        seen.add(id(obj))
+
+        if isinstance(obj, dict):
+            for k, v in list(obj.items()):
+                new_v = self._unshadow(v, module_dict, seen)
+                if new_v is not v:
+                    obj[k] = new_v
+        elif isinstance(obj, list):
+            for i, v in enumerate(obj):
+                new_v = self._unshadow(v, module_dict, seen)
+                if new_v is not v:
+                    obj[i] = new_v
+        elif type(obj) in (tuple, set, frozenset):
+            content = [self._unshadow(v, module_dict, seen) for v in obj]
+            if any(n is not o for n, o in zip(content, obj)):
+                return type(obj)(content)
+        elif isinstance(obj, (staticmethod, classmethod)):
+            self._unshadow(obj.__func__, module_dict, seen)
+        elif isinstance(obj, FunctionType) and obj.__globals__ is module_dict:
+            defaults = self._unshadow(obj.__defaults__, module_dict, seen)
+            if defaults is not obj.__defaults__:
+                obj.__defaults__ = defaults
+            self._unshadow(obj.__kwdefaults__, module_dict, seen)
+            self._unshadow(obj.__dict__, module_dict, seen)
+            for cell in obj.__closure__ or ():
+                try:
+                    contents = cell.cell_contents
+                except ValueError:
+                    # empty cell
+                    continue
+                new_contents = self._unshadow(contents, module_dict, seen)
+                if new_contents is not contents:
+                    cell.cell_contents = new_contents
+        elif isinstance(obj, type) and obj.__module__ == module_dict.get("__name__"):
+            for k, v in list(vars(obj).items()):
+                new_v = self._unshadow(v, module_dict, seen)
+                if new_v is not v:
+                    setattr(obj, k, new_v)
+
+        return obj
+
+    def release(self) -> None:
+        """
+        Module copies forward to the live modules from now on, called once staged writes are published or dropped.
+        """
+        for shadow in self.shadows.values():
+            shadow.release(self.live[id(shadow)])
+
+
+class Journal:
+    """
+    Entries are (kind, target, key, previous value, frame) tuples in write order.
+    """
+
+    def __init__(self) -> None:
+        self.entries: List[Entry] = []
+        # (kind, target, key, new value, frame) tuples waiting for publish, None if not staging
+        self.staged: Optional[List[Entry]] = None
+        # released once staged writes are published or dropped
+        self.shadow_imports: List[ShadowImports] = []
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @property
+    def staging(self) -> bool:
+        return self.staged is not None
+
+    def _write(self, kind: int, target: Any, key: Any, value: Any, frame: Optional[FrameType] = None,
+               now: bool = False) -> None:
+        if self.staged is not None and not now:
+            self.staged.append((kind, target, key, value, frame))
+            return
+
+        previous = GET[kind](target, key)
+        WRITE[kind](target, key, value)
+        # recorded after a successful write, a failed write has nothing to restore
+        self.entries.append((kind, target, key, previous, frame))
+
+    def set_attr(self, obj: Any, name: str, value: Any, now: bool = False) -> None:
+        """
+        :param now: written right away even when staging, for state of the reloader read by following actions
+        """
+        self._write(ATTR, obj, name, value, now=now)
+
+    def del_attr(self, obj: Any, name: str) -> None:
+        if self.staged is None and _get_attr(obj, name) is MISSING:
+            # raises AttributeError
+            delattr(obj, name)
+        self._write(ATTR, obj, name, MISSING)
+
+    def set_item(self, d: Dict[Any, Any], key: Any, value: Any, frame: Optional[FrameType] = None) -> None:
+        """
+        :param frame: frame the dict holds locals of, changes are applied to the frame on publish and restore
+        """
+        self._write(ITEM, d, key, value, frame)
+
+    def del_item(self, d: Dict[Any, Any], key: Any) -> None:
+        if self.staged is None and key not in d:
+            raise KeyError(key)
+        self._write(ITEM, d, key, MISSING)
+
+    def set_content(self, obj: List[Any], content: List[Any]) -> None:
+        self._write(CONTENT, obj, None, list(content))
+
+    def set_dict(self, d: Dict[Any, Any], content: Dict[Any, Any]) -> None:
+        """
+        Replaces the whole dict, for bulk changes like replacing frame globals.
+        """
+        self._write(DICT, d, None, dict(content))
+
+    def stage(self) -> None:
+        """
+        Following writes wait for publish.
+        """
+        self.staged = []
+
+    def is_shadowable(self) -> bool:
+        """
+        True if all staged writes go to module namespaces or module level functions, modules executed while
+        staging see those through shadow imports. Changed classes, methods or list content are only seen once
+        published.
+        """
+        module_dicts = {id(m.__dict__): m for m in _get_modules().values()}
+        ret = all(_get_written_module(e, module_dicts) is not None
+                  or _get_written_function(e, module_dicts) is not None for e in self.staged or [])
+        return ret
+
+    def get_shadow_imports(self) -> Optional[ShadowImports]:
+        """
+        Shadow imports for a module executed while staging, None if no module is changed by the staged writes.
+        """
+        if not self.staged:
+            return None
+
+        ret = ShadowImports(self.staged)
+        if not len(ret):
+            return None
+
+        self.shadow_imports.append(ret)
+        return ret
+
+    def _release_shadows(self) -> None:
+        for s in self.shadow_imports:
+            s.release()
+        self.shadow_imports = []
+
+    def publish(self, max_pause: float) -> Tuple[float, float]:
+        """
+        Applies staged writes in one critical section and stops staging. Other threads can't run while holding the
+        GIL, the switch interval is raised to max_pause so they get it back after max_pause at the latest.
+        Entries are recorded as usual, so a published reload can be rolled back.
+
+        :return: perf_counter values of the start and end of the critical section
+        """
+        staged, self.staged = self.staged or [], None
+
+        gc_enabled = gc.isenabled()
+        interval = sys.getswitchinterval()
+        # collections could run finalizers releasing the GIL
+        gc.disable()
+        sys.setswitchinterval(max(max_pause, interval))
+        # threads already waiting for the GIL wait with the previous interval, let them run first
+        sleep(0)
+
+        try:
+            start = perf_counter()
+            frames = {}
+            for kind, target, key, value, frame in staged:
+                self._write(kind, target, key, value, frame)
+                if frame is not None:
+                    frames[id(frame)] = frame
+
+            for f in frames.values():
+                utils.apply_changes_to_frame(f)
+            # copies left in executed modules forward to what was just published
+            self._release_shadows()
+            end = perf_counter()
+        finally:
+            sys.setswitchinterval(interval)
+            if gc_enabled:
+                gc.enable()
+
+        return start, end
+
+    def restore(self) -> None:
+        """
+        Restores recorded values, most recent first, and empties the journal. Staged writes are dropped.
+        """
+        frames = {}
+        for kind, target, key, value, frame in reversed(self.entries):
+            WRITE[kind](target, key, value)
+            if frame is not None:
+                frames[id(frame)] = frame
+
+        for f in frames.values():
+            utils.apply_changes_to_frame(f)
+
+        self.clear()
+
+    def clear(self) -> None:
+        self.entries = []
+        self.staged = None
+        self._release_shadows()
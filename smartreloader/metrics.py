@@ -0,0 +1,137 @@
+from contextlib import contextmanager
+from pathlib import Path
+from time import perf_counter, time
+from typing import Any, Dict, Iterator, List, Optional
+
+from dataclasses import dataclass, field
+
+__all__ = ["NullMetrics", "ReloadMetrics", "Span", "percentile"]
+
+
+EVENT_RECEIVED = "event_received"
+DEPENDENCY_COLLECTION = "dependency_collection"
+MODULE_REEXEC = "module_reexec"
+# syntax check for changes needing a full reload, inside module re-exec
+PRECHECK = "precheck"
+TREE_BUILD = "tree_build"
+DIFF = "diff"
+ACTION_APPLY = "action_apply"
+DEPENDENT_CASCADE = "dependent_cascade"
+# critical section applying writes of a staged reload
+PUBLISH = "publish"
+LOGGING = "logging"
+# single applied action, not a phase
+ACTION = "action"
+# gc.get_referrers scan of a deep update
+HEAP_SCAN = "heap_scan"
+
+PHASES = [EVENT_RECEIVED, DEPENDENCY_COLLECTION, MODULE_REEXEC, PRECHECK, TREE_BUILD, DIFF, ACTION_APPLY,
+          DEPENDENT_CASCADE, PUBLISH, LOGGING]
+
+
+def percentile(values: List[float], p: float) -> float:
+    """
+    Nearest-rank percentile (0-100) of non-empty values.
+    """
+    values = sorted(values)
+    ret = values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+    return ret
+
+
+@dataclass
+class Span:
+    name: str
+    # perf_counter values
+    start: float
+    end: float
+    args: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+    def to_dict(self, origin: float) -> Dict[str, Any]:
+        ret = {"name": self.name, "start": self.start - origin, "duration": self.duration}
+        if self.args:
+            ret["args"] = self.args
+        return ret
+
+
+@dataclass
+class ReloadMetrics:
+    """
+    Timing spans of one reload.
+    Spans nest (for example module re-exec of a dependent module is inside the dependent cascade span),
+    so phase totals of nested phases overlap.
+    """
+    module_file: Path
+    started: float = field(default_factory=perf_counter)
+    # wall clock time of started
+    started_at: float = field(default_factory=time)
+    finished: Optional[float] = None
+    # "hot", "full" or "rollback"
+    outcome: Optional[str] = None
+    spans: List[Span] = field(default_factory=list)
+
+    @contextmanager
+    def span(self, name: str, **args: Any) -> Iterator[None]:
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append(Span(name, start, perf_counter(), args))
+
+    def add_span(self, name: str, start: float, end: float, **args: Any) -> None:
+        self.spans.append(Span(name, start, end, args))
+
+    def finish(self, outcome: str) -> None:
+        self.outcome = outcome
+        self.finished = perf_counter()
+
+    @property
+    def origin(self) -> float:
+        ret = min([self.started] + [s.start for s in self.spans])
+        return ret
+
+    @property
+    def total(self) -> float:
+        end = self.finished if self.finished is not None else perf_counter()
+        return end - self.origin
+
+    @property
+    def phases(self) -> Dict[str, float]:
+        """
+        Total time spent in each phase.
+        """
+        ret = {}
+        for s in self.spans:
+            if s.name == ACTION:
+                continue
+            ret[s.name] = ret.get(s.name, 0.0) + s.duration
+        return ret
+
+    def to_dict(self) -> Dict[str, Any]:
+        origin = self.origin
+
+        ret = {
+            "module": str(self.module_file),
+            "started_at": self.started_at - (self.started - origin),
+            "outcome": self.outcome,
+            "total": self.total,
+            "phases": self.phases,
+            "spans": [s.to_dict(origin) for s in sorted(self.spans, key=lambda s: s.start)],
+        }
+        return ret
+
+
+class NullMetrics(ReloadMetrics):
+    """
+    Metrics of actions executed outside of a reload, nothing is recorded.
+    """
+
+    @contextmanager
+    def span(self, name: str, **args: Any) -> Iterator[None]:
+        yield
+
+    def add_span(self, name: str, start: float, end: float, **args: Any) -> None:
+        pass
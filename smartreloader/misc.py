@@ -5,12 +5,12 @@ import os
 import re
 import sys
 import traceback
-from types import ModuleType
+from types import CodeType, ModuleType
 
 from dataclasses import dataclass
 from pathlib import Path
 from textwrap import dedent
-from typing import Any, Callable, Dict, List, Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional
 
 from globmatch import glob_match
 from watchdog.events import FileSystemEvent, FileSystemEventHandler
@@ -215,8 +215,12 @@ def path_to_module_name(path: Path, package_root: Path) -> str:
 
 
 def import_from_file(
-    path: Path, package_root: Path, module_name: Optional[str] = None, add_to_sys_modules: bool = False
+    path: Path, package_root: Path, module_name: Optional[str] = None, add_to_sys_modules: bool = False,
+    code: Optional[CodeType] = None
 ) -> Any:
+    """
+    :param code: compiled module, executed directly instead of loading the file (no read, no .pyc)
+    """
     from . import dependency_watcher
     if not module_name:
         module_name = path_to_module_name(path, package_root)
@@ -225,7 +229,10 @@ def import_from_file(
     spec = importlib.util.spec_from_loader(module_name, loader)
     module = importlib.util.module_from_spec(spec)
     dependency_watcher.clear_start_import_usages(str(path))
-    loader.exec_module(module)
+    if code is None:
+        loader.exec_module(module)
+    else:
+        exec(code, module.__dict__)
 
     if add_to_sys_modules:
         sys.modules[module_name] = module
@@ -245,6 +252,38 @@ def get_module_from_full_name(full_name: str) -> Optional[str]:
             return None
 
 
+def iter_dirs(root: str, ignored_paths: List[str], start: Optional[str] = None) -> Iterator[str]:
+    """
+    Yields all directories below root that are not ignored.
+    Ignored directories are pruned so their subtrees are never entered.
+    Symlinked directories are skipped.
+
+    :param start: directory below root to walk instead of root, ignored paths are still relative to root
+    """
+    stack = [start or root]
+
+    while stack:
+        path = stack.pop()
+        try:
+            entries = os.scandir(path)
+        except OSError:
+            continue
+
+        with entries:
+            for e in entries:
+                try:
+                    if not e.is_dir(follow_symlinks=False):
+                        continue
+                except OSError:
+                    continue
+
+                if glob_match(os.path.relpath(e.path, root), ignored_paths):
+                    continue
+
+                yield e.path
+                stack.append(e.path)
+
+
 @dataclass
 class EnvParser:
     path: Path
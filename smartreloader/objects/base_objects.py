@@ -18,6 +18,7 @@ from typing import (
     Type, TYPE_CHECKING, )
 
 from smartreloader import dependency_watcher, utils
+from smartreloader.metrics import HEAP_SCAN
 
 from dataclasses import dataclass
 
@@ -38,6 +39,10 @@ class BaseAction:
         self.reloader.logger.info(str(self))
 
     def rollback(self) -> None:
+        """
+        Reverts state of the reloader (object trees, module descriptors).
+        Writes to python objects are restored by the journal, see PartialReloader.rollback.
+        """
         pass
 
     def equal(self, other: "BaseAction") -> bool:
@@ -78,7 +83,6 @@ class Object(ABC):
 
         def rollback(self) -> None:
             super().rollback()
-            self.parent.del_attr(self.obj.name)
             self.parent.module.unregister_obj(self.obj)
 
     @dataclass(repr=False)
@@ -94,10 +98,6 @@ class Object(ABC):
             self.new_obj.fix_reference(self.obj.module)
             self.obj.parent.set_attr(self.obj.name, self.new_obj.python_obj)
 
-        def rollback(self) -> None:
-            super().rollback()
-            self.obj.parent.set_attr(self.obj.name, self.obj.python_obj)
-
     @dataclass(repr=False)
     class DeepUpdate(Action):
         parent: Optional["ContainerObj"]
@@ -105,27 +105,13 @@ class Object(ABC):
         new_obj: Optional["Object"]
         referrers: List[object] = field(init=False)
 
-        @dataclass
-        class RollabackOperation:
-            dict_obj: Any
-            dictionary: dict
-            key: str
-            value: object
-            owner: "Object.DeepUpdate"
-
-            def execute(self) -> None:
-                self.dictionary[self.key] = self.value
-                if inspect.isframe(self.dict_obj):
-                    self.owner.apply_changes_to_frame(self.dict_obj)
-
-        rollback_operations: List[RollabackOperation] = field(init=False, default_factory=list)
-
         def __post_init__(self):
             pass
 
         def get_referrers(self, obj: object) -> List[object]:
             ret = []
-            referres = gc.get_referrers(obj)
+            with self.reloader.metrics.span(HEAP_SCAN):
+                referres = gc.get_referrers(obj)
             for r in referres:
                 if r is locals():
                     continue
@@ -155,24 +141,26 @@ class Object(ABC):
                 else:
                     continue
 
+                frame = r if inspect.isframe(r) else None
                 for k, v in dictionary.items():
                     if v is not what:
                         continue
-                    dictionary[k] = to_what
-                    self.rollback_operations.append(self.RollabackOperation(r, dictionary, k, v, self))
+                    self.reloader.journal.set_item(dictionary, k, to_what, frame=frame)
 
                 # update frame
-                if inspect.isframe(r):
-                    utils.apply_changes_to_frame(r)
+                if frame:
+                    utils.apply_changes_to_frame(frame)
+
+        def update_tree(self) -> None:
+            """
+            Points the tree to the new object, following actions look objects up there. The tree is replaced among
+            the referrers anyway, but a staged reload writes those only when publishing.
+            """
+            self.reloader.journal.set_attr(self.obj, "python_obj", self.new_obj.python_obj, now=True)
 
         def execute(self) -> None:
             self.replace_obj(self.obj.python_obj, self.new_obj.python_obj)
-
-        def rollback(self) -> None:
-            super().rollback()
-
-            for o in self.rollback_operations:
-                o.execute()
+            self.update_tree()
 
     @dataclass(repr=False)
     class Delete(Action):
@@ -185,10 +173,6 @@ class Object(ABC):
         def execute(self) -> None:
             self.parent.del_attr(self.obj.name)
 
-        def rollback(self) -> None:
-            super().rollback()
-            self.parent.set_attr(self.obj.name, self.obj.python_obj)
-
     @dataclass(repr=False)
     class Candidate:
         rank: int
@@ -451,8 +435,11 @@ class FinalObj(Object, ABC):
         fixed_reference_obj = self.get_python_obj_from_module(
             self.python_obj, module
         )
+        # nothing to fix, builtin types can't be assigned anyway
+        if fixed_reference_obj is None or type(fixed_reference_obj) is type(self.python_obj):
+            return
         try:
-            self.python_obj.__class__ = fixed_reference_obj.__class__
+            self.reloader.journal.set_attr(self.python_obj, "__class__", fixed_reference_obj.__class__)
         except TypeError:
             pass
 
@@ -568,10 +555,10 @@ class ContainerObj(Object, ABC):
         return ret
 
     def set_attr(self, name: str, obj: "Any") -> None:
-        setattr(self.python_obj, name, obj)
+        self.reloader.journal.set_attr(self.python_obj, name, obj)
 
     def del_attr(self, name: str) -> None:
-        delattr(self.python_obj, name)
+        self.reloader.journal.del_attr(self.python_obj, name)
 
     def get_flat_repr(self) -> Dict[str, Object]:
         ret = {}
@@ -34,8 +34,7 @@ class Frame:
             return f"UpdateGlobals {repr(self.obj)}"
 
         def execute(self) -> None:
-            self.obj.python_obj.f_globals.clear()
-            self.obj.python_obj.f_globals.update(self.obj.module.python_obj.__dict__)
+            self.reloader.journal.set_dict(self.obj.python_obj.f_globals, self.obj.module.python_obj.__dict__)
             utils.apply_changes_to_frame(self.obj.python_obj)
 
     def get_actions_for_update(self) -> List[BaseAction]:
@@ -1,7 +1,9 @@
 import ast
+import importlib.util
 import sys
 from abc import ABC
 from collections import OrderedDict, defaultdict
+from contextlib import ExitStack
 from functools import lru_cache
 from logging import Logger
 
@@ -17,6 +19,7 @@ from typing import (
     Type, TYPE_CHECKING, Tuple, )
 
 from smartreloader import misc
+from smartreloader.metrics import ACTION, ACTION_APPLY, DIFF, MODULE_REEXEC, PRECHECK, TREE_BUILD
 
 from dataclasses import dataclass
 
@@ -29,6 +32,8 @@ if TYPE_CHECKING:
 @dataclass
 class Source:
     path: Path
+    # read from path if not given
+    raw: Optional[bytes] = None
 
     content: str = field(init=False)
     syntax: ast.AST = field(init=False)
@@ -122,6 +127,35 @@ class Source:
         def body(self) -> List[ast.stmt]:
             return self.content.body
 
+        @property
+        def bases(self) -> List[str]:
+            # names only like the mro check of Class.get_actions_for_update, "models.Model" is the same as "Model"
+            ret = [Source.get_expr_name(b) for b in self.content.bases]
+            return ret
+
+        @property
+        def metaclass(self) -> Optional[str]:
+            for k in self.content.keywords:
+                if k.arg == "metaclass":
+                    return Source.get_expr_name(k.value)
+
+            return None
+
+        @property
+        def slots(self) -> Optional[str]:
+            for s in self.content.body:
+                if isinstance(s, ast.Assign):
+                    targets = s.targets
+                elif isinstance(s, ast.AnnAssign):
+                    targets = [s.target]
+                else:
+                    continue
+
+                if any(isinstance(t, ast.Name) and t.id == "__slots__" for t in targets):
+                    return ast.dump(s.value) if s.value else None
+
+            return None
+
     @dataclass
     class DictType(Node):
         types = [ast.Dict]
@@ -169,6 +203,14 @@ class Source:
         def __post_init__(self) -> None:
             self.name = self.content.s
 
+    @dataclass
+    class Constant(Node):
+        # numbers, strings and name constants are parsed as ast.Constant since python 3.8
+        types = [ast.Constant]
+
+        def __post_init__(self) -> None:
+            self.name = self.content.value
+
     @dataclass
     class Call(Node):
         types = [ast.Call]
@@ -304,7 +346,9 @@ class Source:
         return ret
 
     def __post_init__(self) -> None:
-        self.content = self.path.read_text()
+        if self.raw is None:
+            self.raw = self.path.read_bytes()
+        self.content = importlib.util.decode_source(self.raw)
         self.syntax = ast.parse(self.content, str(self.path))
 
         node_types = self.get_all_node_types()
@@ -314,6 +358,15 @@ class Source:
         self.flat_syntax = self.root_node.get_flat_syntax()
         self.flat_syntax_str = self.root_node.get_flat_syntax_str()
 
+    @staticmethod
+    def get_expr_name(node: ast.AST) -> str:
+        if isinstance(node, ast.Name):
+            return node.id
+        if isinstance(node, ast.Attribute):
+            return node.attr
+
+        return ast.dump(node)
+
     def _get_namespaced_name(self, parent: str, name: str) -> str:
         return f"{parent}.{name}" if parent else name
 
@@ -324,11 +377,13 @@ class ModuleDescriptor:
     name: str
     path: Path
     body: ModuleType
-    source: Source = field(init=False)
+    # read from path if not given
+    source: Optional[Source] = None
     module_obj: "Module" = field(init=False, default=None)
 
     def __post_init__(self) -> None:
-        self.fetch_source()
+        if self.source is None:
+            self.fetch_source()
 
     def post_execute(self) -> None:
         self.module_obj = Module(module_descriptor=self,
@@ -339,7 +394,7 @@ class ModuleDescriptor:
                                  module=None)
 
     def fetch_source(self) -> None:
-        self.source = Source(self.path)
+        self.source = Source(self.path, self.reloader.source_overrides.get(str(self.path)))
 
     def __hash__(self) -> int:
         return hash(self.name)
@@ -367,6 +422,10 @@ class Modules(dict):
         if self.reloader.root not in Path(value.__file__).parents:
             return
 
+        # importlib sets executed modules again since python 3.11
+        if any(m.name == key and m.body is value for m in self.user_modules[value.__file__]):
+            return
+
         file = Path(value.__file__)
         module = ModuleDescriptor(name=key,
                                   path=file,
@@ -416,7 +475,20 @@ class UpdateModule(BaseAction):
         self.logger = self.reloader.logger
 
     @classmethod
-    def factory(cls, reloader: "PartialReloader", module_file: Path, dry_run: bool = False) -> List["UpdateModule"]:
+    def factory(cls, reloader: "PartialReloader", module_file: Path, dry_run: bool = False,
+                policy: Optional[str] = None) -> List["UpdateModule"]:
+        """
+        :param policy: reload policy of the file if already resolved, see BaseConfig.reload_policies
+        """
+        from smartreloader.config import FULL, IGNORE
+        from smartreloader.exceptions import FullReloadNeeded
+
+        policy = policy or reloader.policies.get(module_file)
+        if policy == IGNORE:
+            return []
+        if policy == FULL:
+            raise FullReloadNeeded("policy")
+
         ret = []
         user_modules = sys.modules.user_modules.get(str(module_file), [])
 
@@ -452,35 +524,121 @@ class UpdateModule(BaseAction):
             self.module_descriptor.post_execute()
         self.disable_pydev_warning()
 
-        trace = sys.gettrace()
-        sys.settrace(None)
-        module_python_obj = misc.import_from_file(self.module_descriptor.path, self.reloader.root.parent,
-                                                  module_name=self.module_descriptor.name)
-        sys.settrace(trace)
+        metrics = self.reloader.metrics
+        module_name = self.module_descriptor.name
+
+        path = self.module_descriptor.path
+
+        with metrics.span(MODULE_REEXEC, module=module_name):
+            # the file is read and parsed once, the same source is used by the descriptors and the snapshot
+            source = Source(path, self.reloader.source_overrides.get(str(path)))
+            with metrics.span(PRECHECK, module=module_name):
+                self.check_full_reload_needed(source)
+            code = compile(source.syntax, str(path), "exec", dont_inherit=True)
+
+            journal = self.reloader.journal
+            if journal.staging and not journal.is_shadowable():
+                # the module would see stale classes or methods, they are published before it's executed
+                self.reloader.logger.warning(f"Publishing changes of classes or lists before executing {module_name}, "
+                                             f"other threads can see a partial update")
+                self.reloader.publish()
+                journal.stage()
+            # modules changed earlier by a staged reload are imported with the staged writes applied
+            shadow_imports = journal.get_shadow_imports()
+
+            trace = sys.gettrace()
+            sys.settrace(None)
+            # nothing to install without shadow imports
+            with shadow_imports.installed() if shadow_imports else ExitStack():
+                module_python_obj = misc.import_from_file(path, self.reloader.root.parent,
+                                                          module_name=self.module_descriptor.name,
+                                                          code=code)
+            sys.settrace(trace)
+
+            if shadow_imports:
+                shadow_imports.unshadow(module_python_obj)
+
+        with metrics.span(TREE_BUILD, module=module_name):
+            new_module_descriptor = ModuleDescriptor(reloader=self.reloader,
+                                                     name=self.module_descriptor.name,
+                                                     path=path,
+                                                     body=module_python_obj,
+                                                     source=source)
+            new_module_descriptor.post_execute()
+
+        with metrics.span(DIFF, module=module_name):
+            actions = self.module_descriptor.module_obj.get_actions_for_update(new_module_descriptor.module_obj)
+            actions.sort(key=lambda a: a.priority, reverse=True)
+
+        with metrics.span(ACTION_APPLY, module=module_name):
+            for a in actions:
+                if isinstance(a, UpdateModule) and self.reloader.is_already_reloaded(a.module_descriptor):
+                    continue
 
-        new_module_descriptor = ModuleDescriptor(reloader=self.reloader,
+                a.pre_execute()
+                if not dry_run:
+                    with metrics.span(ACTION, action=repr(a)):
+                        a.execute()
+                        a.post_execute()
+
+        if self.reloader.journal.staging and not dry_run:
+            # the old module holds what the new tree describes once staged writes are published
+            self.reloader.after_publish.append(lambda: self.finish(new_module_descriptor, source, dry_run))
+        else:
+            self.finish(new_module_descriptor, source, dry_run)
+
+    def finish(self, new_module_descriptor: ModuleDescriptor, source: Source, dry_run: bool) -> None:
+        """
+        Replaces the module descriptor with one describing the updated module.
+        """
+        with self.reloader.metrics.span(TREE_BUILD, module=self.module_descriptor.name):
+            module_descriptor = ModuleDescriptor(self.reloader,
                                                  name=self.module_descriptor.name,
                                                  path=self.module_descriptor.path,
-                                                 body=module_python_obj)
-        new_module_descriptor.post_execute()
+                                                 body=self.module_descriptor.module_obj.python_obj,
+                                                 source=source)
+            # after applying the actions the old module holds what the new tree describes, so the new tree is reused
+            if dry_run or not new_module_descriptor.module_obj.rebase(module_descriptor):
+                module_descriptor.post_execute()
+            self.set_modules_descriptor(module_descriptor)
+
+    def check_full_reload_needed(self, source: Source) -> None:
+        """
+        Raises FullReloadNeeded for class changes known to need a full reload, before the module is executed.
+        Only syntax of the old and new source is compared.
+        """
+        from smartreloader.exceptions import FullReloadNeeded
+
+        old_flat_syntax = self.module_descriptor.source.flat_syntax
+
+        for name, node in source.flat_syntax.items():
+            old_node = old_flat_syntax.get(name)
+            if not isinstance(node, Source.Class) or not isinstance(old_node, Source.Class):
+                continue
 
-        actions = self.module_descriptor.module_obj.get_actions_for_update(new_module_descriptor.module_obj)
-        actions.sort(key=lambda a: a.priority, reverse=True)
+            if node.bases != old_node.bases:
+                raise FullReloadNeeded("class_mro_changed")
 
-        for a in actions:
-            if isinstance(a, UpdateModule) and self.reloader.is_already_reloaded(a.module_descriptor):
-                continue
+            if node.metaclass != old_node.metaclass:
+                raise FullReloadNeeded("class_metaclass_changed")
 
-            a.pre_execute()
-            if not dry_run:
-                a.execute()
-                a.post_execute()
+            if node.slots != old_node.slots:
+                raise FullReloadNeeded("class_slots_changed")
 
-        self.set_modules_descriptor(ModuleDescriptor(self.reloader,
-                                                     name=self.module_descriptor.name,
-                                                     path=self.module_descriptor.path,
-                                                     body=self.module_descriptor.module_obj.python_obj))
-        self.module_descriptor.post_execute()
+            meta = node.children.get("Meta")
+            old_meta = old_node.children.get("Meta")
+            if (meta or old_meta) and self.is_django_model(name):
+                # model options are processed once when the model class is created
+                if not meta or not old_meta or ast.dump(meta.content) != ast.dump(old_meta.content):
+                    raise FullReloadNeeded("model_meta_changed")
+
+    def is_django_model(self, name: str) -> bool:
+        obj = self.module_descriptor.body
+        for part in name.split("."):
+            obj = getattr(obj, part, None)
+
+        ret = type(getattr(obj, "_meta", None)).__module__ == "django.db.models.options"
+        return ret
 
     def rollback(self) -> None:
         self.set_modules_descriptor(self._module_descriptor_for_rollback)
@@ -532,6 +690,58 @@ class Module(ContainerObj):
         ret = id(obj) in [id(o.python_obj) for o in self.get_flat_repr().values()]
         return ret
 
+    def rebase(self, module_descriptor: "ModuleDescriptor") -> bool:
+        """
+        Moves the tree onto the body of another descriptor, objects are looked up by their names.
+        Returns False if the body doesn't match the tree, the tree is left untouched then.
+        """
+        matches: List[Tuple[Object, Any]] = []
+
+        # the whole tree is checked before anything is moved
+        if not self._match_children(self, module_descriptor.body, matches):
+            return False
+
+        self.python_obj = module_descriptor.body
+        self.flat = {}
+        self.python_obj_to_objs = defaultdict(list)
+
+        for child, python_obj in matches:
+            child.python_obj = python_obj
+            self.register_obj(child)
+
+        self.module_descriptor = module_descriptor
+        module_descriptor.module_obj = self
+        return True
+
+    def _match_children(self, obj: ContainerObj, python_obj: Any, matches: List[Tuple[Object, Any]]) -> bool:
+        """
+        Collects children of obj paired with their counterparts in python_obj.
+        """
+        def is_dunder(name: Any) -> bool:
+            return isinstance(name, str) and name.startswith("__") and name.endswith("__") and name != "__all__"
+
+        if isinstance(python_obj, (list, tuple)):
+            content = {str(i): o for i, o in enumerate(python_obj)}
+            names = set(content.keys())
+        else:
+            content = python_obj if isinstance(python_obj, dict) else python_obj.__dict__
+            names = {n for n, o in content.items() if not is_dunder(n) and not obj._is_child_ignored(n, o)}
+
+        # something the tree doesn't know about, like a deleted import left in the module
+        if names != {n for n in obj.children.keys() if not is_dunder(n)}:
+            return False
+
+        for n, child in obj.children.items():
+            if n not in content or type(content[n]) is not type(child.python_obj):
+                return False
+
+            matches.append((child, content[n]))
+
+            if isinstance(child, ContainerObj) and not self._match_children(child, content[n], matches):
+                return False
+
+        return True
+
     def register_obj(self, obj: Object) -> None:
         self.flat[obj.full_name] = obj
         self.python_obj_to_objs[id(obj.python_obj)].append(obj)
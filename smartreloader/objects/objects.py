@@ -19,6 +19,7 @@ from typing import (
 
 from dataclasses import dataclass
 
+from smartreloader import utils
 from smartreloader.objects.base_objects import FinalObj, BaseAction, Object, ContainerObj
 from smartreloader.exceptions import FullReloadNeeded
 from smartreloader.objects.modules import Module, Source
@@ -92,20 +93,10 @@ class Function(FinalObj):
     class Update(FinalObj.Update):
         obj: "Function"
         new_obj: Optional["Function"]
-        old_code: CodeType = field(init=False)
 
         def execute(self) -> None:
-            self.old_code = self.obj.get_func(
-                self.obj.python_obj
-            ).__code__
-
-            self.obj.get_func(
-                self.obj.python_obj
-            ).__code__ = self.new_obj.get_func(self.new_obj.python_obj).__code__
-
-        def rollback(self) -> None:
-            super().rollback()
-            self.obj.get_func(self.obj.python_obj).__code__ = self.old_code
+            self.reloader.journal.set_attr(self.obj.get_func(self.obj.python_obj), "__code__",
+                                           self.new_obj.get_func(self.new_obj.python_obj).__code__)
 
     @dataclass(repr=False)
     class Move(FinalObj.Update):
@@ -115,9 +106,6 @@ class Function(FinalObj):
         def execute(self) -> None:
             self.obj.update_first_line_number(self.new_obj.get_func(self.new_obj.python_obj).__code__.co_firstlineno)
 
-        def rollback(self) -> None:
-            super().rollback()
-
         def __repr__(self) -> str:
             return f"Move {repr(self.obj)}"
 
@@ -140,23 +128,20 @@ class Function(FinalObj):
                 else:
                     continue
 
+                frame = r if inspect.isframe(r) else None
                 for k, v in dictionary.items():
-                    if hasattr(v, "__func__") and v.__func__ is what:
-                        dictionary[k] = to_what
-                        self.rollback_operations.append(self.RollabackOperation(r, dictionary, k, v, self))
-
-                    if v is what:
-                        dictionary[k] = to_what
-                        self.rollback_operations.append(self.RollabackOperation(r, dictionary, k, v, self))
+                    if (hasattr(v, "__func__") and v.__func__ is what) or v is what:
+                        self.reloader.journal.set_item(dictionary, k, to_what, frame=frame)
 
                 # update frame
-                if inspect.isframe(r):
-                    self.apply_changes_to_frame(r)
+                if frame:
+                    utils.apply_changes_to_frame(frame)
 
         def execute(self) -> None:
             self.replace_obj(self.obj.python_obj, self.new_obj.python_obj)
             if hasattr(self.obj.python_obj, "__func__"):
                 self.replace_obj(self.obj.python_obj.__func__, self.new_obj.python_obj)
+            self.update_tree()
 
 
     @classmethod
@@ -298,7 +283,7 @@ class Function(FinalObj):
             *kwargs.values()
         )
 
-        func.__code__ = code
+        self.reloader.journal.set_attr(func, "__code__", code)
 
 
 @dataclass(repr=False)
@@ -360,16 +345,12 @@ class Class(ContainerObj):
         def execute(self, dry_run=False) -> None:
             source = dedent(self.obj.source)
 
-            if isinstance(self.parent, Class):
-                context = dict(self.parent.python_obj.__dict__)
-                exec(source, self.parent.module.python_obj.__dict__, context)
-                fixed_python_obj = context[self.obj.name]
-                self.obj.python_obj = fixed_python_obj
-                self.parent.set_attr(self.obj.name, fixed_python_obj)
-            else:
-                exec(source, self.parent.module.python_obj.__dict__)
-                fixed_python_obj = self.parent.module.python_obj.__dict__[self.obj.name]
-                self.obj.python_obj = fixed_python_obj
+            # executed into a separate namespace, the class is set through the journal like any other write
+            context = dict(self.parent.python_obj.__dict__) if isinstance(self.parent, Class) else {}
+            exec(source, self.parent.module.python_obj.__dict__, context)
+            fixed_python_obj = context[self.obj.name]
+            self.obj.python_obj = fixed_python_obj
+            self.parent.set_attr(self.obj.name, fixed_python_obj)
 
             self.parent.module.register_obj(self.obj)
 
@@ -401,7 +382,7 @@ class Class(ContainerObj):
         if [c.__name__ for c in self.python_obj.__mro__] == [c.__name__ for c in new_obj.python_obj.__mro__]:
             return super().get_actions_for_update(new_obj)
         else:
-            raise FullReloadNeeded()
+            raise FullReloadNeeded("class_mro_changed")
 
     def _python_obj_to_obj_classes(
         self, name: str, obj: Any
@@ -427,7 +408,7 @@ class Method(Function):
             fun, code = self.obj.get_fixed_fun(self.obj, self.parent)
             self.obj.python_obj = fun
             self.obj.python_obj.__code__ = code
-            setattr(self.parent.python_obj, self.obj.name, self.obj.python_obj)
+            self.parent.set_attr(self.obj.name, self.obj.python_obj)
 
     class Update(Function.Update):
         obj: "Method"
@@ -435,10 +416,8 @@ class Method(Function):
         parent: "Class"
 
         def execute(self) -> None:
-            self.old_code = self.obj.get_func(self.obj.python_obj).__code__
-
             fun, code = self.new_obj.get_fixed_fun(self.obj, self.parent)
-            self.obj.get_func(self.obj.python_obj).__code__ = code
+            self.reloader.journal.set_attr(self.obj.get_func(self.obj.python_obj), "__code__", code)
 
     @classmethod
     def get_rank(cls) -> int:
@@ -582,10 +561,10 @@ class Dictionary(ContainerObj):
         return self.python_obj
 
     def set_attr(self, name: str, obj: "Any") -> None:
-        self.python_obj[name] = obj
+        self.reloader.journal.set_item(self.python_obj, name, obj)
 
     def del_attr(self, name: str) -> None:
-        del self.python_obj[name]
+        self.reloader.journal.del_item(self.python_obj, name)
 
 
 @dataclass(repr=False)
@@ -685,7 +664,7 @@ class Import(FinalObj):
     class Add(FinalObj.Add):
         def execute(self) -> None:
             module = sys.modules.get(self.obj.name, self.obj.python_obj)
-            setattr(self.parent.python_obj, self.obj.name, module)
+            self.parent.set_attr(self.obj.name, module)
 
     @classmethod
     def is_candidate(cls, name: str, obj: Any, potential_parent: "ContainerObj") -> bool:
@@ -747,13 +726,10 @@ class Iterable(ContainerObj, ABC):
         obj: "ListObj"
         new_obj: Optional["ListObj"]
         parent: "ContainerObj"
-        original_content: list
 
         def execute(self) -> None:
-            self.original_content = self.obj.python_obj[:]
-            self.obj.python_obj.clear()
             self.new_obj.fix_reference(self.obj.module)
-            self.obj.python_obj.extend(self.new_obj.python_obj)
+            self.reloader.journal.set_content(self.obj.python_obj, self.new_obj.python_obj)
 
     def collect_children(self) -> None:
         for i, o in enumerate(self.python_obj):
@@ -771,14 +747,6 @@ class Iterable(ContainerObj, ABC):
 class ListObj(Iterable):
     python_obj: list
 
-    class Update(Iterable.Update):
-        original_content: list
-
-        def rollback(self) -> None:
-            super().rollback()
-            self.obj.python_obj.clear()
-            self.obj.python_obj.extend(self.original_content)
-
     def fix_reference(self, module: "Module") -> Any:
         self.python_obj.clear()
         ret = []
@@ -1,4 +1,6 @@
 import sys
+import threading
+import traceback
 from abc import ABC
 from collections import defaultdict
 from copy import copy
@@ -9,21 +11,26 @@ from pathlib import Path
 from types import ModuleType
 from typing import (
     Any,
+    Callable,
     DefaultDict,
     Dict,
     List,
     Optional,
     Set,
     Tuple,
-    Type, )
+    Type,
+    Union, )
 
 from . import dependency_watcher, objects, sr_logger
 from smartreloader.objects.base_objects import Object, BaseAction
 
-from .config import BaseConfig
+from .config import FULL, IGNORE, BaseConfig, PolicyMatcher
+from .exceptions import FullReloadNeeded
+from .journal import Journal
+from .metrics import ACTION, DEPENDENCY_COLLECTION, DEPENDENT_CASCADE, PUBLISH, NullMetrics, ReloadMetrics
 
 
-__all__ = ["PartialReloader"]
+__all__ = ["PartialReloader", "ReloadResult"]
 
 from smartreloader.objects.modules import ModuleDescriptor, Modules, UpdateModule, Module
 from .sr_logger import SRLogger
@@ -36,6 +43,54 @@ class Dependency:
     objs: Set[Tuple[str, int]]  # name, id
 
 
+@dataclass
+class CommittedAction:
+    """
+    Applied action of a committed reload.
+    """
+    description: str
+
+    def __repr__(self) -> str:
+        return self.description
+
+
+@dataclass
+class ReloadResult:
+    files: List[Path]
+    # "hot", "full" or "rollback", nothing is applied on full and rollback
+    outcome: str
+    actions: List[str]
+    metrics: ReloadMetrics
+    dry_run: bool = False
+    # files that are not imported by the application, those are skipped
+    not_imported: List[Path] = field(default_factory=list)
+    # files skipped by the "ignore" reload policy
+    ignored: List[Path] = field(default_factory=list)
+    full_reload_cause: Optional[str] = None
+    error: Optional[str] = None
+    # seconds other threads were paused by each publish of a staged reload, see BaseConfig.staged_reloads
+    publish_pauses: List[float] = field(default_factory=list)
+
+    @property
+    def full_reload_needed(self) -> bool:
+        return self.outcome == "full"
+
+    def to_dict(self) -> Dict[str, Any]:
+        ret = {
+            "files": [str(f) for f in self.files],
+            "outcome": self.outcome,
+            "actions": self.actions,
+            "dry_run": self.dry_run,
+            "not_imported": [str(f) for f in self.not_imported],
+            "ignored": [str(f) for f in self.ignored],
+            "full_reload_cause": self.full_reload_cause,
+            "error": self.error,
+            "publish_pauses": self.publish_pauses,
+            "metrics": self.metrics.to_dict(),
+        }
+        return ret
+
+
 @dataclass
 class ObjectClassesManager:
     reloader: "PartialReloader"
@@ -88,17 +143,31 @@ class PartialReloader:
                                                               default_factory=lambda: defaultdict(set))
 
     config: Optional["BaseConfig"] = BaseConfig()
-    applied_actions: List[BaseAction] = field(init=False, default_factory=list)
+    applied_actions: List[Union[BaseAction, CommittedAction]] = field(init=False, default_factory=list)
     modules_out_of_sync: List[Module] = field(init=False, default_factory=list)
     modules: Modules = field(init=False)
     object_classes_manager: ObjectClassesManager = field(init=False)
     plugins: List[ModuleType] = field(init=False, default_factory=list)
+    # metrics of the current reload, actions executed outside of a reload record nothing
+    metrics: ReloadMetrics = field(init=False, default_factory=lambda: NullMetrics(Path(".")))
+    # reloads can be requested from any thread, see reload_files
+    lock: threading.RLock = field(init=False, default_factory=threading.RLock)
+    # file -> source used instead of the file content while reloading, see reload_files
+    source_overrides: Dict[str, bytes] = field(init=False, default_factory=dict)
+    policies: PolicyMatcher = field(init=False)
+    # previous values of everything the last reload wrote, restored on rollback
+    journal: Journal = field(init=False, default_factory=Journal)
+    # run once staged writes are published, see BaseConfig.staged_reloads
+    after_publish: List[Callable[[], None]] = field(init=False, default_factory=list)
+    # seconds other threads were paused by each publish of the last reload
+    publish_pauses: List[float] = field(init=False, default_factory=list)
 
     def __post_init__(self) -> None:
         self.root = self.root.resolve()
         self.logger.debug(f"Creating partial reloader for {self.root}")
 
         self.object_classes_manager = ObjectClassesManager(self)
+        self.policies = PolicyMatcher(self.root, self.config.reload_policies)
 
         dependency_watcher.post_module_exec_hook = self.post_module_exec_hook
 
@@ -124,6 +193,9 @@ class PartialReloader:
         self.named_obj_to_modules = defaultdict(set)
         self.obj_to_modules = defaultdict(set)
         self.applied_actions = []
+        self.journal.clear()
+        self.after_publish = []
+        self.publish_pauses = []
 
     def is_already_reloaded(self, module_descr: ModuleDescriptor) -> bool:
         module_update_actions = [
@@ -161,37 +233,169 @@ class PartialReloader:
 
         pass
 
-    def _reload_module(self, module_file: Path, dry_run=False) -> None:
-        actions = UpdateModule.factory(reloader=self, module_file=module_file, dry_run=dry_run)
+    def _reload_module(self, module_file: Path, dry_run=False, policy: Optional[str] = None) -> None:
+        actions = UpdateModule.factory(reloader=self, module_file=module_file, dry_run=dry_run, policy=policy)
 
         for a in actions:
             a.pre_execute()
-            a.execute(dry_run)
+            with self.metrics.span(ACTION, action=repr(a)):
+                a.execute(dry_run)
+
+    def _reload_dependents(self, dry_run=False) -> None:
+        with self.metrics.span(DEPENDENT_CASCADE):
+            while self.modules_out_of_sync:
+                m = self.modules_out_of_sync.pop(0)
+
+                if m.already_updated(self.applied_actions):
+                    continue
+
+                self._reload_module(m.module_descriptor.path, dry_run)
+
+    def _stage(self, dry_run: bool) -> None:
+        if self.config.staged_reloads and not dry_run:
+            self.journal.stage()
 
-    def reload(self, module_file: Path, dry_run=False) -> None:
+    def publish(self) -> None:
         """
-        :return: True if succeded False i unable to reload
+        Applies writes staged so far at once, see BaseConfig.staged_reloads. Staging stops.
         """
-        self.reset()
-        self._collect_all_dependencies()
+        if not self.journal.staging:
+            return
+
+        writes = len(self.journal.staged)
+        max_pause = self.config.max_publish_pause
+        start, end = self.journal.publish(max_pause)
+        pause = end - start
+        self.metrics.add_span(PUBLISH, start, end, writes=writes)
+        self.publish_pauses.append(pause)
+
+        if pause > max_pause:
+            self.logger.warning(f"Publishing {writes} writes took {pause * 1000:.1f}ms, longer than "
+                                f"{max_pause * 1000:.1f}ms, other threads might have seen a partial update")
+
+        callbacks, self.after_publish = self.after_publish, []
+        for c in callbacks:
+            c()
+
+    def is_file_reloaded(self, module_file: Path) -> bool:
+        for a in self.applied_actions:
+            if isinstance(a, UpdateModule) and a.module_descriptor.path == module_file:
+                return True
 
-        self._reload_module(module_file, dry_run)
+        return False
 
-        while self.modules_out_of_sync:
-            m = self.modules_out_of_sync.pop(0)
+    def reload(self, module_file: Path, dry_run=False, metrics: Optional[ReloadMetrics] = None,
+               policy: Optional[str] = None) -> None:
+        """
+        :param metrics: collects timing spans of the reload, a new one is created if not given
+        :param policy: reload policy of the file if already resolved, see BaseConfig.reload_policies
+        :return: True if succeded False i unable to reload
+        """
+        with self.lock:
+            self.metrics = metrics or ReloadMetrics(module_file)
+            self.reset()
 
-            if m.already_updated(self.applied_actions):
-                continue
+            with self.metrics.span(DEPENDENCY_COLLECTION):
+                self._collect_all_dependencies()
 
-            self._reload_module(m.module_descriptor.path, dry_run)
+            self._stage(dry_run)
+            self._reload_module(module_file, dry_run, policy)
+            self._reload_dependents(dry_run)
+            self.publish()
 
         # stack = Stack(logger=self.logger, module_file=module_file, reloader=self)
         # stack.update()
 
+    def reload_files(self, paths: List[Path], dry_run=False, metrics: Optional[ReloadMetrics] = None,
+                     sources: Optional[Dict[Path, bytes]] = None) -> ReloadResult:
+        """
+        Reloads changed files as one batch, dependencies are collected and dependent modules reloaded once.
+        Doesn't raise, on failure applied actions are rolled back and the outcome is set accordingly.
+        Dry runs are always rolled back. Safe to call from any thread.
+
+        :param metrics: collects timing spans of the reload, finished by the caller if given
+        :param sources: source of files (for example unsaved editor buffers) used instead of reading them from disk
+        """
+        paths = [Path(p).absolute() for p in paths]
+
+        with self.lock:
+            self.metrics = metrics or ReloadMetrics(paths[0] if len(paths) == 1 else self.root)
+            self.reset()
+            self.source_overrides = {str(Path(p).absolute()): raw for p, raw in (sources or {}).items()}
+            modules_out_of_sync = list(self.modules_out_of_sync)
+
+            ret = ReloadResult(files=paths, outcome="hot", actions=[], metrics=self.metrics, dry_run=dry_run)
+
+            try:
+                policies = {p: self.policies.get(p) for p in paths}
+                ret.ignored = [p for p in paths if policies[p] == IGNORE]
+                if FULL in policies.values():
+                    raise FullReloadNeeded("policy")
+
+                with self.metrics.span(DEPENDENCY_COLLECTION):
+                    self._collect_all_dependencies()
+
+                self._stage(dry_run)
+
+                for p in paths:
+                    if p in ret.ignored:
+                        continue
+
+                    if str(p) not in self.modules.user_modules:
+                        ret.not_imported.append(p)
+                        continue
+
+                    # already reloaded as a dependent of a file earlier in the batch
+                    if self.is_file_reloaded(p):
+                        continue
+
+                    self._reload_module(p, dry_run, policies[p])
+
+                self._reload_dependents(dry_run)
+                self.publish()
+            except FullReloadNeeded as e:
+                ret.outcome = "full"
+                ret.full_reload_cause = e.cause
+            except Exception:
+                ret.outcome = "rollback"
+                ret.error = traceback.format_exc(limit=-1)
+
+            ret.actions = [repr(a) for a in self.applied_actions]
+            ret.publish_pauses = list(self.publish_pauses)
+
+            if ret.outcome != "hot" or dry_run:
+                self.rollback()
+
+            if dry_run:
+                # modules are not changed by a dry run
+                self.modules_out_of_sync = modules_out_of_sync
+
+            self.source_overrides = {}
+
+            if not metrics:
+                self.metrics.finish(ret.outcome)
+
+        return ret
+
+    def commit(self) -> None:
+        """
+        Releases state of the last reload so old object trees, referrers and frames don't outlive it.
+        Applied actions are replaced by their descriptions, the reload can't be rolled back afterwards.
+        """
+        with self.lock:
+            self.applied_actions = [CommittedAction(repr(a)) for a in self.applied_actions]
+            self.journal.clear()
+            self.named_obj_to_modules = defaultdict(set)
+            self.obj_to_modules = defaultdict(set)
+
     def rollback(self) -> None:
-        for a in reversed(self.applied_actions):
-            if isinstance(a, UpdateModule):
-                self.modules_out_of_sync.append(a.module_descriptor.module_obj)
-            a.rollback()
+        with self.lock:
+            self.journal.restore()
+            self.after_publish = []
+
+            for a in reversed(self.applied_actions):
+                if isinstance(a, UpdateModule):
+                    self.modules_out_of_sync.append(a.module_descriptor.module_obj)
+                a.rollback()
 
-        self.modules_out_of_sync.reverse()
+            self.modules_out_of_sync.reverse()
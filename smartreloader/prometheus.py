@@ -0,0 +1,269 @@
+"""
+Minimal Prometheus text format exporter served on localhost from the reloaded process.
+"""
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+from socketserver import ThreadingMixIn
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from smartreloader import metrics
+from smartreloader.metrics import ReloadMetrics
+
+__all__ = ["Counter", "Gauge", "Histogram", "Registry", "MetricsServer", "ReloaderExporter", "STATE_FILE_ENV"]
+
+# set by the entrypoint so that counters survive restarts of the reloaded process
+STATE_FILE_ENV = "SMART_RELOADER_METRICS_STATE"
+
+
+Labels = Tuple[Tuple[str, str], ...]
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Metric:
+    type: str
+
+    def __init__(self, name: str, documentation: str) -> None:
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError()
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str) -> None:
+        super().__init__(name, documentation)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels: str) -> float:
+        return self._values.get(tuple(sorted(labels.items())), 0.0)
+
+    def dump(self) -> List[Tuple[Dict[str, str], float]]:
+        with self._lock:
+            return [(dict(k), v) for k, v in self._values.items()]
+
+    def load(self, values: List[Tuple[Dict[str, str], float]]) -> None:
+        for labels, value in values:
+            self.inc(value, **labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(k)} {_format_value(v)}" for k, v in values]
+
+
+class Gauge(Metric):
+    """
+    Gauge evaluated on every scrape.
+    """
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, function: Callable[[], Optional[float]]) -> None:
+        super().__init__(name, documentation)
+        self.function = function
+
+    def samples(self) -> List[str]:
+        value = self.function()
+        if value is None:
+            return []
+        return [f"{self.name} {_format_value(value)}"]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, documentation)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        # labels -> (bucket counts, sum)
+        self._values: Dict[Labels, Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = [(k, list(c), s) for k, (c, s) in self._values.items()]
+
+        ret = []
+        for labels, counts, total in values:
+            for b, c in zip(self.buckets, counts):
+                ret.append(f"{self.name}_bucket{_format_labels(labels + (('le', _format_value(b)),))} {c}")
+            ret.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            ret.append(f"{self.name}_count{_format_labels(labels)} {counts[-1]}")
+
+        return ret
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: List[Metric] = []
+
+    def add(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        ret = "\n".join(m.render() for m in self.metrics) + "\n"
+        return ret
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """
+    http.server.ThreadingHTTPServer is not available on python 3.6.
+    """
+
+
+class MetricsServer:
+    """
+    Serves registry on http://127.0.0.1:<port>/metrics from a daemon thread.
+    """
+
+    def __init__(self, registry: Registry, port: int) -> None:
+        self.registry = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+
+                content = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.setDaemon(True)
+
+    @property
+    def port(self) -> int:
+        return self.server.server_address[1]
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class ReloaderExporter:
+    """
+    Reloader metrics.
+    Reload counters are kept in state_file when given, full reloads restart the process and would reset them.
+    """
+
+    def __init__(self, watched_dirs: Callable[[], Optional[float]], watched_files: Callable[[], Optional[float]],
+                 objects: Callable[[], Optional[float]], state_file: Optional[Path] = None) -> None:
+        self.registry = Registry()
+        self.state_file = state_file
+
+        self.reloads = self.registry.add(Counter("smartreloader_reloads_total",
+                                                 "Reloads by outcome (hot, full, rollback)"))
+        self.full_reloads = self.registry.add(Counter("smartreloader_full_reloads_total",
+                                                      "Full reloads by cause"))
+        self.reload_duration = self.registry.add(Histogram("smartreloader_reload_duration_seconds",
+                                                           "Reload latency by outcome"))
+        self.phase_duration = self.registry.add(Histogram("smartreloader_reload_phase_duration_seconds",
+                                                          "Time spent in reload phases"))
+        self.heap_scan_duration = self.registry.add(Histogram("smartreloader_heap_scan_duration_seconds",
+                                                              "Duration of referrer heap scans"))
+        self.registry.add(Gauge("smartreloader_watched_directories", "Number of watched directories",
+                                watched_dirs))
+        self.registry.add(Gauge("smartreloader_watched_files", "Number of watched files (polling only)",
+                                watched_files))
+        self.registry.add(Gauge("smartreloader_objects", "Number of objects in object trees of user modules",
+                                objects))
+
+        self.load_state()
+
+    @property
+    def persisted(self) -> Dict[str, Counter]:
+        return {"reloads": self.reloads, "full_reloads": self.full_reloads}
+
+    def load_state(self) -> None:
+        if not self.state_file or not self.state_file.exists():
+            return
+
+        try:
+            state = json.loads(self.state_file.read_text())
+        except (OSError, ValueError):
+            return
+
+        for name, counter in self.persisted.items():
+            counter.load(state.get(name, []))
+
+    def save_state(self) -> None:
+        if not self.state_file:
+            return
+
+        state = {name: counter.dump() for name, counter in self.persisted.items()}
+        tmp_file = self.state_file.with_name(self.state_file.name + ".tmp")
+        tmp_file.write_text(json.dumps(state))
+        os.replace(str(tmp_file), str(self.state_file))
+
+    def observe(self, reload_metrics: ReloadMetrics) -> None:
+        self.reloads.inc(outcome=reload_metrics.outcome or "unknown")
+        self.reload_duration.observe(reload_metrics.total, outcome=reload_metrics.outcome or "unknown")
+
+        for phase, duration in reload_metrics.phases.items():
+            if phase == metrics.HEAP_SCAN:
+                continue
+            self.phase_duration.observe(duration, phase=phase)
+
+        for s in reload_metrics.spans:
+            if s.name == metrics.HEAP_SCAN:
+                self.heap_scan_duration.observe(s.duration)
+
+    def full_reload(self, cause: str) -> None:
+        self.full_reloads.inc(cause=cause)
+        self.save_state()
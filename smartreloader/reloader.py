@@ -1,3 +1,4 @@
+import cProfile
 import errno
 import logging
 import os
@@ -5,29 +6,36 @@ import signal
 import sys
 import threading
 import traceback
+from contextlib import contextmanager
+from functools import partial
 from logging import getLogger
 from pathlib import Path
 from threading import Thread
-from time import sleep
-from typing import TYPE_CHECKING, Callable, List, Deque
+from time import monotonic, perf_counter
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Deque, Optional, Set
 
 import watchdog.observers.inotify_buffer
 from dataclasses import dataclass
 from globmatch import glob_match
 from watchdog.events import FileSystemEvent, FileSystemEventHandler, EVENT_TYPE_MODIFIED, EVENT_TYPE_CREATED, EVENT_TYPE_DELETED, EVENT_TYPE_MOVED
+from watchdog.events import FileCreatedEvent, FileDeletedEvent, FileModifiedEvent
 from watchdog.observers import Observer
 
-from smartreloader import PartialReloader
+from smartreloader import PartialReloader, ReloadResult, dependency_watcher
+from smartreloader.control import ControlServer
+from smartreloader.metrics import EVENT_RECEIVED, LOGGING, ReloadMetrics
+from smartreloader.prometheus import STATE_FILE_ENV, MetricsServer, ReloaderExporter
 from smartreloader.sr_logger import SRLogger
-from smartreloader.misc import is_linux
+from smartreloader.stat_poller import StatPoller
+from smartreloader.misc import is_linux, iter_dirs
 from smartreloader.exceptions import FullReloadNeeded
-from smartreloader.config import BaseConfig
+from smartreloader.config import FULL, IGNORE, BaseConfig
 
-from collections import deque, defaultdict
+from collections import Counter, OrderedDict, deque
 
 
 if TYPE_CHECKING:
-    ...
+    from watchdog.observers.inotify_c import Inotify, InotifyEvent
 
 
 def int_signal_handler(sig, frame):
@@ -46,21 +54,60 @@ class Watchdog(FileSystemEventHandler):
         on_moved_file: Callable
 
     _unprocessed_events: Deque[FileSystemEvent]
+    _closed_files: Set[str]
     _callbacks: Callbacks
-
-    def __init__(self, root: Path, watched_paths: List[str], ignored_paths: List[str], callbacks: Callbacks):
+    _imported_files: Set[str]
+    _imported_dirs: Set[str]
+    _inotify: Optional["Inotify"]
+    _first_event_at: Optional[float]
+    watch_count: int
+    # perf_counter time of the first event of the last drained batch
+    batch_received_at: Optional[float]
+
+    def __init__(self, root: Path, watched_paths: List[str], ignored_paths: List[str], callbacks: Callbacks,
+                 logger: SRLogger, imported_only: bool = False, debounce_max: float = 0.2,
+                 debounce_quiet_time: float = 0.01, polling: bool = False, polling_interval: float = 0.5, polling_batch_size: int = 100):
         self.root = root
         self._watched_paths = watched_paths
         self._ignored_paths = ignored_paths
+        self.logger = logger
+        self.imported_only = imported_only
+        self.debounce_max = debounce_max
+        # how long the debounce waits for further events before the batch is considered complete
+        self.debounce_quiet_time = debounce_quiet_time
+        self.watch_count = 0
 
         super().__init__()
 
         self._callbacks = callbacks
         self._unprocessed_events = deque()
+        self._closed_files = set()
+        self._events_lock = threading.Lock()
+        self._first_event_at = None
+        self.batch_received_at = None
+
+        self._imported_files = set()
+        self._imported_dirs = set()
+        self._inotify = None
+        self._lock = threading.Lock()
+
+        self.poller = None
+        if polling:
+            self.poller = StatPoller(self.root, ignored_paths=self._ignored_paths,
+                                     matches=self.matches_absolute,
+                                     on_event=self.dispatch,
+                                     imported_only=self.imported_only,
+                                     interval=polling_interval,
+                                     batch_size=polling_batch_size)
+
+        if self.imported_only:
+            for f in dependency_watcher.import_order:
+                self.add_module(f)
+            dependency_watcher.new_module_hook = self.add_module
 
         self.observer = Observer()
         self.observer.setDaemon(True)
-        self.observer.schedule(self, str(self.root), recursive=True)
+        self.observer.schedule(self, str(self.root), recursive=not self.imported_only)
         watchdog.observers.inotify_buffer.logger.setLevel("INFO")
         self.new_event = threading.Event()
 
@@ -68,66 +115,241 @@ class Watchdog(FileSystemEventHandler):
         self.producer.setDaemon(True)
 
     def on_any_event(self, event: FileSystemEvent):
-        path = Path(event.src_path)
-
-        if not self.matches(path):
+        if not self.event_matches(event):
             return
 
-        self._unprocessed_events.append(event)
+        with self._events_lock:
+            if self._first_event_at is None:
+                self._first_event_at = perf_counter()
+            self._unprocessed_events.append(event)
+
         self.new_event.set()
 
+    def add_module(self, module_file: str) -> None:
+        """
+        Starts watching an imported module (imported only mode).
+        """
+        module_file = os.path.abspath(module_file)
+
+        if self.root not in Path(module_file).parents:
+            return
+
+        if not self.matches(Path(module_file).relative_to(self.root)):
+            return
+
+        with self._lock:
+            self._imported_files.add(module_file)
+
+            # the poller tracks files, not directories
+            if self.poller:
+                self.poller.add_file(module_file)
+
+            directory = os.path.dirname(module_file)
+            if directory in self._imported_dirs:
+                return
+
+            self._imported_dirs.add(directory)
+
+            if not self.poller and self._inotify:
+                self._inotify.add_watch(os.fsencode(directory))
+                self.watch_count += 1
+
     def matches(self, path: Path) -> bool:
         return not glob_match(str(path), self._ignored_paths) and glob_match(
             str(path), self._watched_paths
         )
 
-    def remove_duplicate_events(self) -> None:
-        ret = deque()
-        file_to_events = defaultdict(list)
+    def matches_absolute(self, path: Optional[str]) -> bool:
+        if not path or self.root not in Path(path).parents:
+            return False
 
-        type_events_order = [EVENT_TYPE_CREATED, EVENT_TYPE_DELETED, EVENT_TYPE_MOVED, EVENT_TYPE_MODIFIED]
+        ret = self.matches(Path(path).relative_to(self.root))
+        return ret
 
-        for e in self._unprocessed_events:
-            file_to_events[e.src_path].append(e)
+    def event_matches(self, event: FileSystemEvent) -> bool:
+        if self.matches_absolute(event.src_path):
+            return True
 
-        for k in file_to_events.keys():
-            events = file_to_events[k]
-            events.sort(key=lambda x: type_events_order.index(x.event_type))
-            ret.append(events[0])
+        ret = event.event_type == EVENT_TYPE_MOVED and self.matches_absolute(event.dest_path)
+        return ret
 
-        self._unprocessed_events = ret
+    def coalesce_events(self, events: List[FileSystemEvent]) -> List[FileSystemEvent]:
+        """
+        Merges events of one batch into a single event per file.
+        Editors often save atomically by renaming a temporary file over the original or by deleting
+        and recreating it. Such sequences end up as a plain modification.
+        """
+        file_to_event_types = OrderedDict()
+        moves = []
+
+        for e in events:
+            if e.event_type != EVENT_TYPE_MOVED:
+                file_to_event_types.setdefault(e.src_path, []).append(e.event_type)
+                continue
+
+            src_matches = self.matches_absolute(e.src_path)
+            dest_matches = self.matches_absolute(e.dest_path)
+
+            # renamed from one watched file to another one
+            if src_matches and dest_matches:
+                moves.append(e)
+                continue
+
+            # backup rename (file.py -> file.py~)
+            if src_matches:
+                file_to_event_types.setdefault(e.src_path, []).append(EVENT_TYPE_DELETED)
+
+            # temporary file renamed over the original
+            if dest_matches:
+                file_to_event_types.setdefault(e.dest_path, []).append(EVENT_TYPE_MODIFIED)
+
+        ret = []
+        for path, event_types in file_to_event_types.items():
+            first = event_types[0]
+            last = event_types[-1]
+
+            if last == EVENT_TYPE_DELETED:
+                # a temporary file
+                if first == EVENT_TYPE_CREATED:
+                    continue
+                ret.append(FileDeletedEvent(path))
+            elif first == EVENT_TYPE_CREATED and EVENT_TYPE_DELETED not in event_types:
+                ret.append(FileCreatedEvent(path))
+            else:
+                ret.append(FileModifiedEvent(path))
 
-    def events_producer(self) -> None:
-        while True:
-            self.new_event.wait()
-            # wait a bit for more events
-            sleep(0.05)
+        ret.extend(moves)
+        return ret
+
+    def on_inotify_events(self, events: List["InotifyEvent"]) -> None:
+        """
+        Tracks which files are closed after writing (linux only).
+        Called from the inotify thread before events reach the observer so the state is always up to date.
+        Modified events are not counted, watchdog drops repeated ones so counts wouldn't match.
+        """
+        closed = False
+
+        with self._events_lock:
+            for e in events:
+                if e.is_directory:
+                    continue
+
+                path = os.fsdecode(e.src_path)
+                if self.imported_only and path not in self._imported_files:
+                    continue
+                if not self.matches_absolute(path):
+                    continue
+
+                if e.is_close_write:
+                    self._closed_files.add(path)
+                    closed = True
+                elif e.is_modify or e.is_create or e.is_attrib:
+                    self._closed_files.discard(path)
+
+        if closed:
+            self.new_event.set()
+
+    def is_batch_complete(self) -> bool:
+        with self._events_lock:
+            events = list(self._unprocessed_events)
+            if not events:
+                return False
+
+            for e in events:
+                # might be followed by recreating the file
+                if e.event_type == EVENT_TYPE_DELETED:
+                    return False
+                if e.event_type == EVENT_TYPE_MOVED and not self.matches_absolute(e.dest_path):
+                    return False
+                if e.event_type not in (EVENT_TYPE_MODIFIED, EVENT_TYPE_CREATED):
+                    continue
+                if e.src_path not in self._closed_files:
+                    return False
 
-            self.remove_duplicate_events()
+        return True
 
-            if len(self._unprocessed_events) > 1:
-                self._callbacks.on_multiple_files_at_once()
+    def debounce(self) -> None:
+        """
+        Waits until the batch of events is complete.
+        Returns immediately when all changed files are closed after writing, otherwise waits as long as new events
+        keep arriving, but no longer than debounce_max.
+        """
+        started = monotonic()
 
-            event = self._unprocessed_events.pop()
-            if event.event_type == EVENT_TYPE_MODIFIED:
-                self._callbacks.on_modify(event)
-            elif event.event_type == EVENT_TYPE_DELETED:
-                self._callbacks.on_delete_file(event)
-            elif event.event_type == EVENT_TYPE_CREATED:
-                self._callbacks.on_new_file(event)
-            elif event.event_type == EVENT_TYPE_MOVED:
-                self._callbacks.on_moved_file(event)
+        while not self.is_batch_complete():
+            remaining = self.debounce_max - (monotonic() - started)
+            if remaining <= 0:
+                return
 
             self.new_event.clear()
+            if self.is_batch_complete():
+                return
 
-            if not self.observer.is_alive():
+            if not self.new_event.wait(min(self.debounce_quiet_time, remaining)):
+                return
+
+    def drain_events(self) -> List[FileSystemEvent]:
+        ret = []
+        with self._events_lock:
+            while self._unprocessed_events:
+                ret.append(self._unprocessed_events.popleft())
+
+            self.batch_received_at = self._first_event_at
+            self._first_event_at = None
+
+        ret = self.coalesce_events(ret)
+        return ret
+
+    def process_events(self, events: List[FileSystemEvent]) -> None:
+        if len(events) > 1:
+            self._callbacks.on_multiple_files_at_once(events)
+            return
+
+        event = events[0]
+        if event.event_type == EVENT_TYPE_MODIFIED:
+            self._callbacks.on_modify(event)
+        elif event.event_type == EVENT_TYPE_DELETED:
+            self._callbacks.on_delete_file(event)
+        elif event.event_type == EVENT_TYPE_CREATED:
+            self._callbacks.on_new_file(event)
+        elif event.event_type == EVENT_TYPE_MOVED:
+            self._callbacks.on_moved_file(event)
+
+    def events_producer(self) -> None:
+        while True:
+            self.new_event.wait()
+            self.debounce()
+
+            # cleared before draining, so events added after the drain are picked up by the next wait
+            self.new_event.clear()
+            events = self.drain_events()
+            if events:
+                self.process_events(events)
+
+            if not self.is_alive():
                 return
 
     def flush(self) -> None:
         self.observer.event_queue.queue.clear()
         self._unprocessed_events.clear()
+        self._closed_files.clear()
+        self._first_event_at = None
+
+    def is_alive(self) -> bool:
+        if self.poller:
+            return self.poller.is_alive()
+
+        return self.observer.is_alive()
 
     def start(self) -> None:
+        if self.poller:
+            self.poller.seed()
+            self.watch_count = self.poller.files_count
+            self.logger.info(f"Polling {self.poller.files_count} files in {self.poller.dirs_count} directories")
+            self.poller.start()
+            self.producer.start()
+            return
+
         if is_linux():
 
             def _add_dir_watch(self2, path, recursive, mask):
@@ -144,31 +366,152 @@ class Watchdog(FileSystemEventHandler):
                 """
                 if not os.path.isdir(path):
                     raise OSError(errno.ENOTDIR, os.strerror(errno.ENOTDIR), path)
-                self2._add_watch(path, mask)
-                if recursive:
-                    self.walk_dirs(on_match=lambda p: self2._add_watch(p, mask))
 
-            from watchdog.observers.inotify_c import Inotify
+                mask |= InotifyConstants.IN_CLOSE_WRITE
+                self2._event_mask = mask
+
+                with self._lock:
+                    dirs = [path]
+                    if self.imported_only:
+                        dirs.extend(os.fsencode(d) for d in sorted(self._imported_dirs) if os.fsencode(d) != path)
+                    elif recursive:
+                        dirs.extend(os.fsencode(d) for d in self.walk_dirs(os.fsdecode(path)))
+
+                    for d in dirs:
+                        self2._add_watch(d, mask)
+
+                    self._inotify = self2
+                    self.watch_count = len(dirs)
+
+                self.logger.info(f"Watching {self.watch_count} directories")
+
+            from watchdog.observers.inotify_c import DEFAULT_EVENT_BUFFER_SIZE, Inotify, InotifyConstants, InotifyEvent
+
+            def _read_events(self2, event_buffer_size=DEFAULT_EVENT_BUFFER_SIZE):
+                """
+                Reads events from inotify and returns them.
+                Same as in watchdog except directories created at runtime, see watch_new_dir.
+                """
+                event_buffer = None
+                while True:
+                    try:
+                        event_buffer = os.read(self2._inotify_fd, event_buffer_size)
+                    except OSError as e:
+                        if e.errno == errno.EINTR:
+                            continue
+                    break
+
+                with self2._lock:
+                    ret = []
+                    for wd, mask, cookie, name in Inotify._parse_event_buffer(event_buffer):
+                        if wd == -1:
+                            continue
+                        wd_path = self2._path_for_wd[wd]
+                        src_path = os.path.join(wd_path, name) if name else wd_path  # avoid trailing slash
+                        inotify_event = InotifyEvent(wd, mask, cookie, name, src_path)
+
+                        if inotify_event.is_moved_from:
+                            self2.remember_move_from_event(inotify_event)
+                        elif inotify_event.is_moved_to:
+                            move_src_path = self2.source_for_move(inotify_event)
+                            if move_src_path in self2._wd_for_path:
+                                moved_wd = self2._wd_for_path[move_src_path]
+                                del self2._wd_for_path[move_src_path]
+                                self2._wd_for_path[inotify_event.src_path] = moved_wd
+                                self2._path_for_wd[moved_wd] = inotify_event.src_path
+                                if self2.is_recursive:
+                                    for _path, _wd in self2._wd_for_path.copy().items():
+                                        if _path.startswith(move_src_path + os.path.sep.encode()):
+                                            moved_wd = self2._wd_for_path.pop(_path)
+                                            _move_to_path = _path.replace(move_src_path, inotify_event.src_path)
+                                            self2._wd_for_path[_move_to_path] = moved_wd
+                                            self2._path_for_wd[moved_wd] = _move_to_path
+                            src_path = os.path.join(wd_path, name)
+                            inotify_event = InotifyEvent(wd, mask, cookie, name, src_path)
+
+                        if inotify_event.is_ignored:
+                            # Clean up book-keeping for deleted watches.
+                            path = self2._path_for_wd.pop(wd)
+                            if self2._wd_for_path[path] == wd:
+                                del self2._wd_for_path[path]
+                            continue
+
+                        ret.append(inotify_event)
+
+                        if self2.is_recursive and inotify_event.is_directory and inotify_event.is_create:
+                            ret.extend(self.watch_new_dir(self2, src_path))
+
+                self.on_inotify_events(ret)
+                return ret
 
             Inotify._add_dir_watch = _add_dir_watch
+            Inotify.read_events = _read_events
 
         self.observer.start()
         self.producer.start()
 
-    def walk_dirs(self, on_match: Callable) -> None:
-        def walk(path: Path):
-            for p in path.iterdir():
-                if glob_match(path, self._ignored_paths):
+    def walk_dirs(self, start: Optional[str] = None) -> List[str]:
+        ret = list(iter_dirs(str(self.root), self._ignored_paths, start=start))
+        return ret
+
+    def is_dir_ignored(self, path: str) -> bool:
+        ret = glob_match(os.path.relpath(path, str(self.root)), self._ignored_paths)
+        return ret
+
+    def watch_new_dir(self, inotify: "Inotify", path: bytes) -> List["InotifyEvent"]:
+        """
+        Watches a directory created at runtime (recursive mode) and its subdirectories.
+        Like watchdog, simulates create events of their content (mkdir -p app/views; touch app/views/a.py).
+        Ignored directories are pruned, so for example a new venv or node_modules is never walked.
+        """
+        from watchdog.observers.inotify_c import InotifyConstants, InotifyEvent
+
+        if self.is_dir_ignored(os.fsdecode(path)):
+            return []
+
+        dirs = [path] + [os.fsencode(d) for d in self.walk_dirs(os.fsdecode(path))]
+
+        ret = []
+        for d in dirs:
+            try:
+                wd = inotify._add_watch(d, inotify._event_mask)
+            except OSError:
+                continue
+
+            self.watch_count += 1
+            if d != path:
+                ret.append(InotifyEvent(wd, InotifyConstants.IN_CREATE | InotifyConstants.IN_ISDIR, 0,
+                                        os.path.basename(d), d))
+
+            try:
+                entries = list(os.scandir(d))
+            except OSError:
+                continue
+
+            for e in entries:
+                try:
+                    if e.is_dir(follow_symlinks=False):
+                        continue
+                except OSError:
                     continue
-                on_match(str(p).encode("utf-8"))
-                if p.is_dir():
-                    walk(p)
+                ret.append(InotifyEvent(wd, InotifyConstants.IN_CREATE, 0, e.name, e.path))
 
-        walk(self.root)
+        return ret
 
     def stop(self, *args, **kwargs) -> None:
+        if self.poller:
+            self.poller.stop()
+            return
+
         self.observer.stop()
 
+    def is_imported(self, event: FileSystemEvent) -> bool:
+        if event.src_path in self._imported_files:
+            return True
+
+        ret = getattr(event, "dest_path", None) in self._imported_files
+        return ret
+
     def dispatch(self, event: FileSystemEvent):
         """Dispatches events to the appropriate methods.
 
@@ -177,11 +520,13 @@ class Watchdog(FileSystemEventHandler):
         :type event:
             :class:`FileSystemEvent`
         """
+        if self.imported_only and not self.is_imported(event):
+            return
 
         if event.event_type not in (EVENT_TYPE_MODIFIED, EVENT_TYPE_DELETED, EVENT_TYPE_MOVED, EVENT_TYPE_CREATED):
             return
 
-        if self.matches(Path(event.src_path).relative_to(self.root)):
+        if self.event_matches(event):
             super().dispatch(event)
 
 
@@ -195,57 +540,267 @@ class Reloader:
     def __init__(self, root: str, config: BaseConfig):
         self.root = Path(root)
 
-        self.logger = SRLogger(source_root=self.root)
-
         self.config = config
+
+        self.logger = SRLogger(source_root=self.root,
+                               watched_paths=self.config.watched_paths,
+                               ignored_paths=self.config.ignored_paths,
+                               max_sessions=self.config.max_log_sessions,
+                               inventory_every=self.config.log_inventory_every,
+                               profile_top_n=self.config.profile_top_n)
         self.partial_reloader = PartialReloader(root=self.root, logger=self.logger, config=self.config)
         signal.signal(signal.SIGUSR1, self._execute_full_reload)
+        signal.signal(signal.SIGINT, self._on_sigint)
 
         callbacks = Watchdog.Callbacks(on_modify=self.on_modify, on_new_file=self.on_new_file,
-                                       on_delete_file=self.trigger_full_reload, on_multiple_files_at_once=self.trigger_full_reload,
-                                       on_moved_file=self.trigger_full_reload)
+                                       on_delete_file=partial(self.trigger_full_reload, cause="file_deleted"),
+                                       on_multiple_files_at_once=partial(self.trigger_full_reload,
+                                                                         cause="multiple_files"),
+                                       on_moved_file=partial(self.trigger_full_reload, cause="file_moved"))
 
         self.watchdog = Watchdog(self.root, watched_paths=self.config.watched_paths,
                                  ignored_paths=self.config.ignored_paths,
-                                 callbacks=callbacks)
+                                 callbacks=callbacks,
+                                 logger=self.logger,
+                                 imported_only=self.config.watch_imported_only,
+                                 debounce_max=self.config.debounce_max,
+                                 debounce_quiet_time=self.config.debounce_quiet_time,
+                                 polling=self.config.polling,
+                                 polling_interval=self.config.polling_interval,
+                                 polling_batch_size=self.config.polling_batch_size)
+
+        self.exporter = None
+        self.metrics_server = None
+        if self.config.metrics_port is not None:
+            self.exporter = ReloaderExporter(watched_dirs=self.get_watched_dirs_count,
+                                             watched_files=self.get_watched_files_count,
+                                             objects=self.get_objects_count,
+                                             state_file=self.get_metrics_state_file())
+            self.metrics_server = MetricsServer(self.exporter.registry, self.config.metrics_port)
+
+        self.recent_metrics: Deque[ReloadMetrics] = deque(maxlen=20)
+        self.reloads_count: Counter = Counter()
+
+        self.control_server = None
+        if self.config.control_socket:
+            self.control_server = ControlServer(self.config.control_socket,
+                                                commands={"reload": self.on_control_reload,
+                                                          "status": self.on_control_status,
+                                                          "metrics": self.on_control_metrics})
+
+    @staticmethod
+    def get_metrics_state_file() -> Optional[Path]:
+        state_file = os.environ.get(STATE_FILE_ENV)
+        return Path(state_file) if state_file else None
+
+    def get_watched_dirs_count(self) -> int:
+        if self.watchdog.poller:
+            return self.watchdog.poller.dirs_count
+        return self.watchdog.watch_count
+
+    def get_watched_files_count(self) -> Optional[int]:
+        if self.watchdog.poller:
+            return self.watchdog.poller.files_count
+        return None
+
+    def get_objects_count(self) -> int:
+        ret = 0
+        for module_descriptors in list(self.partial_reloader.modules.user_modules.values()):
+            for m in list(module_descriptors):
+                if m.module_obj:
+                    ret += len(m.module_obj.flat)
+        return ret
 
     def _on_multiple_files_at_once(self) -> None:
-        self.trigger_full_reload()
+        self.trigger_full_reload(cause="multiple_files")
 
     def _execute_full_reload(*args, **kwargs):
         sys.exit(3)
 
-    def trigger_full_reload(self, *args, **kwargs) -> None:
+    def _on_sigint(self, *args, **kwargs) -> None:
+        # os._exit skips atexit handlers so pending log events have to be written here
+        self.logger.close()
+        os._exit(0)
+
+    def trigger_full_reload(self, *args, cause: str = "unknown", **kwargs) -> None:
         self.watchdog.stop()
-        self.logger.info("Triggering full reload...")
+        if self.exporter:
+            self.exporter.full_reload(cause)
+        self.logger.info(f"Triggering full reload ({cause})...")
+        self.logger.flush()
         os.kill(os.getpid(), signal.SIGUSR1)
 
     def on_new_file(self, event: FileSystemEvent) -> None:
         pass
 
+    def report_metrics(self, metrics: ReloadMetrics, outcome: str) -> None:
+        metrics.finish(outcome)
+        self.recent_metrics.append(metrics)
+        self.reloads_count[outcome] += 1
+        if self.exporter:
+            self.exporter.observe(metrics)
+        self.logger.log_reload_metrics(metrics)
+        # files with a reload policy are handled the way the user chose
+        if not self.partial_reloader.policies.matches(metrics.module_file):
+            self.logger.suggest_policy(metrics.module_file, outcome)
+        self.config.on_reload_metrics(metrics)
+
+    @contextmanager
+    def profiled(self, profile: Optional[cProfile.Profile]) -> Iterator[None]:
+        if not profile:
+            yield
+            return
+
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+
     def on_modify(self, event: FileSystemEvent):
         path = Path(event.src_path)
 
-        self.logger.log_modified(path)
-
-        try:
-            self.config.before_reload(path)
-            self.partial_reloader.reload(path)
-            self.config.after_reload(path, self.partial_reloader.applied_actions)
+        policy = self.partial_reloader.policies.get(path)
+        if policy == IGNORE:
+            return
 
-            self.logger.log_hot_reloaded_event(actions=self.partial_reloader.applied_actions.copy(),
-                                               objects=sys.modules.user_modules[str(path)][0].module_obj.flat)
-        except FullReloadNeeded:
-            self.config.before_full_reload(path)
-            self.trigger_full_reload()
-        except Exception:
-            self.config.after_rollback(path, self.partial_reloader.applied_actions)
+        # not imported by the application, nothing to reload
+        if policy != FULL and str(path) not in self.partial_reloader.modules.user_modules:
+            return
 
-            traceback.print_exc(limit=-1)
+        metrics = ReloadMetrics(path)
+        if self.watchdog.batch_received_at is not None:
+            metrics.add_span(EVENT_RECEIVED, self.watchdog.batch_received_at, metrics.started)
+
+        with metrics.span(LOGGING):
+            modified_event = self.logger.log_modified(path)
+
+        profile = cProfile.Profile() if self.config.profile_reloads else None
+
+        # the whole reload is one step for other threads, see reload_files
+        with self.partial_reloader.lock:
+            try:
+                # before any work starts
+                if policy == FULL:
+                    raise FullReloadNeeded("policy")
+
+                self.config.before_reload(path)
+                with self.profiled(profile):
+                    self.partial_reloader.reload(path, metrics=metrics, policy=policy)
+                self.config.after_reload(path, self.partial_reloader.applied_actions)
+
+                with metrics.span(LOGGING):
+                    module_descriptor = sys.modules.user_modules[str(path)][0]
+                    # reuse the source already read by the reload
+                    self.logger.snapshot_source(modified_event, module_descriptor.source.raw)
+                    profile_filename = self.logger.save_profile(profile, modified_event) if profile else None
+                    self.logger.log_hot_reloaded_event(actions=self.partial_reloader.applied_actions.copy(),
+                                                       objects=module_descriptor.module_obj.flat,
+                                                       profile=profile,
+                                                       profile_filename=profile_filename)
+                self.partial_reloader.commit()
+                self.report_metrics(metrics, "hot")
+            except FullReloadNeeded as e:
+                self.logger.snapshot_source(modified_event)
+                if profile:
+                    self.logger.save_profile(profile, modified_event)
+                self.report_metrics(metrics, "full")
+                self.config.before_full_reload(path)
+                self.trigger_full_reload(cause=e.cause)
+            except Exception:
+                self.logger.snapshot_source(modified_event)
+                if profile:
+                    self.logger.save_profile(profile, modified_event)
+                self.config.after_rollback(path, self.partial_reloader.applied_actions)
+
+                traceback.print_exc(limit=-1)
+
+                self.partial_reloader.rollback()
+                self.config.after_rollback(path, self.partial_reloader.applied_actions)
+                self.report_metrics(metrics, "rollback")
+
+    def reload_files(self, paths: List[Path], dry_run: bool = False,
+                     sources: Optional[Dict[Path, bytes]] = None) -> ReloadResult:
+        """
+        Reloads files synchronously, for tools like git hooks or editor plugins. Doesn't need the file watcher
+        and is safe to call from any thread. Full reload is not triggered, see ReloadResult.full_reload_needed.
+        Dry runs are not logged.
 
-            self.partial_reloader.rollback()
-            self.config.after_rollback(path, self.partial_reloader.applied_actions)
+        :param sources: source of files used instead of reading them from disk (unsaved editor buffers)
+        """
+        paths = [Path(p).absolute() for p in paths]
+        sources = {Path(p).absolute(): raw for p, raw in (sources or {}).items()}
+
+        if dry_run:
+            # rolled back by the partial reloader, there is nothing to commit
+            ret = self.partial_reloader.reload_files(paths, dry_run=True, sources=sources)
+            return ret
+
+        metrics = ReloadMetrics(paths[0] if len(paths) == 1 else self.root)
+
+        with self.partial_reloader.lock:
+            with metrics.span(LOGGING):
+                modified_events = [self.logger.log_modified(p) for p in paths]
+
+            ret = self.partial_reloader.reload_files(paths, metrics=metrics, sources=sources)
+
+            with metrics.span(LOGGING):
+                for p, e in zip(paths, modified_events):
+                    self.logger.snapshot_source(e, sources.get(p))
+
+                if ret.outcome == "hot":
+                    objects = {}
+                    for p in paths:
+                        for m in self.partial_reloader.modules.user_modules.get(str(p), []):
+                            objects.update(m.module_obj.flat)
+                    self.logger.log_hot_reloaded_event(actions=self.partial_reloader.applied_actions.copy(),
+                                                       objects=objects)
+
+            self.partial_reloader.commit()
+            self.report_metrics(metrics, ret.outcome)
+
+        return ret
+
+    def on_control_reload(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        paths = []
+        sources = {}
+        for f in message["files"]:
+            # relative to the project root
+            path = self.root.absolute() / f["path"]
+            paths.append(path)
+            if "source" in f:
+                sources[path] = f["source"].encode("utf-8")
+
+        ret = self.reload_files(paths, dry_run=message.get("dry_run", False), sources=sources)
+        return ret.to_dict()
+
+    def on_control_status(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        ret = {
+            "pid": os.getpid(),
+            "root": str(self.root.absolute()),
+            "modules": len(self.partial_reloader.modules.user_modules),
+            "objects": self.get_objects_count(),
+            "watched_directories": self.get_watched_dirs_count(),
+            "reloads": dict(self.reloads_count),
+            "policy_suggestions": dict(self.logger.policy_suggestions),
+        }
+        return ret
+
+    def on_control_metrics(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        ret = {
+            "reloads": [m.to_dict() for m in list(self.recent_metrics)],
+            "prometheus": self.exporter.registry.render() if self.exporter else None,
+        }
+        return ret
 
     def start(self) -> None:
         self.config.on_start(sys.argv)
         self.watchdog.start()
+
+        if self.metrics_server:
+            self.metrics_server.start()
+            self.logger.info(f"Serving metrics on http://127.0.0.1:{self.metrics_server.port}/metrics")
+
+        if self.control_server:
+            self.control_server.start()
+            self.logger.info(f"Listening for control requests on {self.control_server.path}")
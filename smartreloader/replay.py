@@ -0,0 +1,217 @@
+"""
+Replays edits recorded in a session log against a fresh partial reloader.
+
+The project is reconstructed from the session snapshots into a temporary directory, all watched modules are imported
+in a headless process and every recorded edit is applied and reloaded in order.
+A full reload restarts the process from the current state of the files, like the real reloader does.
+
+Usage: python -m smartreloader.replay <session log directory> [--import module ...] [--output results.json]
+"""
+import argparse
+import importlib
+import json
+import logging
+import multiprocessing
+import statistics
+import sys
+import tempfile
+import traceback
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from smartreloader.metrics import percentile
+from smartreloader.sr_logger import LEGACY_LOG_FILE_NAME, LOG_FILE_NAME, load_events
+from smartreloader.snapshot_store import MANIFEST_FILE_NAME, STORE_DIR_NAME, Manifest, SnapshotStore
+
+__all__ = ["Edit", "EditResult", "load_edits", "reconstruct", "replay"]
+
+
+logger = logging.getLogger("smart-reloader-replay")
+
+
+@dataclass
+class Edit:
+    file: str
+    snapshot: str
+    digest: str
+
+
+@dataclass
+class EditResult:
+    index: int
+    file: str
+    snapshot: str
+    # "partial", "rollback", "full" or "not_imported"
+    outcome: str
+    latency: float
+    actions: int
+    phases: Dict[str, float]
+    error: Optional[str] = None
+
+
+def load_edits(session_dir: Path) -> List[Edit]:
+    manifest = Manifest.load(session_dir / MANIFEST_FILE_NAME)
+
+    log_file = session_dir / LOG_FILE_NAME
+    if not log_file.exists():
+        log_file = session_dir / LEGACY_LOG_FILE_NAME
+
+    ret = []
+    for e in load_events(log_file):
+        if e["event_type"] != "ModifiedEvent" or "file" not in e:
+            continue
+
+        digest = manifest.source_changes.get(e["snapshot"])
+        # snapshot was not persisted (process killed before the writer caught up)
+        if digest is None:
+            continue
+
+        ret.append(Edit(file=e["file"], snapshot=e["snapshot"], digest=digest))
+
+    return ret
+
+
+def reconstruct(session_dir: Path, target: Path) -> Path:
+    """
+    Writes initial source of the session to target/<project name>. Returns the project root.
+    """
+    manifest = Manifest.load(session_dir / MANIFEST_FILE_NAME)
+    store = SnapshotStore(session_dir.parent / STORE_DIR_NAME)
+
+    ret = (target / session_dir.parent.name).resolve()
+    for file, digest in manifest.initial_source.items():
+        path = ret / file
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(store.get(digest))
+
+    return ret
+
+
+def get_module_names(root: Path) -> Tuple[Path, List[str]]:
+    """
+    Returns directory to be put on sys.path and names of all modules of the project.
+    """
+    from smartreloader.misc import path_to_module_name
+
+    package_root = root.parent if (root / "__init__.py").exists() else root
+
+    names = []
+    for p in sorted(root.glob("**/*.py")):
+        if any(not part.isidentifier() for part in p.relative_to(package_root).with_suffix("").parts):
+            continue
+        names.append(path_to_module_name(p, package_root))
+
+    return package_root, names
+
+
+def _run_edits(root: Path, store_root: Path, edits: List[Edit], start: int,
+               modules: Optional[List[str]]) -> List[EditResult]:
+    """
+    Runs in a fresh process. Stops after the first edit that needs a full reload.
+    """
+    from smartreloader import BaseConfig, FullReloadNeeded, PartialReloader
+    from smartreloader.metrics import ReloadMetrics
+
+    store = SnapshotStore(store_root)
+    package_root, all_modules = get_module_names(root)
+    sys.path.insert(0, str(package_root))
+
+    reloader = PartialReloader(root, logger, BaseConfig())
+
+    for m in modules or all_modules:
+        try:
+            importlib.import_module(m)
+        except Exception:
+            logger.warning(f"Could not import {m}:\n{traceback.format_exc(limit=-1)}")
+
+    ret = []
+    for i in range(start, len(edits)):
+        edit = edits[i]
+        path = reloader.root / edit.file
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(store.get(edit.digest))
+
+        if str(path) not in reloader.modules.user_modules:
+            ret.append(EditResult(i, edit.file, edit.snapshot, "not_imported", 0.0, 0, {}))
+            continue
+
+        metrics = ReloadMetrics(path)
+        error = None
+        started = perf_counter()
+        try:
+            reloader.reload(path, metrics=metrics)
+            outcome = "partial"
+        except FullReloadNeeded as e:
+            outcome = "full"
+            error = e.cause
+        except Exception:
+            error = traceback.format_exc(limit=-1)
+            reloader.rollback()
+            outcome = "rollback"
+        latency = perf_counter() - started
+
+        ret.append(EditResult(i, edit.file, edit.snapshot, outcome, latency, len(reloader.applied_actions),
+                              metrics.phases, error))
+
+        if outcome == "full":
+            break
+
+    return ret
+
+
+def replay(session_dir: Path, modules: Optional[List[str]] = None) -> Dict[str, Any]:
+    edits = load_edits(session_dir)
+    store_root = session_dir.parent / STORE_DIR_NAME
+    context = multiprocessing.get_context("spawn")
+
+    results: List[EditResult] = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = reconstruct(session_dir, Path(tmp))
+
+        start = 0
+        while start < len(edits):
+            # the reloader replaces sys.modules so every run gets a fresh process, also after full reloads
+            with context.Pool(1) as pool:
+                run_results = pool.apply(_run_edits, (root, store_root, edits, start, modules))
+            results.extend(run_results)
+            start = run_results[-1].index + 1 if run_results else len(edits)
+
+    latencies = [r.latency for r in results if r.outcome != "not_imported"]
+    outcomes = {}
+    for r in results:
+        outcomes[r.outcome] = outcomes.get(r.outcome, 0) + 1
+
+    ret = {
+        "session": str(session_dir),
+        "edits": len(edits),
+        "outcomes": outcomes,
+        "latency_p50_s": statistics.median(latencies) if latencies else None,
+        "latency_p95_s": percentile(latencies, 95) if latencies else None,
+        "latency_max_s": max(latencies) if latencies else None,
+        "results": [asdict(r) for r in results],
+    }
+    return ret
+
+
+def _main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("session_dir", type=Path)
+    parser.add_argument("--import", dest="modules", nargs="*", default=None,
+                        help="Modules to import before replaying, defaults to all modules of the project")
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    results = replay(args.session_dir, args.modules)
+    content = json.dumps(results, indent=4)
+
+    if args.output:
+        args.output.write_text(content)
+
+    sys.stdout.write(content + "\n")
+
+
+if __name__ == "__main__":
+    _main()
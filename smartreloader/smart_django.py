@@ -1,7 +1,6 @@
-from copy import copy
 from typing import Any, List
 
-from dataclasses import dataclass, field
+from dataclasses import dataclass
 from django.db.models.query_utils import DeferredAttribute
 
 from smartreloader.objects import ClassVariable, ContainerObj, Object
@@ -13,20 +12,11 @@ class DbField(ClassVariable):
         def execute(self) -> None:
             self.parent.set_attr(self.obj.name, self.obj.python_obj)
 
-        def rollback(self) -> None:
-            super().rollback()
-            self.parent.del_attr(self.obj.name)
-
     @dataclass
     class Update(ClassVariable.Update):
-        rollback_obj: DeferredAttribute = field(init=False)
-
         def execute(self) -> None:
-            self.rollback_obj = copy(self.obj.python_obj)
-
-        def rollback(self) -> None:
-            super().rollback()
-            # self.obj.parent.set_attr(self.obj.name, self.obj.python_obj)
+            # the field already set up on the model is kept, there is nothing to roll back
+            pass
 
     @classmethod
     def is_candidate(cls, name: str, obj: Any, potential_parent: "ContainerObj") -> bool:
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import threading
+import zlib
+from pathlib import Path
+from time import time
+from typing import Dict, Iterator, List, Set
+
+from globmatch import glob_match
+
+from smartreloader.misc import iter_dirs
+
+__all__ = ["SnapshotStore", "Manifest", "iter_source_files"]
+
+
+STORE_DIR_NAME = "store"
+MANIFEST_FILE_NAME = "manifest.json"
+
+
+class SnapshotStore:
+    """
+    Content addressed store of source snapshots, shared by all log sessions of a project.
+
+    Blobs are zlib compressed and named after sha256 of their content, so a file that didn't change
+    between sessions (or restarts) is stored only once.
+    """
+
+    # unreferenced blobs younger than this are kept, they might belong to a session that is just starting
+    gc_grace_time: float = 3600.0
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        os.makedirs(str(self.root), exist_ok=True)
+
+    def blob_path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest[2:]
+
+    def put(self, content: bytes) -> str:
+        digest = hashlib.sha256(content).hexdigest()
+        path = self.blob_path(digest)
+
+        if path.exists():
+            # refresh so it's not garbage collected while being referenced by a new manifest
+            os.utime(str(path))
+            return digest
+
+        os.makedirs(str(path.parent), exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(zlib.compress(content))
+        os.replace(str(tmp_path), str(path))
+
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        ret = zlib.decompress(self.blob_path(digest).read_bytes())
+        return ret
+
+    def __contains__(self, digest: str) -> bool:
+        return self.blob_path(digest).exists()
+
+    def iter_digests(self) -> Iterator[str]:
+        for d in self.root.iterdir():
+            if not d.is_dir() or len(d.name) != 2:
+                continue
+            for b in d.iterdir():
+                if b.name.endswith(".tmp"):
+                    continue
+                yield d.name + b.name
+
+    def gc(self, referenced: Set[str]) -> int:
+        """
+        Removes blobs not referenced by any manifest. Returns number of removed blobs.
+        """
+        ret = 0
+        now = time()
+
+        for digest in list(self.iter_digests()):
+            if digest in referenced:
+                continue
+
+            path = self.blob_path(digest)
+            try:
+                if now - path.stat().st_mtime < self.gc_grace_time:
+                    continue
+                path.unlink()
+            except OSError:
+                continue
+
+            ret += 1
+
+        return ret
+
+
+class Manifest:
+    """
+    Per session mapping of file names to blob digests.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.initial_source: Dict[str, str] = {}
+        self.source_changes: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: Path) -> "Manifest":
+        ret = cls(path)
+        content = json.loads(path.read_text())
+        ret.initial_source = content.get("initial_source", {})
+        ret.source_changes = content.get("source_changes", {})
+        return ret
+
+    @property
+    def digests(self) -> Set[str]:
+        with self._lock:
+            ret = set(self.initial_source.values()) | set(self.source_changes.values())
+        return ret
+
+    def add_initial_source(self, files: Dict[str, str]) -> None:
+        with self._lock:
+            self.initial_source.update(files)
+
+    def add_source_change(self, name: str, digest: str) -> None:
+        with self._lock:
+            self.source_changes[name] = digest
+
+    def save(self) -> None:
+        with self._lock:
+            content = json.dumps({"initial_source": self.initial_source,
+                                  "source_changes": self.source_changes}, indent=4)
+
+            tmp_path = self.path.with_name(f"{self.path.name}.tmp")
+            tmp_path.write_text(content)
+            os.replace(str(tmp_path), str(self.path))
+
+
+def iter_source_files(root: Path, watched_paths: List[str], ignored_paths: List[str]) -> Iterator[Path]:
+    """
+    Yields watched files under root, ignored directories are not entered.
+    """
+    for d in [str(root)] + list(iter_dirs(str(root), ignored_paths)):
+        try:
+            entries = list(os.scandir(d))
+        except OSError:
+            continue
+
+        for e in entries:
+            try:
+                if not e.is_file():
+                    continue
+            except OSError:
+                continue
+
+            relative = os.path.relpath(e.path, str(root))
+            if glob_match(relative, ignored_paths) or not glob_match(relative, watched_paths):
+                continue
+
+            yield Path(e.path)
@@ -1,20 +1,30 @@
+import _strptime  # noqa: F401, strptime imports it lazily which is not thread safe
+import atexit
+import cProfile
 import json
 import os
 import shutil
 import logging
+import pstats
+import threading
 from logging import Logger
 from pathlib import Path
-from typing import Dict, Any, Optional, List, ClassVar, Type
+from queue import Empty, Queue
+from typing import Dict, Any, Callable, Deque, Optional, List, ClassVar, Set, Tuple, Type, Union
 
 from dataclasses import dataclass, field
 import datetime as dt
+from collections import Counter, OrderedDict, deque
 
 from smartreloader import e2e
+from smartreloader.metrics import ReloadMetrics
 from smartreloader.objects import BaseAction, Object
+from smartreloader.snapshot_store import MANIFEST_FILE_NAME, STORE_DIR_NAME, Manifest, SnapshotStore, iter_source_files
 
 DEFAULT_LOGS_DIRECTORY = Path.home() / ".smart-reloader/logs"
-SOURCE_CHANGES_DIR_NAME = "source_changes"
-LOG_FILE_NAME = "log.json"
+LOG_FILE_NAME = "log.jsonl"
+LEGACY_LOG_FILE_NAME = "log.json"
+PROFILES_DIR_NAME = "profiles"
 
 
 @dataclass
@@ -27,20 +37,8 @@ class Event:
         return ret
 
     def write(self) -> None:
-        content = json.dumps(self.to_dict(),
-                             indent=4)
+        self.sr_logger.writer.put(self)
 
-        with open(str(self.sr_logger.log_file), "a+") as f:
-            if len(self.sr_logger.events) == 1:
-                f.seek(f.tell() - 1, os.SEEK_SET)
-                f.truncate()
-            else:
-                f.seek(f.tell() - 2, os.SEEK_SET)
-                f.truncate()
-                f.write(",\n")
-
-            f.write(content)
-            f.write("\n]\n")
 
 @dataclass
 class LogMsg(Event):
@@ -55,13 +53,57 @@ class LogMsg(Event):
 
 @dataclass
 class HotReloadedEvent(Event):
-    actions: List[BaseAction]
-    objects: Dict[str, Object]
+    """
+    Records only objects touched by applied actions, see InventoryEvent for all objects of the module.
+    Actions are kept as strings so the event doesn't hold old object trees.
+    """
+    actions: List[str]
+    objects: List[str]
+    objects_count: int
+    profile: Optional[cProfile.Profile] = None
+    profile_filename: Optional[str] = None
+    profile_top_n: int = 20
+
+    def get_hot_functions(self) -> List[Dict[str, Any]]:
+        stats = pstats.Stats(self.profile)
+
+        ret = []
+        for func, (cc, nc, tt, ct, callers) in sorted(stats.stats.items(), key=lambda i: i[1][2],
+                                                      reverse=True)[:self.profile_top_n]:
+            ret.append({"function": pstats.func_std_string(func), "calls": nc, "tottime": tt, "cumtime": ct})
+
+        return ret
+
+    def to_dict(self) -> Dict[str, Any]:
+        ret = super().to_dict()
+        ret["objects"] = self.objects
+        ret["objects_count"] = self.objects_count
+        ret["actions"] = self.actions
+
+        # profile stats are computed in the writer thread
+        if self.profile:
+            ret["profile"] = self.profile_filename
+            ret["hot_functions"] = self.get_hot_functions()
+        return ret
+
+
+@dataclass
+class InventoryEvent(Event):
+    objects: List[str]
 
     def to_dict(self) -> Dict[str, Any]:
         ret = super().to_dict()
-        ret["objects"] = tuple(f"{k}: {v.get_obj_type_name()}" for k, v in self.objects.items())
-        ret["actions"] = [repr(a) for a in self.actions]
+        ret["objects"] = self.objects
+        return ret
+
+
+@dataclass
+class ReloadMetricsEvent(Event):
+    metrics: ReloadMetrics
+
+    def to_dict(self) -> Dict[str, Any]:
+        ret = super().to_dict()
+        ret.update(self.metrics.to_dict())
         return ret
 
 
@@ -73,12 +115,13 @@ class ModifiedEvent(Event):
     counter: ClassVar[int] = 0
 
     def __post_init__(self) -> None:
+        # content is persisted later from the background thread, see SRLogger.snapshot_source
         self.snapshot_filename = f"{ModifiedEvent.counter}_{self.file.name}"
-        shutil.copy(self.file, self.sr_logger.source_changes_dir / self.snapshot_filename)
         ModifiedEvent.counter += 1
 
     def to_dict(self) -> Dict[str, Any]:
         ret = super().to_dict()
+        ret["file"] = os.path.relpath(str(self.file), str(self.sr_logger.source_root))
         ret["snapshot"] = self.snapshot_filename
         return ret
 
@@ -94,59 +137,372 @@ class CreatedEvent(Event):
 
 
 
+class LogWriter:
+    """
+    Appends events to a newline delimited json file.
+    Events are serialized and written in batches from a background thread so logging doesn't slow down reloads.
+    """
+
+    batch_size: ClassVar[int] = 256
+
+    def __init__(self, log_file: Path) -> None:
+        self.log_file = log_file
+        self._queue = Queue()
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._run)
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def put(self, event: Event) -> None:
+        self._queue.put(event)
+
+    def put_task(self, task: Callable[[], None]) -> None:
+        """
+        Runs task in the writer thread, in order with queued events.
+        """
+        self._queue.put(task)
+
+    def _get_batch(self) -> List[Union[Event, Callable[[], None], None]]:
+        ret = [self._queue.get()]
+
+        while len(ret) < self.batch_size:
+            try:
+                ret.append(self._queue.get_nowait())
+            except Empty:
+                break
+
+        return ret
+
+    def _run(self) -> None:
+        with open(str(self.log_file), "a") as f:
+            while True:
+                batch = self._get_batch()
+
+                lines = []
+                for e in batch:
+                    if e is None:
+                        continue
+                    try:
+                        if isinstance(e, Event):
+                            lines.append(json.dumps(e.to_dict()) + "\n")
+                        else:
+                            e()
+                    except Exception:
+                        SRLogger.logger.exception("Could not write log event")
+
+                f.writelines(lines)
+                f.flush()
+
+                for _ in batch:
+                    self._queue.task_done()
+
+                if any(e is None for e in batch):
+                    return
+
+    def flush(self) -> None:
+        """
+        Blocks until all queued events are written.
+        """
+        if self._thread.is_alive():
+            self._queue.join()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+
+def load_events(log_file: Path) -> List[Dict[str, Any]]:
+    """
+    Reads events from a log file. Supports both newline delimited json and the legacy json array format.
+    """
+    content = log_file.read_text()
+
+    if content.lstrip().startswith("["):
+        return json.loads(content)
+
+    ret = [json.loads(line) for line in content.splitlines() if line.strip()]
+    return ret
+
+
+def convert_to_json_array(log_file: Path, output_file: Path) -> None:
+    """
+    Converts newline delimited json log to the legacy json array format.
+    """
+    output_file.write_text(json.dumps(load_events(log_file), indent=4) + "\n")
+
+
 @dataclass
 class SRLogger:
     source_root: Path
     logs_directory: Path = DEFAULT_LOGS_DIRECTORY
     log_source_changes: bool = True
+    watched_paths: List[str] = field(default_factory=lambda: ["**/*.py"])
+    ignored_paths: List[str] = field(default_factory=list)
+    max_sessions: int = 20
+    inventory_every: int = 0
+    profile_top_n: int = 20
+    # recent events kept in memory, all of them are written to the log file
+    max_events: int = 100
+    # consecutive reloads of a file that weren't hot after which a "full" reload policy is suggested (0 disables it)
+    suggest_policy_after: int = 3
 
     log_directory: Path = field(init=False)
-    events: List[Event] = field(init=False, default_factory=list)
+    events: Deque[Event] = field(init=False)
     logger: ClassVar[Logger] = logging.getLogger("smart-reloader")
     log_file: Path = field(init=False, default_factory=list)
+    writer: LogWriter = field(init=False)
+    store: SnapshotStore = field(init=False)
+    hot_reloads_count: int = field(init=False, default=0)
+    manifest: Manifest = field(init=False)
+    # relative file -> suggested reload policy, see suggest_policy
+    policy_suggestions: Dict[str, str] = field(init=False, default_factory=dict)
+    failed_streaks: Counter = field(init=False, default_factory=Counter)
+    hot_reloaded: Set[str] = field(init=False, default_factory=set)
 
     def __post_init__(self) -> None:
+        # the current session is one of the kept ones
+        if self.max_sessions < 1:
+            raise ValueError(f"max_sessions has to be at least 1, got {self.max_sessions}")
+
+        self.events = deque(maxlen=self.max_events)
         os.makedirs(str(self.logs_directory), exist_ok=True)
 
-        self.log_directory = self.logs_directory / self.source_root.name / self.datetime_to_folder_name(dt.datetime.now())
+        self.project_logs_directory = self.logs_directory / self.source_root.name
+        self.log_directory = self.project_logs_directory / self.datetime_to_folder_name(dt.datetime.now())
         os.makedirs(str(self.log_directory), exist_ok=True)
 
-        self.source_changes_dir = self.log_directory / SOURCE_CHANGES_DIR_NAME
-        os.makedirs(str(self.source_changes_dir), exist_ok=True)
-
-        self.initial_source_dir = self.log_directory / "initial_source"
-
-        if self.initial_source_dir.exists():
-            shutil.rmtree(str(self.initial_source_dir))
+        self.store = SnapshotStore(self.project_logs_directory / STORE_DIR_NAME)
+        self.manifest = Manifest(self.log_directory / MANIFEST_FILE_NAME)
 
-        shutil.copytree(self.source_root, self.initial_source_dir, )
+        # Initial source is stored lazily, most of the files are usually already in the store
+        self.initial_source_thread = threading.Thread(target=self._store_initial_source)
+        self.initial_source_thread.setDaemon(True)
+        self.initial_source_thread.start()
 
         self.logger.setLevel(logging.INFO)
         self.log_file = self.log_directory / LOG_FILE_NAME
-        self.log_file.touch()
-        self.log_file.write_text("[\n]")
+        self.log_file.write_text("")
+
+        self.writer = LogWriter(self.log_file)
+        atexit.register(self.close)
 
     @classmethod
     def datetime_to_folder_name(cls, date_time: dt.datetime) -> str:
         ret = date_time.strftime("%m_%d_%Y_%H:%M:%S")
         return ret
 
-    def log_modified(self, file: Path) -> None:
+    @classmethod
+    def folder_name_to_datetime(cls, folder_name: str) -> Optional[dt.datetime]:
+        try:
+            return dt.datetime.strptime(folder_name, "%m_%d_%Y_%H:%M:%S")
+        except ValueError:
+            return None
+
+    def _store_initial_source(self) -> None:
+        if not self.log_source_changes:
+            self.apply_retention()
+            return
+
+        files = {}
+
+        for path in iter_source_files(self.source_root, self.watched_paths, self.ignored_paths):
+            try:
+                content = path.read_bytes()
+            except OSError:
+                continue
+            files[str(path.relative_to(self.source_root))] = self.store.put(content)
+
+        self.manifest.add_initial_source(files)
+        self.manifest.save()
+
+        self.apply_retention()
+
+    def snapshot(self, name: str, content: bytes) -> None:
+        digest = self.store.put(content)
+        self.manifest.add_source_change(name, digest)
+        self.manifest.save()
+
+    def get_previous_sessions(self) -> List[Tuple[dt.datetime, Path]]:
+        """
+        Log directories of previous sessions of the project, most recent first.
+        """
+        ret = []
+        for d in self.project_logs_directory.iterdir():
+            date_time = self.folder_name_to_datetime(d.name)
+            if d.is_dir() and date_time and d != self.log_directory:
+                ret.append((date_time, d))
+
+        ret.sort(reverse=True)
+        return ret
+
+    def apply_retention(self) -> None:
+        """
+        Removes sessions above max_sessions (oldest first) and blobs that are no longer referenced.
+        """
+        sessions = self.get_previous_sessions()
+
+        for _, d in sessions[self.max_sessions - 1:]:
+            shutil.rmtree(str(d), ignore_errors=True)
+
+        referenced = self.manifest.digests
+        for _, d in sessions[:self.max_sessions - 1]:
+            try:
+                referenced |= Manifest.load(d / MANIFEST_FILE_NAME).digests
+            except (OSError, ValueError):
+                continue
+
+        self.store.gc(referenced)
+
+    def log_modified(self, file: Path) -> ModifiedEvent:
         event = ModifiedEvent(time=dt.datetime.now(),
                             sr_logger=self,
                             file=file)
         self.add_event(event)
+        return event
+
+    def snapshot_source(self, event: ModifiedEvent, content: Optional[bytes] = None) -> None:
+        """
+        Persists snapshot of the modified file in the background.
+        If content is not given (reload didn't get to read it) the file is read from the writer thread.
+        """
+        if not self.log_source_changes:
+            return
+
+        def task() -> None:
+            if content is None:
+                try:
+                    self.snapshot(event.snapshot_filename, event.file.read_bytes())
+                except OSError:
+                    return
+            else:
+                self.snapshot(event.snapshot_filename, content)
+
+        self.writer.put_task(task)
 
     def add_event(self, event: Event) -> None:
         self.events.append(event)
         event.write()
 
-    def log_hot_reloaded_event(self, actions: List[BaseAction], objects: Dict[str, Object]) -> None:
+    def log_hot_reloaded_event(self, actions: List[BaseAction], objects: Dict[str, Object],
+                               profile: Optional[cProfile.Profile] = None,
+                               profile_filename: Optional[str] = None) -> None:
+        """
+        :param objects: all objects of the reloaded module
+        :param profile: profile of the reload, top functions are added to the event
+        """
+        touched = OrderedDict()
+        for a in actions:
+            obj = getattr(a, "obj", None)
+            if obj is not None:
+                touched[obj.full_name] = f"{obj.full_name}: {obj.get_obj_type_name()}"
+
         event = HotReloadedEvent(time=dt.datetime.now(),
                                sr_logger=self,
-                               actions=actions,
-                               objects=objects)
+                               actions=[repr(a) for a in actions],
+                               objects=list(touched.values()),
+                               objects_count=len(objects),
+                               profile=profile,
+                               profile_filename=profile_filename,
+                               profile_top_n=self.profile_top_n)
+
+        self.add_event(event)
+
+        self.hot_reloads_count += 1
+        if self.inventory_every and self.hot_reloads_count % self.inventory_every == 0:
+            self.log_inventory(objects)
+
+    def save_profile(self, profile: cProfile.Profile, event: ModifiedEvent) -> str:
+        """
+        Saves profile of the reload triggered by event in the background. Returns file name relative to the session
+        directory.
+        """
+        ret = f"{PROFILES_DIR_NAME}/{Path(event.snapshot_filename).stem}.pstats"
+        path = self.log_directory / ret
+
+        def task() -> None:
+            os.makedirs(str(path.parent), exist_ok=True)
+            profile.dump_stats(str(path))
+
+        self.writer.put_task(task)
+        return ret
 
+    def log_reload_metrics(self, metrics: ReloadMetrics) -> None:
+        event = ReloadMetricsEvent(time=dt.datetime.now(), sr_logger=self, metrics=metrics)
+        self.add_event(event)
+
+    def suggest_policy(self, file: Path, outcome: str) -> None:
+        """
+        Counts outcomes of reloads of a file and suggests a "full" reload policy once its last suggest_policy_after
+        reloads all needed a full reload or were rolled back. Full reloads restart the process, so streaks
+        continue from logs of previous sessions, those are read in the writer thread.
+        """
+        relative = os.path.relpath(str(file), str(self.source_root))
+        if not self.suggest_policy_after or relative.startswith("..") or relative == ".":
+            return
+
+        if outcome == "hot":
+            self.failed_streaks.pop(relative, None)
+            self.hot_reloaded.add(relative)
+            return
+
+        self.failed_streaks[relative] += 1
+        streak = self.failed_streaks[relative]
+
+        if relative in self.policy_suggestions:
+            return
+
+        if relative in self.hot_reloaded:
+            if streak >= self.suggest_policy_after:
+                self._add_policy_suggestion(relative, streak)
+            return
+
+        def task() -> None:
+            previous_streak = self._get_previous_failed_streak(file, self.suggest_policy_after - streak)
+            if streak + previous_streak >= self.suggest_policy_after and relative not in self.policy_suggestions:
+                self._add_policy_suggestion(relative, streak + previous_streak)
+
+        self.writer.put_task(task)
+
+    def _get_previous_failed_streak(self, file: Path, limit: int) -> int:
+        ret = 0
+
+        for _, d in self.get_previous_sessions():
+            log_file = d / LOG_FILE_NAME
+            if not log_file.exists():
+                log_file = d / LEGACY_LOG_FILE_NAME
+
+            try:
+                events = load_events(log_file)
+            except (OSError, ValueError):
+                return ret
+
+            for e in reversed(events):
+                if e["event_type"] != "ReloadMetricsEvent" or e.get("module") != str(file):
+                    continue
+
+                if e["outcome"] == "hot":
+                    return ret
+
+                ret += 1
+                if ret >= limit:
+                    return ret
+
+        return ret
+
+    def _add_policy_suggestion(self, relative: str, streak: int) -> None:
+        self.policy_suggestions[relative] = "full"
+        self.info(f"{relative} couldn't be reloaded partially {streak} times in a row, "
+                  f'consider adding reload policy {{"{relative}": "full"}} to the config')
+
+    def log_inventory(self, objects: Dict[str, Object]) -> None:
+        event = InventoryEvent(time=dt.datetime.now(),
+                               sr_logger=self,
+                               objects=[f"{k}: {v.get_obj_type_name()}" for k, v in objects.items()])
         self.add_event(event)
 
     def log(self, level: int, msg: str) -> None:
@@ -163,3 +519,9 @@ class SRLogger:
 
     def warning(self, msg: str) -> None:
         self.log(level=logging.WARNING, msg=msg)
+
+    def flush(self) -> None:
+        self.writer.flush()
+
+    def close(self) -> None:
+        self.writer.close()
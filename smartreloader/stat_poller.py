@@ -0,0 +1,201 @@
+import os
+import threading
+from pathlib import Path
+from time import monotonic, sleep
+from typing import Callable, Dict, List, Set, Tuple
+
+from globmatch import glob_match
+from watchdog.events import FileCreatedEvent, FileDeletedEvent, FileModifiedEvent, FileSystemEvent
+
+__all__ = ["StatPoller"]
+
+
+# (mtime in ns, size, inode)
+Signature = Tuple[int, int, int]
+
+
+class StatPoller:
+    """
+    Polling replacement for inotify, for filesystems that don't deliver inotify events
+    (docker bind mounts on mac, NFS etc).
+
+    Keeps a stat index of watched files only and rescans their directories with os.scandir in batches,
+    spreading one full rescan over the polling interval.
+    In imported only mode only explicitly added files are tracked, otherwise all matching files under root are.
+    """
+
+    _index: Dict[str, Signature]
+    _tracked: Dict[str, Set[str]]
+    _not_matching: Set[str]
+
+    def __init__(self, root: Path, ignored_paths: List[str], matches: Callable[[str], bool],
+                 on_event: Callable[[FileSystemEvent], None], imported_only: bool = False,
+                 interval: float = 0.5, batch_size: int = 100):
+        self.root = root
+        self._ignored_paths = ignored_paths
+        self._matches = matches
+        self._on_event = on_event
+        self.imported_only = imported_only
+        self.interval = interval
+        self.batch_size = batch_size
+
+        # directory -> tracked files
+        self._tracked = {}
+        self._index = {}
+        # paths known not to match, so they are not matched again on every scan
+        self._not_matching = set()
+        self._lock = threading.Lock()
+        self._running = False
+
+        self.thread = threading.Thread(target=self.run)
+        self.thread.setDaemon(True)
+
+    @property
+    def files_count(self) -> int:
+        return len(self._index)
+
+    @property
+    def dirs_count(self) -> int:
+        return len(self._tracked)
+
+    def seed(self) -> None:
+        if self.imported_only:
+            return
+
+        # subdirectories are discovered while scanning
+        self.add_dir(str(self.root))
+
+    def add_dir(self, directory: str) -> None:
+        with self._lock:
+            if directory in self._tracked:
+                return
+            self._tracked[directory] = set()
+
+        self.scan_dir(directory, emit=False)
+
+    def add_file(self, path: str) -> None:
+        directory = os.path.dirname(path)
+
+        with self._lock:
+            self._tracked.setdefault(directory, set()).add(path)
+
+            try:
+                st = os.stat(path)
+            except OSError:
+                return
+
+            self._index[path] = (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _is_matching(self, path: str) -> bool:
+        if path in self._not_matching:
+            return False
+
+        if self._matches(path):
+            return True
+
+        self._not_matching.add(path)
+        return False
+
+    def _is_dir_ignored(self, path: str) -> bool:
+        ret = glob_match(os.path.relpath(path, str(self.root)), self._ignored_paths)
+        return ret
+
+    def scan_dir(self, directory: str, emit: bool = True) -> None:
+        with self._lock:
+            tracked = self._tracked.get(directory)
+            if tracked is None:
+                return
+            tracked = set(tracked)
+
+        current: Dict[str, Signature] = {}
+        new_dirs = []
+
+        try:
+            entries = os.scandir(directory)
+        except FileNotFoundError:
+            entries = None
+        except OSError:
+            return
+
+        if entries is not None:
+            with entries:
+                for e in entries:
+                    try:
+                        if not self.imported_only and e.is_dir(follow_symlinks=False):
+                            if e.path not in self._tracked and not self._is_dir_ignored(e.path):
+                                new_dirs.append(e.path)
+                            continue
+
+                        if e.path not in tracked and (self.imported_only or not self._is_matching(e.path)):
+                            continue
+
+                        st = e.stat()
+                    except OSError:
+                        continue
+
+                    current[e.path] = (st.st_mtime_ns, st.st_size, e.inode())
+
+        events = []
+
+        with self._lock:
+            for path, signature in current.items():
+                old_signature = self._index.get(path)
+                if old_signature is None:
+                    events.append(FileCreatedEvent(path))
+                elif old_signature != signature:
+                    events.append(FileModifiedEvent(path))
+                self._index[path] = signature
+
+            for path in tracked - current.keys():
+                if self._index.pop(path, None) is not None:
+                    events.append(FileDeletedEvent(path))
+
+            if entries is None and not self.imported_only:
+                self._tracked.pop(directory, None)
+            elif not self.imported_only:
+                self._tracked[directory] = set(current.keys())
+
+        for d in new_dirs:
+            self.add_dir(d)
+            if emit:
+                for p in self._tracked.get(d, ()):
+                    self._on_event(FileCreatedEvent(p))
+
+        if not emit:
+            return
+
+        for e in events:
+            self._on_event(e)
+
+    def scan(self) -> None:
+        """
+        One full rescan, in batches spread over the polling interval.
+        """
+        with self._lock:
+            dirs = list(self._tracked.keys())
+
+        batches = [dirs[i:i + self.batch_size] for i in range(0, len(dirs), self.batch_size)] or [[]]
+        batch_time = self.interval / len(batches)
+
+        for b in batches:
+            started = monotonic()
+
+            for d in b:
+                self.scan_dir(d)
+
+            if self._running:
+                sleep(max(batch_time - (monotonic() - started), 0.0))
+
+    def run(self) -> None:
+        while self._running:
+            self.scan()
+
+    def start(self) -> None:
+        self._running = True
+        self.thread.start()
+
+    def stop(self) -> None:
+        self._running = False
+
+    def is_alive(self) -> bool:
+        return self.thread.is_alive()
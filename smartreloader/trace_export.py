@@ -0,0 +1,106 @@
+"""
+Exports reloads of a session log to trace event files that chrome://tracing or Perfetto can open.
+
+Usage: python -m smartreloader.trace_export <session log directory> [--output <directory>]
+"""
+import argparse
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List
+
+from smartreloader import metrics
+from smartreloader.sr_logger import LOG_FILE_NAME, LEGACY_LOG_FILE_NAME, load_events
+
+__all__ = ["load_reloads", "reload_to_trace_events", "export"]
+
+
+TRACES_DIR_NAME = "traces"
+
+
+def load_reloads(session_dir: Path) -> List[Dict[str, Any]]:
+    log_file = session_dir / LOG_FILE_NAME
+    if not log_file.exists():
+        log_file = session_dir / LEGACY_LOG_FILE_NAME
+
+    ret = [e for e in load_events(log_file) if e["event_type"] == "ReloadMetricsEvent"]
+    return ret
+
+
+def _to_us(seconds: float) -> float:
+    return round(seconds * 1e6, 3)
+
+
+def reload_to_trace_events(reload: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Converts one ReloadMetricsEvent to complete ("X") trace events.
+    Nesting is recovered by the viewer from the timestamps.
+    """
+    module = Path(reload["module"]).name
+    origin = reload["started_at"]
+
+    ret = [{
+        "name": f"Reload {module}",
+        "cat": "reload",
+        "ph": "X",
+        "ts": _to_us(origin),
+        "dur": _to_us(reload["total"]),
+        "pid": 1,
+        "tid": 1,
+        "args": {"module": reload["module"], "outcome": reload["outcome"]},
+    }]
+
+    for s in reload["spans"]:
+        args = s.get("args", {})
+
+        if s["name"] == metrics.ACTION:
+            name = args["action"]
+            category = "action"
+        else:
+            name = f'{s["name"]} {args["module"]}' if "module" in args else s["name"]
+            category = "phase"
+
+        ret.append({
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": _to_us(origin + s["start"]),
+            "dur": _to_us(s["duration"]),
+            "pid": 1,
+            "tid": 1,
+            "args": args,
+        })
+
+    return ret
+
+
+def export(session_dir: Path, output_dir: Path) -> List[Path]:
+    """
+    Writes one trace file per reload. Returns written files.
+    """
+    os.makedirs(str(output_dir), exist_ok=True)
+
+    ret = []
+    for i, r in enumerate(load_reloads(session_dir)):
+        path = output_dir / f"{i}_{Path(r['module']).stem}.trace.json"
+        path.write_text(json.dumps({"traceEvents": reload_to_trace_events(r), "displayTimeUnit": "ms"}))
+        ret.append(path)
+
+    return ret
+
+
+def _main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("session_dir", type=Path)
+    parser.add_argument("--output", type=Path, default=None,
+                        help=f"Output directory, defaults to {TRACES_DIR_NAME} in the session directory")
+    args = parser.parse_args()
+
+    output_dir = args.output or args.session_dir / TRACES_DIR_NAME
+
+    for p in export(args.session_dir, output_dir):
+        print(p)
+
+
+if __name__ == "__main__":
+    _main()
@@ -1,4 +1,3 @@
-import json
 import os
 import shutil
 import signal
@@ -284,7 +283,7 @@ class TestClasses(utils.TestBase):
         sleep(1.0)
 
         log_file = log_dir / sr_logger.LOG_FILE_NAME
-        content = json.loads(log_file.read_text())
+        content = [e for e in sr_logger.load_events(log_file) if e["event_type"] != "ReloadMetricsEvent"]
 
         content[0]["msg"] = "Create msg"
 
@@ -296,6 +295,7 @@ class TestClasses(utils.TestBase):
             },
             {
                 'event_type': 'ModifiedEvent',
+                'file': 'cake.py',
                 'snapshot': '0_cake.py',
                 'time': '01/01/2025 12:00:00'
             },
@@ -313,6 +313,7 @@ class TestClasses(utils.TestBase):
                 'actions': ['Update Module: cake', 'Update Variable: cake.name'],
                 'event_type': 'HotReloadedEvent',
                 'objects': ['cake.name: Variable'],
+                'objects_count': 1,
                 'time': '01/01/2025 12:00:00'
             }
         ]
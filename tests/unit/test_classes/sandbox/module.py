@@ -0,0 +1,9 @@
+
+class Cupcake:
+
+    def eat(self):
+        return f"Eating 1 cupcake"
+
+    @classmethod
+    def name(self):
+        return "Cupcake"
@@ -316,6 +316,68 @@ class TestClasses(utils.TestBase):
 
         module.assert_not_changed()
 
+    def test_full_reload_precheck(self, sandbox, capsys):
+        reloader = MockedPartialReloader(sandbox)
+
+        module = Module(
+            "module.py",
+            """
+        import abc
+
+        print("executed")
+
+        class Options:
+            pass
+
+        # what django model classes look like
+        Options.__module__ = "django.db.models.options"
+
+        class Car:
+            _meta = Options()
+
+            class Meta:
+                ordering = ["name"]
+
+        class CarSerializer:
+            class Meta:
+                fields = ["name"]
+
+        class Carwash:
+            __slots__ = ("car_n",)
+        """,
+        )
+
+        module.load()
+        capsys.readouterr()
+
+        def assert_full_reload(cause: str) -> None:
+            with raises(FullReloadNeeded) as e:
+                reloader.reload(module)
+            assert e.value.cause == cause
+            # the module is not executed
+            assert "executed" not in capsys.readouterr().out
+            module.assert_not_changed()
+
+        module.replace("class Carwash:", "class Carwash(metaclass=abc.ABCMeta):")
+        assert_full_reload("class_metaclass_changed")
+
+        module.replace("class Carwash(metaclass=abc.ABCMeta):", "class Carwash(Car):")
+        assert_full_reload("class_mro_changed")
+
+        module.replace("class Carwash(Car):", "class Carwash:")
+        module.replace('__slots__ = ("car_n",)', '__slots__ = ("car_n", "name")')
+        assert_full_reload("class_slots_changed")
+
+        module.replace('__slots__ = ("car_n", "name")', '__slots__ = ("car_n",)')
+        module.replace('ordering = ["name"]', 'ordering = ["-name"]')
+        assert_full_reload("model_meta_changed")
+
+        # Meta of other classes is read when used
+        module.replace('ordering = ["-name"]', 'ordering = ["name"]')
+        module.replace('fields = ["name"]', 'fields = ["name", "colour"]')
+        reloader.reload(module)
+        assert module.device.CarSerializer.Meta.fields == ["name", "colour"]
+
     def test_type_as_attribute(self, sandbox):
         reloader = MockedPartialReloader(sandbox)
 
@@ -1663,7 +1725,7 @@ class TestClasses(utils.TestBase):
         assert module.device.Cupcake.name.__func__.__code__.co_firstlineno == 7
 
         reloader.rollback()
-        assert module.device.Cupcake.eat.__code__.co_firstlineno == 4
-        assert module.device.Cupcake.name.__func__.__code__.co_firstlineno == 7
+        assert module.device.Cupcake.eat.__code__.co_firstlineno == 3
+        assert module.device.Cupcake.name.__func__.__code__.co_firstlineno == 6
 
         assert_not_reloaded()
@@ -0,0 +1,92 @@
+import os
+import socket
+
+import pytest
+
+from smartreloader import control
+from smartreloader.control import ControlServer
+from tests import utils
+from tests.utils import Module, MockedPartialReloader
+
+
+class TestControl(utils.TestBase):
+    def test_reload_with_source(self, sandbox, tmp_path):
+        reloader = MockedPartialReloader(sandbox)
+
+        carwash = Module(
+            "carwash.py",
+            """
+        sprinkler_n = 3
+        """,
+        )
+        carwash.load()
+
+        def reload(message):
+            sources = {f["path"]: f["source"].encode("utf-8") for f in message["files"]}
+            return reloader.device.reload_files(list(sources.keys()), sources=sources).to_dict()
+
+        def fail(message):
+            raise RuntimeError("no status")
+
+        server = ControlServer(str(tmp_path / "control.sock"), commands={"reload": reload, "status": fail})
+        server.start()
+        try:
+            assert oct(os.stat(server.path).st_mode & 0o777) == oct(0o600)
+
+            response = control.request(server.path, {"command": "reload",
+                                                     "files": [{"path": str(carwash.path),
+                                                                "source": "sprinkler_n = 6\n"}]})
+            assert control.request(server.path, {"command": "status"}) == {"ok": False,
+                                                                           "error": "RuntimeError: no status"}
+            assert not control.request(server.path, {"command": "restart"})["ok"]
+        finally:
+            server.stop()
+
+        assert response["ok"]
+        assert response["outcome"] == "hot"
+        assert response["actions"] == ["Update Module: sandbox.carwash",
+                                       "Update Variable: sandbox.carwash.sprinkler_n"]
+        assert carwash.device.sprinkler_n == 6
+        # file on disk is not touched
+        assert "sprinkler_n = 3" in carwash.path.read_text()
+        assert reloader.device.modules.user_modules[str(carwash.path)][0].source.raw == b"sprinkler_n = 6\n"
+        assert not os.path.exists(server.path)
+
+    def test_socket_path_taken(self, sandbox, tmp_path):
+        path = tmp_path / "control.sock"
+        path.write_text("not a socket")
+
+        with pytest.raises(OSError):
+            ControlServer(str(path), commands={})
+        assert path.read_text() == "not a socket"
+
+        path.unlink()
+        server = ControlServer(str(path), commands={})
+        server.start()
+        # a running session keeps its socket
+        with pytest.raises(OSError):
+            ControlServer(str(path), commands={})
+        assert control.request(str(path), {"command": "status"})["ok"] is False
+
+        # replaced by another server
+        path.unlink()
+        other = ControlServer(str(path), commands={})
+        other.start()
+        server.stop()
+
+        assert path.exists()
+        other.stop()
+        assert not path.exists()
+
+    def test_stale_socket_replaced(self, sandbox, tmp_path):
+        path = tmp_path / "control.sock"
+        # left by a previous run that didn't clean up
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.bind(str(path))
+
+        server = ControlServer(str(path), commands={"status": lambda message: {"pid": 1}})
+        server.start()
+        try:
+            assert control.request(str(path), {"command": "status"}) == {"ok": True, "pid": 1}
+        finally:
+            server.stop()
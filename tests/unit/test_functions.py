@@ -548,7 +548,7 @@ class TestFunctions(utils.TestBase):
         assert module.device.fun.__code__.co_firstlineno == 5
         reloader.rollback()
         assert_not_reloaded()
-        assert module.device.fun.__code__.co_firstlineno == 5
+        assert module.device.fun.__code__.co_firstlineno == 2
 
     def test_add_decorator(self, sandbox):
         reloader = MockedPartialReloader(sandbox)
@@ -0,0 +1,426 @@
+import threading
+
+import pytest
+
+from smartreloader import BaseConfig
+from smartreloader.journal import Journal
+from smartreloader.metrics import PUBLISH
+from tests import utils
+from tests.utils import Module, MockedPartialReloader
+
+
+class TestJournal(utils.TestBase):
+    def test_restore(self, sandbox):
+        class Car:
+            colour = "red"
+
+        def drive():
+            return 1
+
+        def park():
+            return 2
+
+        car = Car()
+        garage = {"car": car}
+        cars = [car]
+        drive_code = drive.__code__
+
+        journal = Journal()
+        journal.set_attr(car, "colour", "blue")
+        journal.set_attr(car, "colour", "green")
+        journal.set_attr(Car, "wheels", 4)
+        journal.del_attr(Car, "colour")
+        journal.set_attr(drive, "__code__", park.__code__)
+        journal.set_item(garage, "boat", None)
+        journal.del_item(garage, "car")
+        journal.set_content(cars, [])
+        journal.set_dict(garage, {})
+
+        assert len(journal) == 9
+        journal.restore()
+
+        assert "colour" not in car.__dict__
+        assert car.colour == "red"
+        assert not hasattr(Car, "wheels")
+        assert drive.__code__ is drive_code
+        assert garage == {"car": car}
+        assert cars == [car]
+        assert len(journal) == 0
+
+    def test_failed_reload_restores_module(self, sandbox):
+        reloader = MockedPartialReloader(sandbox)
+
+        init = Module(
+            "__init__.py",
+            """
+        from . import carwash
+        from . import car
+        """,
+        )
+
+        carwash = Module(
+            "carwash.py",
+            """
+        sprinkler_n = 3
+        sizes = ["small", "big"]
+        prices = {"small": 10}
+
+        def wash():
+            return "washed"
+
+        def dry():
+            return "dried"
+
+        class Carwash:
+            def open(self):
+                return "open"
+        """,
+        )
+
+        car = Module(
+            "car.py",
+            """
+        from . import carwash
+
+        car_sprinklers = carwash.sprinkler_n / 3
+        """,
+        )
+
+        init.load()
+        carwash.load_from(init)
+        car.load_from(init)
+
+        def get_state():
+            module_dict = dict(vars(carwash.device))
+            ret = {
+                "module": module_dict,
+                "class": dict(vars(carwash.device.Carwash)),
+                "codes": {k: v.__code__ for k, v in module_dict.items() if hasattr(v, "__code__")},
+                "method": carwash.device.Carwash.open.__code__,
+                "sizes": list(carwash.device.sizes),
+                "prices": dict(carwash.device.prices),
+            }
+            return ret
+
+        state = get_state()
+
+        carwash.rewrite(
+            """
+        sprinkler_n = 6
+        sizes = ["big"]
+        prices = {"small": 20, "big": 30}
+
+        def wash():
+            return "washed well"
+
+        def polish():
+            return "polished"
+
+        class Carwash:
+            def open(self):
+                return "closed"
+
+        class Garage:
+            pass
+        """
+        )
+        car.append("raise Exception()")
+
+        with pytest.raises(Exception):
+            reloader.reload(carwash)
+
+        assert carwash.device.wash() == "washed well"
+        reloader.rollback()
+
+        assert get_state() == state
+        assert carwash.device.wash() == "washed"
+        assert carwash.device.Carwash().open() == "open"
+        assert len(reloader.device.journal) == 0
+
+    def get_staged_reloader(self, sandbox) -> MockedPartialReloader:
+        class Config(BaseConfig):
+            @property
+            def staged_reloads(self) -> bool:
+                return True
+
+        reloader = MockedPartialReloader(sandbox)
+        reloader.device.config = Config()
+        return reloader
+
+    def test_staged_reload(self, sandbox):
+        reloader = self.get_staged_reloader(sandbox)
+
+        init = Module(
+            "__init__.py",
+            """
+        from . import carwash
+        from . import car
+        """,
+        )
+
+        carwash = Module(
+            "carwash.py",
+            """
+        sprinkler_n = 3
+        """,
+        )
+
+        car = Module(
+            "car.py",
+            """
+        import time
+        from . import carwash
+
+        car_sprinklers = carwash.sprinkler_n / 3
+        # other threads run while the dependent module is executed
+        time.sleep(0.05)
+        """,
+        )
+
+        init.load()
+        carwash.load_from(init)
+        car.load_from(init)
+
+        seen = set()
+        stop = threading.Event()
+
+        def read():
+            while not stop.is_set():
+                seen.add((carwash.device.sprinkler_n, car.device.car_sprinklers))
+
+        reader = threading.Thread(target=read)
+        reader.start()
+
+        carwash.rewrite("sprinkler_n = 6")
+        try:
+            result = reloader.device.reload_files([carwash.path])
+        finally:
+            stop.set()
+            reader.join()
+
+        assert result.outcome == "hot"
+        assert carwash.device.sprinkler_n == 6
+        assert car.device.car_sprinklers == 2
+        assert car.device.carwash is carwash.device
+        # module level changes are seen by the dependent module through shadow imports, published at once
+        assert len(result.publish_pauses) == 1
+        assert [s.args["writes"] for s in result.metrics.spans if s.name == PUBLISH] == [2]
+        # the updated module next to a not yet updated dependent
+        assert (6, 1) not in seen
+
+    def test_staged_reload_publishes_classes_before_dependents(self, sandbox, caplog):
+        reloader = self.get_staged_reloader(sandbox)
+
+        init = Module(
+            "__init__.py",
+            """
+        from . import carwash
+        from . import car
+        """,
+        )
+
+        carwash = Module(
+            "carwash.py",
+            """
+        class Carwash:
+            sprinkler_n = 3
+        """,
+        )
+
+        car = Module(
+            "car.py",
+            """
+        from .carwash import Carwash
+
+        car_sprinklers = Carwash.sprinkler_n / 3
+        """,
+        )
+
+        init.load()
+        carwash.load_from(init)
+        car.load_from(init)
+
+        carwash.replace("sprinkler_n = 3", "sprinkler_n = 6")
+        result = reloader.device.reload_files([carwash.path])
+
+        assert result.outcome == "hot"
+        assert car.device.car_sprinklers == 2
+        assert len(result.publish_pauses) == 2
+        assert "other threads can see a partial update" in caplog.text
+
+    def test_staged_reload_shadows_functions(self, sandbox, caplog):
+        reloader = self.get_staged_reloader(sandbox)
+
+        init = Module(
+            "__init__.py",
+            """
+        from . import carwash
+        from . import car
+        """,
+        )
+
+        carwash = Module(
+            "carwash.py",
+            """
+        sprinkler_n = 3
+
+        def get_sprinklers():
+            return 3
+        """,
+        )
+
+        car = Module(
+            "car.py",
+            """
+        from . import carwash
+        from .carwash import get_sprinklers
+
+        car_sprinklers = carwash.sprinkler_n / 3
+        car_sprinklers_from_function = get_sprinklers() / 3
+        getters = [get_sprinklers]
+
+        def count(getter=carwash.get_sprinklers):
+            return getter()
+        """,
+        )
+
+        init.load()
+        carwash.load_from(init)
+        car.load_from(init)
+
+        carwash.rewrite(
+            """
+        sprinkler_n = 6
+
+        def get_sprinklers():
+            return 6
+        """
+        )
+        result = reloader.device.reload_files([carwash.path])
+
+        assert result.outcome == "hot"
+        # the new code is seen by the dependent module without publishing first
+        assert len(result.publish_pauses) == 1
+        assert "partial update" not in caplog.text
+        assert car.device.car_sprinklers == 2
+        assert car.device.car_sprinklers_from_function == 2
+        # copies of the function are not left in the dependent module
+        assert car.device.get_sprinklers is carwash.device.get_sprinklers
+        assert car.device.getters[0] is carwash.device.get_sprinklers
+        assert car.device.count.__defaults__[0] is carwash.device.get_sprinklers
+        assert car.device.count() == 6
+
+    def test_staged_reload_lazy_imports(self, sandbox):
+        reloader = self.get_staged_reloader(sandbox)
+
+        init = Module(
+            "__init__.py",
+            """
+        from . import carwash
+        from . import car
+        """,
+        )
+
+        carwash = Module(
+            "carwash.py",
+            """
+        sprinkler_n = 3
+        """,
+        )
+
+        car = Module(
+            "car.py",
+            """
+        from . import carwash
+
+        car_sprinklers = carwash.sprinkler_n / 3
+        """,
+        )
+
+        init.load()
+        carwash.load_from(init)
+        car.load_from(init)
+
+        # created while the dependent module is executed against the staged state
+        car.append(
+            """
+        def get_carwash():
+            from . import carwash
+            return carwash
+
+        def get_carwash_getter():
+            wash = carwash
+
+            def get():
+                return wash
+            return get
+
+        get_carwash_from_closure = get_carwash_getter()
+
+        class Car:
+            wash = carwash
+            washes = (carwash,)
+        """
+        )
+        carwash.rewrite("sprinkler_n = 6")
+        result = reloader.device.reload_files([carwash.path])
+
+        assert result.outcome == "hot"
+        assert car.device.car_sprinklers == 2
+        # lazy imports of functions created meanwhile get live modules after publishing
+        assert car.device.get_carwash() is carwash.device
+        assert car.device.get_carwash_from_closure() is carwash.device
+        assert car.device.Car.wash is carwash.device
+        assert car.device.Car.washes[0] is carwash.device
+
+        carwash.rewrite("sprinkler_n = 9")
+        result = reloader.device.reload_files([carwash.path])
+
+        assert result.outcome == "hot"
+        assert car.device.car_sprinklers == 3
+        assert car.device.get_carwash().sprinkler_n == 9
+
+    def test_staged_failed_reload(self, sandbox):
+        reloader = self.get_staged_reloader(sandbox)
+
+        init = Module(
+            "__init__.py",
+            """
+        from . import carwash
+        from . import car
+        """,
+        )
+
+        carwash = Module(
+            "carwash.py",
+            """
+        sprinkler_n = 3
+        """,
+        )
+
+        car = Module(
+            "car.py",
+            """
+        from . import carwash
+
+        car_sprinklers = carwash.sprinkler_n / 3
+        """,
+        )
+
+        init.load()
+        carwash.load_from(init)
+        car.load_from(init)
+
+        carwash.rewrite("sprinkler_n = 6")
+        car.append("raise Exception()")
+
+        with pytest.raises(Exception):
+            reloader.reload(carwash)
+
+        # nothing is published
+        assert carwash.device.sprinkler_n == 3
+        reloader.rollback()
+
+        assert carwash.device.sprinkler_n == 3
+        assert car.device.car_sprinklers == 1
+        assert not reloader.device.journal.staging
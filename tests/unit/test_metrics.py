@@ -0,0 +1,124 @@
+import json
+
+from smartreloader import metrics, trace_export
+from smartreloader.metrics import ReloadMetrics
+from smartreloader.sr_logger import SRLogger
+from tests import utils
+from tests.utils import Module, MockedPartialReloader
+
+
+class TestMetrics(utils.TestBase):
+    def test_reload_spans(self, sandbox):
+        reloader = MockedPartialReloader(sandbox)
+
+        init = Module(
+            "__init__.py",
+            """
+        from . import carwash
+        from . import car
+        """,
+        )
+
+        carwash = Module(
+            "carwash.py",
+            """
+        sprinkler_n = 3
+        """,
+        )
+
+        car = Module(
+            "car.py",
+            """
+        from . import carwash
+
+        car_sprinklers = carwash.sprinkler_n / 3
+        """,
+        )
+
+        init.load()
+        carwash.load_from(init)
+        car.load_from(init)
+
+        carwash.replace("sprinkler_n = 3", "sprinkler_n = 6")
+
+        reload_metrics = ReloadMetrics(carwash.path)
+        reloader.device.reload(carwash.path, metrics=reload_metrics)
+        reload_metrics.finish("hot")
+
+        assert reloader.device.metrics is reload_metrics
+        assert set(reload_metrics.phases.keys()) == {metrics.DEPENDENCY_COLLECTION, metrics.MODULE_REEXEC,
+                                                     metrics.PRECHECK, metrics.TREE_BUILD, metrics.DIFF,
+                                                     metrics.ACTION_APPLY, metrics.DEPENDENT_CASCADE}
+
+        reexecuted = [s.args["module"] for s in reload_metrics.spans if s.name == metrics.MODULE_REEXEC]
+        assert reexecuted == ["sandbox.carwash", "sandbox.car"]
+
+        # dependent module is reloaded while applying actions of carwash
+        apply = next(s for s in reload_metrics.spans if s.name == metrics.ACTION_APPLY
+                     and s.args["module"] == "sandbox.carwash")
+        car_reexec = next(s for s in reload_metrics.spans if s.name == metrics.MODULE_REEXEC
+                          and s.args["module"] == "sandbox.car")
+        assert apply.start <= car_reexec.start <= car_reexec.end <= apply.end
+
+        content = reload_metrics.to_dict()
+        assert content["outcome"] == "hot"
+        assert content["total"] >= apply.duration
+        assert [s["name"] for s in content["spans"]][0] == metrics.DEPENDENCY_COLLECTION
+
+    def test_trace_export(self, sandbox, tmp_path):
+        reloader = MockedPartialReloader(sandbox)
+
+        carwash = Module(
+            "carwash.py",
+            """
+        sprinkler_n = 3
+        """,
+        )
+        carwash.load()
+        carwash.replace("sprinkler_n = 3", "sprinkler_n = 6")
+
+        reload_metrics = ReloadMetrics(carwash.path)
+        reloader.device.reload(carwash.path, metrics=reload_metrics)
+        reload_metrics.finish("hot")
+
+        logger = SRLogger(source_root=sandbox, logs_directory=tmp_path)
+        logger.log_reload_metrics(reload_metrics)
+        logger.close()
+
+        files = trace_export.export(logger.log_directory, tmp_path / "traces")
+        assert [f.name for f in files] == ["0_carwash.trace.json"]
+
+        trace_events = json.loads(files[0].read_text())["traceEvents"]
+        names = [e["name"] for e in trace_events]
+
+        assert names[0] == "Reload carwash.py"
+        assert "Update Module: sandbox.carwash" in names
+        assert "Update Variable: sandbox.carwash.sprinkler_n" in names
+        assert "module_reexec sandbox.carwash" in names
+
+        reload_event = trace_events[0]
+        for e in trace_events[1:]:
+            assert reload_event["ts"] <= e["ts"]
+            assert e["ts"] + e["dur"] <= reload_event["ts"] + reload_event["dur"] + 1
+
+    def test_actions_outside_of_reload(self, sandbox):
+        from smartreloader.objects.modules import UpdateModule
+
+        reloader = MockedPartialReloader(sandbox)
+
+        module = Module(
+            "module.py",
+            """
+        sprinkler_n = 3
+        """,
+        )
+
+        module.load()
+        module.replace("sprinkler_n = 3", "sprinkler_n = 6")
+
+        # nothing is recorded without a reload
+        for a in UpdateModule.factory(reloader=reloader.device, module_file=module.path):
+            a.execute()
+
+        assert module.device.sprinkler_n == 6
+        assert not reloader.device.metrics.spans
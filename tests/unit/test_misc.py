@@ -168,3 +168,330 @@ class TestMisc(utils.TestBase):
         assert sys.modules["sandbox.cupcake"].cupcakes_n == 150
         assert sys.modules["cupcake"].cupcakes_n == 150
         assert sys.modules["sandbox.cupcake"] is not sys.modules["cupcake"]
+
+    def test_commit_releases_old_trees(self, sandbox):
+        import gc
+        import weakref
+
+        reloader = MockedPartialReloader(sandbox)
+
+        cupcake = Module(
+            "cupcake.py",
+            """
+        cupcakes_n = 100
+
+        def bake():
+            return cupcakes_n
+        """,
+        )
+
+        cupcake.load()
+
+        old_module_obj = weakref.ref(reloader.device.modules.user_modules[str(cupcake.path)][0].module_obj)
+
+        cupcake.replace("cupcakes_n = 100", "cupcakes_n = 150")
+        reloader.reload(cupcake)
+
+        gc.collect()
+        assert old_module_obj() is not None
+
+        reloader.device.commit()
+        reloader.assert_actions('Update Module: sandbox.cupcake',
+                                'Update Variable: sandbox.cupcake.cupcakes_n')
+
+        gc.collect()
+        assert old_module_obj() is None
+        assert cupcake.device.bake() == 150
+
+    def test_reload_files(self, sandbox):
+        from threading import Thread
+
+        reloader = MockedPartialReloader(sandbox)
+
+        init = Module(
+            "__init__.py",
+            """
+        from . import carwash
+        from . import car
+        """,
+        )
+
+        carwash = Module(
+            "carwash.py",
+            """
+        sprinkler_n = 3
+        """,
+        )
+
+        car = Module(
+            "car.py",
+            """
+        from . import carwash
+
+        car_sprinklers = carwash.sprinkler_n / 3
+        colour = "red"
+        """,
+        )
+
+        not_imported = Module("boat.py", "boat_n = 1")
+
+        init.load()
+        carwash.load_from(init)
+        car.load_from(init)
+
+        carwash.replace("sprinkler_n = 3", "sprinkler_n = 6")
+        car.replace('colour = "red"', 'colour = "blue"')
+
+        result = reloader.device.reload_files([carwash.path, car.path], dry_run=True)
+        assert result.outcome == "hot"
+        assert "Update Variable: sandbox.carwash.sprinkler_n" in result.actions
+        assert carwash.device.sprinkler_n == 3
+
+        results = []
+        thread = Thread(target=lambda: results.append(reloader.device.reload_files([carwash.path, car.path,
+                                                                                    not_imported.path])))
+        thread.start()
+        thread.join()
+        result = results[0]
+
+        assert result.outcome == "hot"
+        assert result.not_imported == [not_imported.path]
+        # car is reloaded once, as a dependent of carwash
+        assert result.actions.count("Update Module: sandbox.car") == 1
+        assert result.metrics.total > 0
+        assert carwash.device.sprinkler_n == 6
+        assert car.device.car_sprinklers == 2
+        assert car.device.colour == "blue"
+
+        car.replace('colour = "blue"', 'colour = "green"\nraise Exception()')
+        carwash.replace("sprinkler_n = 6", "sprinkler_n = 9")
+        result = reloader.device.reload_files([carwash.path])
+
+        assert result.outcome == "rollback"
+        assert "Exception" in result.error
+        assert carwash.device.sprinkler_n == 6
+        assert car.device.colour == "blue"
+
+    def test_dry_run_then_reload(self, sandbox):
+        reloader = MockedPartialReloader(sandbox)
+
+        carwash = Module(
+            "carwash.py",
+            """
+        def wash():
+            return "washed"
+        """,
+        )
+
+        carwash.load()
+
+        carwash.replace('return "washed"', 'return "polished"')
+        result = reloader.device.reload_files([carwash.path], dry_run=True)
+        assert result.outcome == "hot"
+        assert result.actions == ["Update Module: sandbox.carwash", "Update Function: sandbox.carwash.wash"]
+        assert carwash.device.wash() == "washed"
+        assert b"washed" in reloader.device.modules.user_modules[str(carwash.path)][0].source.raw
+        assert not reloader.device.modules_out_of_sync
+
+        result = reloader.device.reload_files([carwash.path])
+        assert result.outcome == "hot"
+        assert result.actions == ["Update Module: sandbox.carwash", "Update Function: sandbox.carwash.wash"]
+        assert carwash.device.wash() == "polished"
+
+    def test_file_read_once(self, sandbox, monkeypatch):
+        import shutil
+        from pathlib import Path
+
+        reloader = MockedPartialReloader(sandbox)
+
+        carwash = Module(
+            "carwash.py",
+            """
+        sprinkler_n = 3
+        """,
+        )
+        carwash.load()
+        shutil.rmtree(str(sandbox / "__pycache__"), ignore_errors=True)
+
+        reads = []
+        read_bytes = Path.read_bytes
+
+        def counting_read_bytes(self):
+            reads.append(self)
+            return read_bytes(self)
+
+        monkeypatch.setattr(Path, "read_bytes", counting_read_bytes)
+
+        carwash.replace("sprinkler_n = 3", "sprinkler_n = 6")
+        reloader.reload(carwash)
+
+        assert carwash.device.sprinkler_n == 6
+        assert reads == [carwash.path]
+        assert not (sandbox / "__pycache__").exists()
+        assert reloader.device.modules.user_modules[str(carwash.path)][0].source.raw == carwash.path.read_bytes()
+
+    def test_tree_built_once(self, sandbox, monkeypatch):
+        from smartreloader.objects.modules import ModuleDescriptor
+
+        reloader = MockedPartialReloader(sandbox)
+
+        carwash = Module(
+            "carwash.py",
+            """
+        sprinkler_n = 3
+
+        def print_sprinklers():
+            return f"There are {sprinkler_n} sprinklers"
+
+        class Car:
+            colour = "red"
+
+            def wash(self):
+                return "washed"
+        """,
+        )
+        carwash.load()
+        print_sprinklers = carwash.device.print_sprinklers
+        wash = carwash.device.Car.wash
+
+        trees = []
+        post_execute = ModuleDescriptor.post_execute
+
+        def counting_post_execute(self):
+            trees.append(self)
+            post_execute(self)
+
+        monkeypatch.setattr(ModuleDescriptor, "post_execute", counting_post_execute)
+
+        carwash.replace("sprinkler_n = 3", "sprinkler_n = 6")
+        carwash.replace('"washed"', '"washed well"')
+        reloader.reload(carwash)
+
+        assert carwash.device.print_sprinklers() == "There are 6 sprinklers"
+        assert carwash.device.Car().wash() == "washed well"
+
+        # the tree of the executed module is reused, objects point to the updated original module
+        assert len(trees) == 1
+        module_obj = reloader.device.modules.user_modules[str(carwash.path)][0].module_obj
+        assert module_obj.python_obj is carwash.device
+        assert module_obj.flat["sandbox.carwash.print_sprinklers"].python_obj is print_sprinklers
+        assert module_obj.flat["sandbox.carwash.Car.wash"].python_obj is wash
+        assert module_obj.python_obj_to_objs[id(wash)] == [module_obj.flat["sandbox.carwash.Car.wash"]]
+        assert module_obj.module_descriptor.module_obj is module_obj
+
+        # deleted import stays in the module, the tree is rebuilt
+        carwash.prepend("import os\n")
+        reloader.reload(carwash)
+        carwash.replace("import os\n", "")
+        trees.clear()
+        reloader.reload(carwash)
+        assert len(trees) == 2
+        assert "sandbox.carwash.os" in reloader.device.modules.user_modules[str(carwash.path)][0].module_obj.flat
+
+    def test_failed_rebase_keeps_tree(self, sandbox):
+        from types import ModuleType
+
+        from smartreloader.objects.modules import ModuleDescriptor
+
+        reloader = MockedPartialReloader(sandbox)
+
+        carwash = Module(
+            "carwash.py",
+            """
+        class Car:
+            def wash(self):
+                return "washed"
+
+        sprinkler_n = 3
+        """,
+        )
+        carwash.load()
+        module_descriptor = reloader.device.modules.user_modules[str(carwash.path)][0]
+        module_obj = module_descriptor.module_obj
+        flat = dict(module_obj.flat)
+
+        class Car:
+            def wash(self):
+                return "washed"
+
+        body = ModuleType(carwash.device.__name__)
+        body.Car = Car
+        # doesn't match, found after Car has been checked
+        body.sprinkler_n = "3"
+        other = ModuleDescriptor(reloader.device, name=module_descriptor.name, path=module_descriptor.path,
+                                 body=body, source=module_descriptor.source)
+
+        assert not module_obj.rebase(other)
+        assert module_obj.python_obj is carwash.device
+        assert module_obj.module_descriptor is module_descriptor
+        assert module_obj.flat == flat
+        assert module_obj.flat["sandbox.carwash.Car"].python_obj is carwash.device.Car
+        assert module_obj.flat["sandbox.carwash.Car.wash"].python_obj is carwash.device.Car.wash
+        assert module_obj.python_obj_to_objs[id(carwash.device.Car)] == [module_obj.flat["sandbox.carwash.Car"]]
+
+    def test_reload_policies(self, sandbox):
+        from smartreloader import FullReloadNeeded
+        from smartreloader.config import PolicyMatcher
+
+        reloader = MockedPartialReloader(sandbox)
+
+        init = Module(
+            "__init__.py",
+            """
+        from . import settings
+        from . import carwash
+        from . import car
+        """,
+        )
+
+        settings = Module("settings.py", "DEBUG = True")
+
+        carwash = Module(
+            "carwash.py",
+            """
+        sprinkler_n = 3
+        """,
+        )
+
+        car = Module(
+            "car.py",
+            """
+        from . import carwash
+
+        car_sprinklers = carwash.sprinkler_n / 3
+        """,
+        )
+
+        init.load()
+        settings.load_from(init)
+        carwash.load_from(init)
+        car.load_from(init)
+
+        policies = {"settings.py": "full", "car.py": lambda path: "ignore"}
+        reloader.device.policies = PolicyMatcher(reloader.device.root, policies)
+
+        # the module is not executed
+        settings.replace("DEBUG = True", "DEBUG = False")
+        with pytest.raises(FullReloadNeeded) as e:
+            reloader.reload(settings)
+        assert e.value.cause == "policy"
+        assert settings.device.DEBUG is True
+        reloader.assert_actions()
+
+        # ignored also as a dependent module
+        carwash.replace("sprinkler_n = 3", "sprinkler_n = 6")
+        reloader.reload(carwash)
+        assert carwash.device.sprinkler_n == 6
+        assert car.device.car_sprinklers == 1
+        reloader.assert_actions("Update Module: sandbox.carwash", "Update Variable: sandbox.carwash.sprinkler_n")
+
+        result = reloader.device.reload_files([car.path])
+        assert result.outcome == "hot"
+        assert result.ignored == [car.path]
+
+        result = reloader.device.reload_files([carwash.path, settings.path])
+        assert result.outcome == "full"
+        assert result.full_reload_cause == "policy"
+
+        with pytest.raises(ValueError):
+            PolicyMatcher(reloader.device.root, {"settings.py": "restart"})
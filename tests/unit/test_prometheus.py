@@ -0,0 +1,57 @@
+from pathlib import Path
+from urllib.request import urlopen
+
+from smartreloader import metrics
+from smartreloader.metrics import ReloadMetrics
+from smartreloader.prometheus import MetricsServer, ReloaderExporter
+from tests import utils
+
+
+class TestPrometheus(utils.TestBase):
+    def test_exporter(self, sandbox):
+        exporter = ReloaderExporter(watched_dirs=lambda: 3, watched_files=lambda: None, objects=lambda: 42)
+
+        reload_metrics = ReloadMetrics(Path("cake.py"))
+        reload_metrics.add_span(metrics.MODULE_REEXEC, 0.0, 0.02, module="cake")
+        reload_metrics.add_span(metrics.HEAP_SCAN, 0.01, 0.015)
+        reload_metrics.finish("hot")
+        exporter.observe(reload_metrics)
+        exporter.full_reload("class_mro_changed")
+
+        server = MetricsServer(exporter.registry, port=0)
+        server.start()
+        try:
+            content = urlopen(f"http://127.0.0.1:{server.port}/metrics").read().decode("utf-8")
+        finally:
+            server.stop()
+
+        lines = content.splitlines()
+        assert 'smartreloader_reloads_total{outcome="hot"} 1.0' in lines
+        assert 'smartreloader_full_reloads_total{cause="class_mro_changed"} 1.0' in lines
+        assert 'smartreloader_reload_phase_duration_seconds_bucket{phase="module_reexec",le="0.025"} 1' in lines
+        assert 'smartreloader_reload_phase_duration_seconds_bucket{phase="module_reexec",le="0.01"} 0' in lines
+        assert 'smartreloader_heap_scan_duration_seconds_count 1' in lines
+        assert 'smartreloader_reload_duration_seconds_count{outcome="hot"} 1' in lines
+        assert "smartreloader_watched_directories 3.0" in lines
+        assert "smartreloader_objects 42.0" in lines
+        assert not any(l.startswith("smartreloader_watched_files ") for l in lines)
+
+    def test_full_reload_counts_survive_restart(self, sandbox, tmp_path):
+        state_file = tmp_path / "metrics.json"
+
+        exporter = ReloaderExporter(watched_dirs=lambda: 3, watched_files=lambda: None, objects=lambda: 42,
+                                    state_file=state_file)
+        reload_metrics = ReloadMetrics(Path("cake.py"))
+        reload_metrics.finish("full")
+        exporter.observe(reload_metrics)
+        exporter.full_reload("class_mro_changed")
+
+        # the restarted process
+        exporter = ReloaderExporter(watched_dirs=lambda: 3, watched_files=lambda: None, objects=lambda: 42,
+                                    state_file=state_file)
+        exporter.full_reload("file_deleted")
+
+        lines = exporter.registry.render().splitlines()
+        assert 'smartreloader_reloads_total{outcome="full"} 1.0' in lines
+        assert 'smartreloader_full_reloads_total{cause="class_mro_changed"} 1.0' in lines
+        assert 'smartreloader_full_reloads_total{cause="file_deleted"} 1.0' in lines
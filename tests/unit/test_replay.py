@@ -0,0 +1,43 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+from smartreloader import replay
+from smartreloader.sr_logger import SRLogger
+from tests import utils
+
+
+class TestReplay(utils.TestBase):
+    def test_replay(self, sandbox, tmp_path):
+        cake = sandbox / "cake.py"
+        cake.write_text("class Cake:\n    pass\n\nname = 'cheesecake'\n")
+
+        logger = SRLogger(source_root=sandbox, logs_directory=tmp_path / "logs")
+        logger.initial_source_thread.join()
+
+        def edit(content: str) -> None:
+            cake.write_text(content)
+            logger.snapshot_source(logger.log_modified(cake), content.encode())
+
+        edit("class Cake:\n    pass\n\nname = 'birthday cake'\n")
+        edit("class Cake:\n    pass\n\nname = 1 / 0\n")
+        edit("class Cake(Exception):\n    pass\n\nname = 'birthday cake'\n")
+        edit("class Cake(Exception):\n    pass\n\nname = 'carrot cake'\n")
+        logger.close()
+
+        edits = replay.load_edits(logger.log_directory)
+        assert [e.file for e in edits] == ["cake.py"] * 4
+
+        # sys.modules is swapped by other tests, so replay runs from the command line
+        output = tmp_path / "results.json"
+        subprocess.check_call([sys.executable, "-m", "smartreloader.replay", str(logger.log_directory),
+                               "--import", "sandbox.cake", "--output", str(output)],
+                              cwd=str(Path(replay.__file__).parent.parent), stdout=subprocess.DEVNULL)
+        results = json.loads(output.read_text())
+
+        assert [r["outcome"] for r in results["results"]] == ["partial", "rollback", "full", "partial"]
+        assert results["outcomes"] == {"partial": 2, "rollback": 1, "full": 1}
+        assert results["results"][0]["actions"] == 2
+        assert results["results"][2]["error"] == "class_mro_changed"
+        assert results["latency_p95_s"] >= results["latency_p50_s"] > 0
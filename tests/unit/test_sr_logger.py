@@ -0,0 +1,228 @@
+import json
+
+import pytest
+
+from smartreloader import sr_logger
+from smartreloader.sr_logger import SRLogger
+from tests import utils
+from tests.utils import Module, MockedPartialReloader
+
+
+class TestSRLogger(utils.TestBase):
+    def test_writes_jsonl(self, sandbox, tmp_path):
+        logger = SRLogger(source_root=sandbox, logs_directory=tmp_path)
+
+        logger.info("First")
+        logger.info("Second")
+        logger.flush()
+
+        lines = logger.log_file.read_text().splitlines()
+        assert [json.loads(l)["msg"] for l in lines] == ["First", "Second"]
+
+        logger.info("Third")
+        logger.close()
+
+        assert [e["msg"] for e in sr_logger.load_events(logger.log_file)] == ["First", "Second", "Third"]
+
+    def test_convert_to_json_array(self, sandbox, tmp_path):
+        logger = SRLogger(source_root=sandbox, logs_directory=tmp_path)
+        logger.info("First")
+        logger.close()
+
+        legacy_file = logger.log_directory / sr_logger.LEGACY_LOG_FILE_NAME
+        sr_logger.convert_to_json_array(logger.log_file, legacy_file)
+
+        content = json.loads(legacy_file.read_text())
+        assert [e["msg"] for e in content] == ["First"]
+        assert sr_logger.load_events(legacy_file) == content
+
+    def test_hot_reloaded_event(self, sandbox, tmp_path):
+        reloader = MockedPartialReloader(sandbox)
+
+        carwash = Module(
+            "carwash.py",
+            """
+        sprinkler_n = 3
+        money = 1e3
+        """,
+        )
+        carwash.load()
+
+        carwash.replace("sprinkler_n = 3", "sprinkler_n = 6")
+        reloader.reload(carwash)
+
+        logger = SRLogger(source_root=sandbox, logs_directory=tmp_path, inventory_every=2, max_events=2)
+        module_obj = reloader.device.modules.user_modules[str(carwash.path)][0].module_obj
+
+        logger.log_hot_reloaded_event(reloader.device.applied_actions, module_obj.flat)
+        logger.log_hot_reloaded_event(reloader.device.applied_actions, module_obj.flat)
+        logger.close()
+
+        # only recent events are kept in memory
+        assert [type(e).__name__ for e in logger.events] == ["HotReloadedEvent", "InventoryEvent"]
+
+        events = sr_logger.load_events(logger.log_file)
+        for e in events:
+            e.pop("time")
+
+        hot_reloaded = {
+            'event_type': 'HotReloadedEvent',
+            'actions': ['Update Module: sandbox.carwash', 'Update Variable: sandbox.carwash.sprinkler_n'],
+            'objects': ['sandbox.carwash.sprinkler_n: Variable'],
+            'objects_count': 2,
+        }
+        assert events == [
+            hot_reloaded,
+            hot_reloaded,
+            {
+                'event_type': 'InventoryEvent',
+                'objects': ['sandbox.carwash.sprinkler_n: Variable', 'sandbox.carwash.money: Variable'],
+            },
+        ]
+
+    def test_snapshot_store(self, sandbox, tmp_path):
+        (sandbox / "cake.py").write_text('name = "cheesecake"')
+        (sandbox / "cakeshop.py").write_text('name = "cheesecake"')
+        (sandbox / "menu.pdf").write_text("binary")
+
+        logger = SRLogger(source_root=sandbox, logs_directory=tmp_path)
+        logger.initial_source_thread.join()
+
+        initial_source = logger.manifest.initial_source
+        assert sorted(initial_source.keys()) == ["__init__.py", "cake.py", "cakeshop.py"]
+        # same content is stored once
+        assert initial_source["cake.py"] == initial_source["cakeshop.py"]
+        assert len(list(logger.store.iter_digests())) == 2
+
+        (sandbox / "cake.py").write_text('name = "birthday cake"')
+        event = logger.log_modified(sandbox / "cake.py")
+        logger.snapshot_source(event)
+
+        # content already read by the reload is reused
+        reused_event = logger.log_modified(sandbox / "cake.py")
+        logger.snapshot_source(reused_event, b'name = "cheesecake"')
+        logger.close()
+
+        manifest = sr_logger.Manifest.load(logger.log_directory / sr_logger.MANIFEST_FILE_NAME)
+        assert logger.store.get(manifest.source_changes[event.snapshot_filename]) == b'name = "birthday cake"'
+        assert manifest.source_changes[reused_event.snapshot_filename] == initial_source["cake.py"]
+
+    def test_retention(self, sandbox, tmp_path, monkeypatch):
+        monkeypatch.setattr(sr_logger.SnapshotStore, "gc_grace_time", 0.0)
+        (sandbox / "cake.py").write_text('name = "cheesecake"')
+
+        project_logs = tmp_path / sandbox.name
+        old_session = project_logs / "01_01_2020_12:00:00"
+        old_session.mkdir(parents=True)
+
+        store = sr_logger.SnapshotStore(project_logs / sr_logger.STORE_DIR_NAME)
+        orphan = store.put(b"old content")
+
+        logger = SRLogger(source_root=sandbox, logs_directory=tmp_path, max_sessions=1)
+        logger.initial_source_thread.join()
+        logger.close()
+
+        assert not old_session.exists()
+        assert logger.log_directory.exists()
+        assert orphan not in logger.store
+        assert set(logger.store.iter_digests()) == set(logger.manifest.initial_source.values())
+
+    def test_retention_keeps_current_session(self, sandbox, tmp_path):
+        with pytest.raises(ValueError):
+            SRLogger(source_root=sandbox, logs_directory=tmp_path, max_sessions=0)
+
+        project_logs = tmp_path / sandbox.name
+        sessions = [project_logs / f"01_0{i}_2020_12:00:00" for i in range(1, 4)]
+        for d in sessions:
+            d.mkdir(parents=True)
+
+        logger = SRLogger(source_root=sandbox, logs_directory=tmp_path, max_sessions=2)
+        logger.initial_source_thread.join()
+        logger.close()
+
+        # the most recent previous session is kept next to the current one
+        assert [d.exists() for d in sessions] == [False, False, True]
+        assert logger.log_directory.exists()
+
+    def test_source_changes_not_logged(self, sandbox, tmp_path):
+        (sandbox / "cake.py").write_text('name = "cheesecake"')
+
+        logger = SRLogger(source_root=sandbox, logs_directory=tmp_path, log_source_changes=False)
+        logger.initial_source_thread.join()
+
+        event = logger.log_modified(sandbox / "cake.py")
+        logger.snapshot_source(event, b'name = "birthday cake"')
+        logger.close()
+
+        assert not logger.manifest.initial_source
+        assert not logger.manifest.source_changes
+        assert not list(logger.store.iter_digests())
+
+    def test_policy_suggestions(self, sandbox, tmp_path):
+        from smartreloader.metrics import ReloadMetrics
+
+        settings = sandbox / "settings.py"
+        views = sandbox / "views.py"
+
+        def log_reload(logger: SRLogger, file, outcome: str) -> None:
+            metrics = ReloadMetrics(file)
+            metrics.finish(outcome)
+            logger.log_reload_metrics(metrics)
+            logger.suggest_policy(file, outcome)
+
+        # every full reload starts a new session
+        for i, outcome in enumerate(["hot", "full", "full"]):
+            logger = SRLogger(source_root=sandbox, logs_directory=tmp_path)
+            log_reload(logger, settings, outcome)
+            log_reload(logger, views, "hot" if i < 2 else "rollback")
+            logger.close()
+            assert logger.policy_suggestions == {}
+            # sessions are named by time in seconds
+            logger.log_directory.rename(logger.log_directory.with_name(f"01_01_2020_12:00:0{i}"))
+
+        logger = SRLogger(source_root=sandbox, logs_directory=tmp_path)
+        log_reload(logger, settings, "full")
+        log_reload(logger, views, "hot")
+        log_reload(logger, views, "rollback")
+        logger.flush()
+        assert logger.policy_suggestions == {"settings.py": "full"}
+
+        # the streak of views.py was broken by the hot reload
+        log_reload(logger, views, "rollback")
+        assert logger.policy_suggestions == {"settings.py": "full"}
+        log_reload(logger, views, "full")
+        assert logger.policy_suggestions == {"settings.py": "full", "views.py": "full"}
+        logger.close()
+
+        assert [e["msg"] for e in sr_logger.load_events(logger.log_file) if "msg" in e] == [
+            'settings.py couldn\'t be reloaded partially 3 times in a row, '
+            'consider adding reload policy {"settings.py": "full"} to the config',
+            'views.py couldn\'t be reloaded partially 3 times in a row, '
+            'consider adding reload policy {"views.py": "full"} to the config',
+        ]
+
+    def test_profile(self, sandbox, tmp_path):
+        import cProfile
+        import pstats
+
+        (sandbox / "cake.py").write_text('name = "cheesecake"')
+
+        logger = SRLogger(source_root=sandbox, logs_directory=tmp_path, profile_top_n=3)
+        event = logger.log_modified(sandbox / "cake.py")
+
+        profile = cProfile.Profile()
+        profile.enable()
+        sorted(range(1000), key=lambda x: -x)
+        profile.disable()
+
+        profile_filename = logger.save_profile(profile, event)
+        logger.log_hot_reloaded_event([], {}, profile=profile, profile_filename=profile_filename)
+        logger.close()
+
+        assert profile_filename == f"profiles/{event.snapshot_filename[:-3]}.pstats"
+        assert pstats.Stats(str(logger.log_directory / profile_filename)).total_calls > 0
+
+        hot_reloaded = sr_logger.load_events(logger.log_file)[-1]
+        assert hot_reloaded["profile"] == profile_filename
+        assert len(hot_reloaded["hot_functions"]) == 3
+        assert any("<lambda>" in f["function"] for f in hot_reloaded["hot_functions"])
@@ -0,0 +1,58 @@
+from pathlib import Path
+
+from smartreloader.config import BaseConfig
+from smartreloader.stat_poller import StatPoller
+from tests import utils
+
+
+class TestStatPoller(utils.TestBase):
+    def create_poller(self, root: Path, imported_only: bool = False) -> StatPoller:
+        self.events = []
+
+        poller = StatPoller(root, ignored_paths=BaseConfig().ignored_paths,
+                            matches=lambda p: p.endswith(".py"),
+                            on_event=self.events.append,
+                            imported_only=imported_only)
+        return poller
+
+    def get_events(self, root: Path):
+        ret = sorted((e.event_type, str(Path(e.src_path).relative_to(root))) for e in self.events)
+        return ret
+
+    def test_detects_changes(self, sandbox):
+        (sandbox / "app").mkdir()
+        (sandbox / "app" / "models.py").write_text("a = 1")
+        (sandbox / "app" / "views.py").write_text("a = 1")
+        (sandbox / "__pycache__").mkdir()
+        (sandbox / "__pycache__" / "cached.py").write_text("a = 1")
+
+        poller = self.create_poller(sandbox)
+        poller.seed()
+
+        assert poller.files_count == 3
+        assert self.events == []
+
+        (sandbox / "app" / "models.py").write_text("a = 12")
+        (sandbox / "app" / "views.py").unlink()
+        (sandbox / "app" / "urls.py").write_text("a = 1")
+        (sandbox / "app" / "data.json").write_text("{}")
+        (sandbox / "__pycache__" / "cached.py").write_text("a = 12")
+        poller.scan()
+
+        assert self.get_events(sandbox) == [("created", "app/urls.py"),
+                                            ("deleted", "app/views.py"),
+                                            ("modified", "app/models.py")]
+
+    def test_imported_only(self, sandbox):
+        (sandbox / "models.py").write_text("a = 1")
+        (sandbox / "scratch.py").write_text("a = 1")
+
+        poller = self.create_poller(sandbox, imported_only=True)
+        poller.seed()
+        poller.add_file(str(sandbox / "models.py"))
+
+        (sandbox / "models.py").write_text("a = 12")
+        (sandbox / "scratch.py").write_text("a = 12")
+        poller.scan()
+
+        assert self.get_events(sandbox) == [("modified", "models.py")]
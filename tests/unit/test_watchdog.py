@@ -0,0 +1,220 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from smartreloader import dependency_watcher
+from smartreloader.config import BaseConfig
+from smartreloader.reloader import Watchdog
+from tests import utils
+
+
+def create_watchdog(root: Path, imported_only: bool = False, polling: bool = False) -> Watchdog:
+    def noop(*args, **kwargs):
+        pass
+
+    config = BaseConfig()
+    callbacks = Watchdog.Callbacks(on_modify=noop, on_new_file=noop, on_delete_file=noop,
+                                   on_multiple_files_at_once=noop, on_moved_file=noop)
+    ret = Watchdog(root, watched_paths=config.watched_paths, ignored_paths=config.ignored_paths,
+                   callbacks=callbacks, logger=utils.logger, imported_only=imported_only, polling=polling)
+    return ret
+
+
+class TestWatchdog(utils.TestBase):
+    @pytest.fixture(autouse=True)
+    def reset_hooks(self):
+        yield
+        dependency_watcher.new_module_hook = None
+
+    def test_walk_dirs_prunes_ignored(self, sandbox):
+        for d in ["app/views", "app/__pycache__", ".git/objects/ab", "node_modules/lib/deep", "venv/lib"]:
+            (sandbox / d).mkdir(parents=True)
+        (sandbox / "app" / "models.py").touch()
+
+        watchdog = create_watchdog(sandbox)
+
+        dirs = sorted(str(Path(d).relative_to(sandbox)) for d in watchdog.walk_dirs())
+        assert dirs == ["app", "app/views"]
+
+    def test_new_dirs_prune_ignored(self, sandbox):
+        class Inotify:
+            _event_mask = 0
+
+            def __init__(self):
+                self._wd_for_path = {}
+
+            def _add_watch(self, path, mask):
+                self._wd_for_path[path] = len(self._wd_for_path) + 1
+                return self._wd_for_path[path]
+
+        for d in ["app/views", "app/__pycache__", "app/node_modules/lib", "venv/lib"]:
+            (sandbox / d).mkdir(parents=True)
+        (sandbox / "app" / "models.py").touch()
+        (sandbox / "app" / "views" / "index.py").touch()
+        (sandbox / "app" / "__pycache__" / "models.pyc").touch()
+
+        watchdog = create_watchdog(sandbox)
+        inotify = Inotify()
+
+        assert watchdog.watch_new_dir(inotify, os.fsencode(sandbox / "venv")) == []
+
+        events = watchdog.watch_new_dir(inotify, os.fsencode(sandbox / "app"))
+
+        watched = sorted(str(Path(os.fsdecode(p)).relative_to(sandbox)) for p in inotify._wd_for_path)
+        assert watched == ["app", "app/views"]
+        assert sorted((str(Path(os.fsdecode(e.src_path)).relative_to(sandbox)), e.is_directory)
+                      for e in events) == [("app/models.py", False),
+                                           ("app/views", True),
+                                           ("app/views/index.py", False)]
+
+    def test_imported_only_drops_not_imported(self, sandbox):
+        from watchdog.events import FileModifiedEvent
+
+        (sandbox / "app").mkdir()
+        imported = sandbox / "app" / "models.py"
+        not_imported = sandbox / "app" / "scratch.py"
+
+        watchdog = create_watchdog(sandbox, imported_only=True)
+        watchdog.add_module(str(imported))
+
+        watchdog.dispatch(FileModifiedEvent(str(not_imported)))
+        watchdog.dispatch(FileModifiedEvent(str(imported)))
+
+        assert [e.src_path for e in watchdog._unprocessed_events] == [str(imported)]
+
+    def test_imported_only_polling_tracks_all_files(self, sandbox):
+        (sandbox / "app").mkdir()
+        a = sandbox / "app" / "a.py"
+        b = sandbox / "app" / "b.py"
+        a.write_text("a = 1")
+        b.write_text("b = 1")
+
+        watchdog = create_watchdog(sandbox, imported_only=True, polling=True)
+        watchdog.add_module(str(a))
+        watchdog.add_module(str(b))
+        watchdog.poller.seed()
+
+        assert watchdog.poller.files_count == 2
+
+        b.write_text("b = 12")
+        watchdog.poller.scan()
+
+        assert [e.src_path for e in watchdog._unprocessed_events] == [str(b)]
+
+    def test_batch_drained_at_once(self, sandbox):
+        from watchdog.events import FileModifiedEvent
+
+        watchdog = create_watchdog(sandbox)
+        batches = []
+        watchdog._callbacks.on_multiple_files_at_once = batches.append
+
+        for name in ["a.py", "b.py", "a.py"]:
+            watchdog.dispatch(FileModifiedEvent(str(sandbox / name)))
+
+        watchdog.debounce()
+        watchdog.process_events(watchdog.drain_events())
+
+        assert len(batches) == 1
+        assert sorted(e.src_path for e in batches[0]) == [str(sandbox / "a.py"), str(sandbox / "b.py")]
+        assert not watchdog._unprocessed_events
+
+    def test_event_after_empty_drain_not_lost(self, sandbox):
+        from watchdog.events import FileModifiedEvent
+
+        watchdog = create_watchdog(sandbox)
+        drain_events = watchdog.drain_events
+
+        def drain_and_receive():
+            ret = drain_events()
+            watchdog.dispatch(FileModifiedEvent(str(sandbox / "a.py")))
+            return ret
+
+        watchdog.drain_events = drain_and_receive
+        # woken up by a closed file, with no pending events
+        watchdog.new_event.set()
+        # the observer is not running, returns after one iteration
+        watchdog.events_producer()
+
+        assert watchdog.new_event.is_set()
+        assert [e.src_path for e in watchdog._unprocessed_events] == [str(sandbox / "a.py")]
+
+    def test_closed_file_completes_batch(self, sandbox):
+        from watchdog.events import FileModifiedEvent
+
+        watchdog = create_watchdog(sandbox)
+        path = str(sandbox / "a.py")
+
+        watchdog.dispatch(FileModifiedEvent(path))
+        assert not watchdog.is_batch_complete()
+
+        watchdog._closed_files.add(path)
+        assert watchdog.is_batch_complete()
+
+    def test_repeated_saves_complete_on_close_write(self, sandbox):
+        from watchdog.events import FileModifiedEvent
+        from watchdog.observers.inotify_c import InotifyConstants, InotifyEvent
+
+        watchdog = create_watchdog(sandbox)
+        path = str(sandbox / "a.py")
+
+        def inotify_event(mask: int) -> InotifyEvent:
+            return InotifyEvent(1, mask, 0, b"a.py", os.fsencode(path))
+
+        for _ in range(20):
+            # several raw modifications, watchdog skips repeated modified events so only one is dispatched
+            watchdog.on_inotify_events([inotify_event(InotifyConstants.IN_MODIFY)] * 3)
+            watchdog.dispatch(FileModifiedEvent(path))
+            assert not watchdog.is_batch_complete()
+
+            watchdog.on_inotify_events([inotify_event(InotifyConstants.IN_CLOSE_WRITE)])
+            assert watchdog.is_batch_complete()
+            watchdog.drain_events()
+
+    def test_inotify_events_match_relative_paths(self, sandbox):
+        from watchdog.observers.inotify_c import InotifyConstants, InotifyEvent
+
+        watchdog = create_watchdog(sandbox)
+        watchdog._watched_paths = ["app/*.py"]
+        path = str(sandbox / "app" / "a.py")
+
+        watchdog.on_inotify_events([InotifyEvent(1, InotifyConstants.IN_CLOSE_WRITE, 0, b"a.py", os.fsencode(path))])
+
+        assert watchdog._closed_files == {path}
+
+    @pytest.mark.parametrize(
+        "events, expected",
+        [
+            # vim
+            ([("moved", "a.py", "a.py~"), ("created", "a.py"), ("modified", "a.py"), ("deleted", "a.py~")],
+             [("modified", "a.py")]),
+            # jetbrains
+            ([("created", "a.py___jb_tmp___"), ("moved", "a.py", "a.py___jb_old___"),
+              ("moved", "a.py___jb_tmp___", "a.py"), ("deleted", "a.py___jb_old___")],
+             [("modified", "a.py")]),
+            # formatters
+            ([("moved", ".a.py.tmp", "a.py")], [("modified", "a.py")]),
+            ([("deleted", "a.py"), ("created", "a.py")], [("modified", "a.py")]),
+            ([("created", "a.py"), ("modified", "a.py")], [("created", "a.py")]),
+            ([("created", "a.py"), ("deleted", "a.py")], []),
+            ([("moved", "a.py", "b.py")], [("moved", "a.py", "b.py")]),
+            ([("moved", "a.py", "a.py.bak")], [("deleted", "a.py")]),
+        ],
+    )
+    def test_atomic_saves(self, sandbox, events, expected):
+        from watchdog.events import FileCreatedEvent, FileDeletedEvent, FileModifiedEvent, FileMovedEvent
+
+        event_classes = {"created": FileCreatedEvent, "deleted": FileDeletedEvent,
+                         "modified": FileModifiedEvent, "moved": FileMovedEvent}
+
+        watchdog = create_watchdog(sandbox)
+        for event_type, *paths in events:
+            watchdog.dispatch(event_classes[event_type](*[str(sandbox / p) for p in paths]))
+
+        coalesced = watchdog.drain_events()
+
+        def event_to_tuple(e):
+            paths = [e.src_path, e.dest_path] if e.event_type == "moved" else [e.src_path]
+            return (e.event_type, *[str(Path(p).relative_to(sandbox)) for p in paths])
+
+        assert [event_to_tuple(e) for e in coalesced] == expected